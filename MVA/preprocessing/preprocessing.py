@@ -9,10 +9,14 @@ Available sample signals are specified in samples.py
 selection and mode in default_classifier.py
 
 eg. python preprocessing.py --signal SMS_T2tt_mStop_400to1200 --background TTLep_pow --version v1_lep_pt --small
+
+With --vectorized, chunks of --chunksize events are read as arrays, the variables are evaluated on whole chunks
+and the chunks of signal and background are processed by --nWorkers processes. The output is written as .npy
+files (see MVA/python/ColumnarStore.py) which KerasTrainer memory-maps.
 '''
 
 # Standard imports and batch mode
-import ROOT, os
+import ROOT, os, sys
 ROOT.gROOT.SetBatch(True)
 import pandas as pd
 import numpy as np
@@ -37,6 +41,8 @@ argParser.add_argument('--background',         action='store',      default="TTL
 argParser.add_argument('--small',              action='store_true',     help='Run only on a small subset of the data?', )
 argParser.add_argument('--version',            action='store',      default='v1')
 argParser.add_argument('--chunksize',          action='store',      default='100000',       type=int)
+argParser.add_argument('--vectorized',         action='store_true',     help='Evaluate the variables on chunks of events and write .npy files instead of .h5')
+argParser.add_argument('--nWorkers',           action='store',      default=2,               type=int, help='Number of processes for --vectorized')
 args = argParser.parse_args()
 
 #
@@ -73,6 +79,86 @@ for sample in [signal, background]:
   if args.small:
         sample.reduceFiles( to = 1 )
 
+if args.vectorized:
+    import uuid
+    from multiprocessing import Pool
+    from StopsDilepton.tools.columnarSelection import drawArray, readJagged
+    from StopsDilepton.MVA.ColumnarStore import ColumnarStore
+
+    # vector variables, e.g. JetGood[pt/F,eta/F,phi/F] -> counter nJetGood
+    vectors = { v.split('[')[0]:'n'+v.split('[')[0] for v in read_variables if '[' in v }
+
+    class Positions:
+        ''' event.JetGood_pt[i] for a whole chunk: i-th element of every event, NaN if there is none '''
+        def __init__( self, jagged ):
+            self.jagged = jagged
+        def __getitem__( self, i ):
+            return self.jagged.position( i )
+
+    class ColumnarEvent:
+        ''' Stand-in for r.event whose attributes are arrays over the events of a chunk, read on first access '''
+        def __init__( self, chain, first, nEvents ):
+            self.chain, self.first, self.nEvents = chain, first, nEvents
+        def __getattr__( self, name ):
+            collection = name.split('_')[0]
+            if collection in vectors:
+                value = Positions( readJagged( self.chain, vectors[collection], [name], self.first, self.nEvents )[name] )
+            else:
+                value = drawArray( self.chain, name, self.first, self.nEvents )
+            setattr( self, name, value )
+            return value
+
+    columns  = sorted( training_variables.keys() + spectator_variables.keys() )
+    features = dict( training_variables, **spectator_variables )
+    samples_ = [ signal, background ]
+    reopened = []
+
+    def process_chunk( job ):
+        i_sample, label, first, nEvents = job
+        sample = samples_[i_sample]
+        # every process opens its own files
+        if sample.name not in reopened:
+            sample.clear()
+            reopened.append( sample.name )
+        chain = sample.chain
+
+        # selected entries of the chunk
+        chain.Draw( ">>eListMVA", sample.selectionString if sample.selectionString else "(1)", "goff", nEvents, first )
+        eList = ROOT.gDirectory.Get( "eListMVA" )
+        mask  = np.zeros( nEvents, dtype = bool )
+        mask[ np.array( [ eList.GetEntry(i) for i in xrange( eList.GetN() ) ], dtype = 'int64' ) - first ] = True
+
+        event = ColumnarEvent( chain, first, nEvents )
+        X = np.empty( ( mask.sum(), len(columns) ), dtype = np.float64 )
+        for i_column, column in enumerate( columns ):
+            X[:, i_column] = np.broadcast_to( features[column]( event ), ( nEvents, ) )[mask]
+        y = np.full( len(X), label, dtype = np.int8 )
+
+        chunk_file = os.path.join( output_dir, 'tmp_%s' % uuid.uuid4().hex )
+        np.save( chunk_file + '_X.npy', X )
+        np.save( chunk_file + '_y.npy', y )
+        logger.debug( "Processed %i events (%i selected) of %s starting at %i", nEvents, len(X), sample.name, first )
+        return chunk_file + '_X.npy', chunk_file + '_y.npy'
+
+    # first signal then background, chunks in the order of the chains
+    jobs = []
+    for i_sample, sample in enumerate( samples_ ):
+        nEntries = sample.chain.GetEntries()
+        jobs += [ ( i_sample, 1 if sample == signal else 0, first, min( args.chunksize, nEntries - first ) ) for first in range( 0, nEntries, args.chunksize ) ]
+        sample.clear()
+
+    if args.nWorkers > 1:
+        pool   = Pool( processes = args.nWorkers )
+        chunks = pool.map( process_chunk, jobs, chunksize = 1 )
+        pool.close()
+        pool.join()
+    else:
+        chunks = map( process_chunk, jobs )
+
+    ColumnarStore( output_dir ).write( columns, chunks )
+    logger.info( "Written directory %s", output_dir )
+    sys.exit(0)
+
 # initialize dictionary 
 datadict = {key : [] for key in ['label'] + training_variables.keys() + spectator_variables.keys() }
 # create .h5 file
@@ -10,8 +10,9 @@ class Callback_ROC(keras.callbacks.Callback):
     """
     Custom callback class for Keras which calculates and plots ROC aucs after training epochs. Intervall is adjustable.
     Also offers possibility to use earlystopping if auc value does not improve.
+    For training with fit_generator, the aucs are calculated from train_sequence and validation_sequence (TrainingSequence with shuffle = False).
     """
-    def __init__(self, X_train, y_train, plot_directory, keras_directory, interval_evaluate_auc = 5,  patience_earlystopping_auc = False ):
+    def __init__(self, X_train, y_train, plot_directory, keras_directory, interval_evaluate_auc = 5,  patience_earlystopping_auc = False, train_sequence = None, validation_sequence = None ):
         # best auc value
         self.best = 0
         self.best_filename = ''
@@ -26,6 +27,8 @@ class Callback_ROC(keras.callbacks.Callback):
         self.y_train = y_train
         self.plot_directory = plot_directory 
         self.keras_directory = keras_directory 
+        self.train_sequence = train_sequence
+        self.validation_sequence = validation_sequence
 
     def on_train_begin(self, logs={}):
         self.epochs = []
@@ -52,13 +55,21 @@ class Callback_ROC(keras.callbacks.Callback):
             self.epochs.append(epoch+1)
             
              # validation sample
-            y_pred_val = self.model.predict(self.validation_data[0])
-            roc_auc_val = roc_auc_score(self.validation_data[1], y_pred_val)
+            if self.validation_sequence is not None:
+                y_pred_val = self.model.predict_generator(self.validation_sequence)
+                roc_auc_val = roc_auc_score(self.validation_sequence.labels(), y_pred_val)
+            else:
+                y_pred_val = self.model.predict(self.validation_data[0])
+                roc_auc_val = roc_auc_score(self.validation_data[1], y_pred_val)
             self.aucs_val.append(roc_auc_val)
             
             # training sample
-            y_pred_train = self.model.predict(self.X_train.values)
-            roc_auc_train = roc_auc_score(self.y_train.values, y_pred_train)
+            if self.train_sequence is not None:
+                y_pred_train = self.model.predict_generator(self.train_sequence)
+                roc_auc_train = roc_auc_score(self.train_sequence.labels(), y_pred_train)
+            else:
+                y_pred_train = self.model.predict(self.X_train.values)
+                roc_auc_train = roc_auc_score(self.y_train.values, y_pred_train)
             self.aucs_train.append(roc_auc_train)
 
             # Save model with best roc auc
@@ -0,0 +1,68 @@
+''' Training data as .npy files that can be memory-mapped
+'''
+
+#Standard imports
+import os
+import json
+
+# numpy
+import numpy as np
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class ColumnarStore:
+    ''' data_X.npy:          float64 feature matrix (events x columns)
+        data_y.npy:          int8 labels (1 for signal, 0 for background)
+        data_columns.json:   names of the columns of data_X.npy
+        The arrays are stored uncompressed so they can be memory-mapped with np.load( ..., mmap_mode = 'r' ).
+    '''
+    X_file       = 'data_X.npy'
+    y_file       = 'data_y.npy'
+    columns_file = 'data_columns.json'
+
+    def __init__( self, directory ):
+        self.directory = directory
+
+    def path( self, filename ):
+        return os.path.join( self.directory, filename )
+
+    def exists( self ):
+        return all( os.path.exists( self.path( f ) ) for f in [ self.X_file, self.y_file, self.columns_file ] )
+
+    def columns( self ):
+        with open( self.path( self.columns_file ) ) as f:
+            return map( str, json.load( f )['columns'] )
+
+    def load( self, mmap_mode = 'r' ):
+        ''' X, y and the column names. mmap_mode 'c' (copy on write) allows in-place operations without touching the files.
+        '''
+        X = np.load( self.path( self.X_file ), mmap_mode = mmap_mode )
+        y = np.load( self.path( self.y_file ), mmap_mode = mmap_mode )
+        return X, y, self.columns()
+
+    def write( self, columns, chunks ):
+        ''' Merge chunks [(X_chunk_file, y_chunk_file), ...] (.npy files, removed afterwards) in the given order.
+        '''
+        nEvents = 0
+        for X_chunk_file, y_chunk_file in chunks:
+            nEvents += np.load( y_chunk_file, mmap_mode = 'r' ).shape[0]
+
+        X = np.lib.format.open_memmap( self.path( self.X_file ), mode = 'w+', dtype = np.float64, shape = ( nEvents, len(columns) ) )
+        y = np.lib.format.open_memmap( self.path( self.y_file ), mode = 'w+', dtype = np.int8,    shape = ( nEvents, ) )
+        position = 0
+        for X_chunk_file, y_chunk_file in chunks:
+            y_chunk = np.load( y_chunk_file )
+            X[position:position+len(y_chunk)] = np.load( X_chunk_file )
+            y[position:position+len(y_chunk)] = y_chunk
+            position += len(y_chunk)
+            os.remove( X_chunk_file )
+            os.remove( y_chunk_file )
+        X.flush()
+        y.flush()
+        del X, y
+
+        with open( self.path( self.columns_file ), 'w' ) as f:
+            json.dump( {'columns':columns}, f )
+        logger.info( "Written %i events with %i columns to %s", nEvents, len(columns), self.directory )
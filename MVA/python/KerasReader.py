@@ -51,6 +51,9 @@ class KerasReader:
         self.X_mean =  pd.read_hdf( os.path.join( MVA_model_directory, self.keras_model_directory, 'X_mean.h5'), 'df')
         self.X_std =  pd.read_hdf( os.path.join( MVA_model_directory, self.keras_model_directory, 'X_std.h5'), 'df')
 
+        # transformation as arrays in the order of the training variables
+        self.mean = np.array( [ getattr( self.X_mean, variable ) for variable in self.training_variables ], dtype = 'float64' )
+        self.std  = np.array( [ getattr( self.X_std,  variable ) for variable in self.training_variables ], dtype = 'float64' )
 
     def eval( self, dict ):
         ''' Transforms Dataset for Keras use and lets model predict outcome 
@@ -63,6 +66,73 @@ class KerasReader:
         
         # Predict
         return self.model.predict( np.array( [ [dict_cp[k] for k in self.training_variables] ] ) )[0][0]
+
+    def to_array( self, events ):
+        ''' 2D array (events x training variables) from a list of event dicts, a DataFrame or an array with the columns in the order of training_variables
+        '''
+        if isinstance( events, pd.DataFrame ):
+            return events[ self.training_variables ].values.astype( 'float64' )
+        if len(events) > 0 and isinstance( events[0], dict ):
+            return np.array( [ [ event[k] for k in self.training_variables ] for event in events ], dtype = 'float64' )
+        return np.asarray( events, dtype = 'float64' ).reshape( -1, len(self.training_variables) )
+
+    def eval_batch( self, events, batch_size = 1024 ):
+        ''' Same as eval for many events at once (see to_array), predicting batch_size events per call of the model.
+        '''
+        X = self.to_array( events )
+        if len(X) == 0: return np.zeros( 0 )
+        return self.model.predict( ( X - self.mean )/self.std, batch_size = batch_size )[:,0]
+
+class KerasSequence:
+    ''' Sequence element (event, sample) that sets event.<attribute> to the output of the classifier.
+        Before the first event of a sample, the inputs of the sample are read once, buffered and evaluated with eval_batch,
+        and the scores are back-filled into a map from the event identity (key_variables) to the score.
+        The scores are stored per sample and selection string, because the selection of a sample may change between event loops.
+        selectionString should be the selection of the event loop (e.g. the one of the plots), so only the events that are filled are evaluated.
+        The key variables have to be in the read variables of the event loop.
+    '''
+    def __init__( self, kerasReader, read_variables, get_dict, attribute = 'MVA', key_variables = [ "run/I", "luminosityBlock/I", "event/l" ], buffer_size = 100000, batch_size = 1024, selectionString = None ):
+        self.kerasReader    = kerasReader
+        self.read_variables = read_variables
+        self.get_dict       = get_dict
+        self.attribute      = attribute
+        self.key_variables  = key_variables
+        self.key_names      = [ v.split('/')[0] for v in key_variables ]
+        self.buffer_size    = buffer_size
+        self.batch_size     = batch_size
+        self.selectionString = selectionString
+        self.scores         = {}
+
+    def key( self, event ):
+        return tuple( getattr( event, name ) for name in self.key_names )
+
+    def sample_key( self, sample ):
+        return ( sample.name, getattr( sample, 'selectionString', None ), self.selectionString )
+
+    def fill_scores( self, sample ):
+        from RootTools.core.standard import TreeVariable
+        variables = map( lambda v: TreeVariable.fromString(v) if type(v)==type("") else v, self.read_variables + [ v for v in self.key_variables if v not in self.read_variables ] )
+        # the selection of the sample is applied by the reader as well
+        reader    = sample.treeReader( variables = variables, selectionString = self.selectionString )
+        scores    = {}
+        keys, buffer = [], []
+        def flush():
+            scores.update( zip( keys, self.kerasReader.eval_batch( buffer, batch_size = self.batch_size ) ) )
+            del keys[:], buffer[:]
+        reader.start()
+        while reader.run():
+            keys.append( self.key( reader.event ) )
+            buffer.append( self.get_dict( reader.event ) )
+            if len(buffer) >= self.buffer_size: flush()
+        flush()
+        logger.info( "Evaluated %s for %i events of sample %s", self.attribute, len(scores), sample.name )
+        self.scores[self.sample_key( sample )] = scores
+
+    def __call__( self, event, sample ):
+        sample_key = self.sample_key( sample )
+        if sample_key not in self.scores:
+            self.fill_scores( sample )
+        setattr( event, self.attribute, self.scores[sample_key][ self.key( event ) ] )
        
 if __name__ == '__main__':
     import StopsDilepton.tools.logger as logger
@@ -24,6 +24,7 @@ from keras.layers import Dropout
 #from keras.regularizers import l1_l2
 #from keras.callbacks import *
 from Callback_ROC import Callback_ROC
+from ColumnarStore import ColumnarStore
 
 ## Root stuff 
 #def makeTGraph( x, y ):
@@ -61,13 +62,24 @@ class KerasTrainer:
         self.spectator_variables  = spectator_variables
         # fraction of events used for training
         self.train_fraction = 0.90
+        # read the training data in chunks from disk (see init_streaming_data)
+        self.streaming = False
 
-    def init_training_data( self, balanced=False ):
+    def init_training_data( self, balanced=False, streaming=False, chunk_size=100000 ):
         ''' Initialize training data, optional balance dataset - reduce backround event number to signal event number
         '''
-        # read .h5 files to create feature Matrix X and target vector y
-        X_tmp = pd.read_hdf( os.path.join( MVA_preprocessing_directory, self.input_data_directory,  'data_X.h5'), 'df')
-        y_tmp = pd.read_hdf( os.path.join( MVA_preprocessing_directory, self.input_data_directory,  'data_y.h5'), 'df')
+        if streaming:
+            return self.init_streaming_data( balanced = balanced, chunk_size = chunk_size )
+
+        # read .npy files (preprocessing.py --vectorized, memory-mapped) or .h5 files to create feature Matrix X and target vector y
+        store = ColumnarStore( os.path.join( MVA_preprocessing_directory, self.input_data_directory ) )
+        if store.exists():
+            X_data, y_data, columns = store.load( mmap_mode = 'c' )
+            X_tmp = pd.DataFrame( X_data, columns = columns, copy = False )
+            y_tmp = pd.Series( y_data, name = 'label', copy = False )
+        else:
+            X_tmp = pd.read_hdf( os.path.join( MVA_preprocessing_directory, self.input_data_directory,  'data_X.h5'), 'df')
+            y_tmp = pd.read_hdf( os.path.join( MVA_preprocessing_directory, self.input_data_directory,  'data_y.h5'), 'df')
 
         # balance dataset, reduce backround event number to signal event number
         if balanced:
@@ -101,6 +113,59 @@ class KerasTrainer:
         self.X_spect += self.X_mean
         self.X_mean   = self.X_mean.drop( self.spectator_variables )
         self.X_std    = self.X_std.drop( self.spectator_variables )
+
+    def init_streaming_data( self, balanced=False, chunk_size=100000 ):
+        ''' Training data that is read in chunks from the memory-mapped .npy files of preprocessing.py --vectorized.
+            Mean and std are computed in one pass over the files, balancing is done with sample weights of the background events
+            (n_signal/n_background) instead of dropping events. Only the labels and the spectators of the test sample are kept in memory.
+        '''
+        from TrainingSequence import streaming_mean_std
+
+        store = ColumnarStore( os.path.join( MVA_preprocessing_directory, self.input_data_directory ) )
+        if not store.exists():
+            raise RuntimeError( "Streaming needs the .npy files of preprocessing.py --vectorized in %s" % store.directory )
+        self.X_data, self.y_data, self.columns = store.load( mmap_mode = 'r' )
+        self.chunk_size = chunk_size
+        self.streaming  = True
+
+        n_signal     = int( sum( ( self.y_data[i:i+chunk_size]==1 ).sum() for i in range( 0, len(self.y_data), chunk_size ) ) )
+        n_background = len(self.y_data) - n_signal
+        self.class_weights = np.array( [ float(n_signal)/n_background, 1. ] ) if balanced else None
+
+        logger.info( 'Number of training variables: %i, spectator variables: %i', len(self.training_variables), len(self.spectator_variables) )
+        logger.info( 'Number of signal / backround events: %i / %i', n_signal, n_background )
+        logger.info( 'Number of events and percentage of signal events in sample: %s // %5.2f',  len(self.y_data), round( 100.* n_signal / len(self.y_data) ,2 ))
+
+        # Normalize Data - mean to 0, and std to 1
+        mean, std   = streaming_mean_std( self.X_data, self.y_data, class_weights = self.class_weights, chunk_size = chunk_size )
+        self.X_mean = pd.Series( mean, index = self.columns )
+        self.X_std  = pd.Series( std,  index = self.columns )
+
+        # Splitting in training and test samples (rows of the files)
+        rows = np.random.RandomState( 42 ).permutation( len(self.y_data) )
+        self.train_rows = rows[ : int( self.train_fraction*len(self.y_data) ) ]
+        self.test_rows  = np.sort( rows[ int( self.train_fraction*len(self.y_data) ) : ] )
+        self.y_train    = pd.Series( self.y_data[ np.sort( self.train_rows ) ], index = np.sort( self.train_rows ) )
+        self.y_test     = pd.Series( self.y_data[ self.test_rows ], index = self.test_rows )
+
+        # Spectator variables of the test sample, not transformed
+        self.X_spect = pd.DataFrame( self.X_data[ self.test_rows ][ :, [ self.columns.index( v ) for v in self.spectator_variables ] ], index = self.test_rows, columns = self.spectator_variables )
+        self.X_mean  = self.X_mean.drop( self.spectator_variables )
+        self.X_std   = self.X_std.drop( self.spectator_variables )
+
+    def sequence( self, rows, batch_size, shuffle ):
+        ''' TrainingSequence of the training variables for the given rows '''
+        from TrainingSequence import TrainingSequence
+        return TrainingSequence( self.X_data, self.y_data, rows, [ self.columns.index( v ) for v in self.training_variables ],
+                                 self.X_mean[ self.columns ].fillna( 0 ).values, self.X_std[ self.columns ].fillna( 1 ).values,
+                                 class_weights = self.class_weights if shuffle else None, batch_size = batch_size, chunk_size = self.chunk_size, shuffle = shuffle )
+
+    def predict_test( self ):
+        ''' Classifier output of the test sample '''
+        if self.streaming:
+            test_sequence = self.sequence( self.test_rows, self.batch_size, shuffle = False )
+            return pd.DataFrame( self.model.predict_generator( test_sequence ), index = test_sequence.rows )
+        return pd.DataFrame( self.model.predict( self.X_test.values  ) , index = self.X_test.index)
     
     def train( self, NHLayer = 2, units = 100, epochs = 100, batch_size = 5120, validation_split = 0.2, earlystopping = False , dropout = 0):
         '''
@@ -137,9 +202,9 @@ class KerasTrainer:
         #Initialize and build classifier
         self.model = Sequential()
         if NHLayer==0:
-            self.model.add( Dense(units= 1, activation='sigmoid', input_dim=self.X_train.shape[1]) ) 
+            self.model.add( Dense(units= 1, activation='sigmoid', input_dim=len(self.training_variables)) ) 
         else:
-            self.model.add( Dense(units= units, activation='relu', input_dim=self.X_train.shape[1], )) 
+            self.model.add( Dense(units= units, activation='relu', input_dim=len(self.training_variables), )) 
             if dropout:
                 self.model.add( Dropout( rate = dropout ) )
             for i in range(NHLayer):
@@ -155,10 +220,21 @@ class KerasTrainer:
    
         # callbacks 
         callbacks = []
-        callbacks.append( Callback_ROC( self.X_train, self.y_train, self.plot_directory, self.output_directory, interval_evaluate_auc = 10,  patience_earlystopping_auc = earlystopping) )        
+        if self.streaming:
+            # the last validation_split of the (shuffled) training rows are used for validation, as in fit
+            n_fit = int( round( (1-validation_split)*len(self.train_rows) ) )
+            train_sequence      = self.sequence( self.train_rows[:n_fit], batch_size, shuffle = True )
+            validation_sequence = self.sequence( self.train_rows[n_fit:], batch_size, shuffle = False ) if validation_split > 0 else None
+            callbacks.append( Callback_ROC( None, None, self.plot_directory, self.output_directory, interval_evaluate_auc = 10,  patience_earlystopping_auc = earlystopping,
+                                            train_sequence = self.sequence( self.train_rows[:n_fit], batch_size, shuffle = False ), validation_sequence = validation_sequence ) )
+        else:
+            callbacks.append( Callback_ROC( self.X_train, self.y_train, self.plot_directory, self.output_directory, interval_evaluate_auc = 10,  patience_earlystopping_auc = earlystopping) )        
         
         # training
-        self.history = self.model.fit(self.X_train.values, self.y_train.values, epochs=epochs, batch_size=batch_size, validation_split=validation_split, callbacks = callbacks)
+        if self.streaming:
+            self.history = self.model.fit_generator(train_sequence, epochs=epochs, validation_data=validation_sequence, callbacks = callbacks, shuffle = False)
+        else:
+            self.history = self.model.fit(self.X_train.values, self.y_train.values, epochs=epochs, batch_size=batch_size, validation_split=validation_split, callbacks = callbacks)
 
         # write training file
         training_file = os.path.join( self.output_directory, 'keras.h5')
@@ -210,13 +286,13 @@ class KerasTrainer:
         # ROC    
         #
 
-        self.y_test_pred = pd.DataFrame( self.model.predict( self.X_test.values  ) , index = self.X_test.index)
+        self.y_test_pred = self.predict_test()
         fpr_test, tpr_test, thresholds_test = roc_curve( self.y_test.values, self.y_test_pred.values )
         auc_val_test = auc(fpr_test, tpr_test)
 
         plt.plot( tpr_test, 1-fpr_test, 'b', label= 'Auc=' + str(round(auc_val_test,4) ))
-        plt.title('ROC (sample info: ' + str( len( self.X_test[self.y_test == 1] ) + len( self.X_train[self.y_train == 1] ) ) + ' signals / '
-                                              + str( len( self.X_test[self.y_test == 0] ) + len( self.X_train[self.y_train == 0] ) ) + ' background)'  )
+        plt.title('ROC (sample info: ' + str( (self.y_test == 1).sum() + (self.y_train == 1).sum() ) + ' signals / '
+                                              + str( (self.y_test == 0).sum() + (self.y_train == 0).sum() ) + ' background)'  )
         plt.xlabel('$\epsilon_{Sig}$', fontsize = 20) # 'False positive rate'
         plt.ylabel('$1-\epsilon_{Back}$', fontsize = 20) #  '1-True positive rate' 
         plt.legend(loc ='lower left')
@@ -0,0 +1,82 @@
+''' Streaming access to the memory-mapped training data of ColumnarStore
+'''
+
+# numpy, Keras
+import numpy as np
+from keras.utils import Sequence
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+def streaming_mean_std( X, y, class_weights = None, chunk_size = 100000 ):
+    ''' Mean and standard deviation (ddof=1, as pandas) of the columns of X in one pass over chunks of rows.
+        With class_weights (array indexed by label), events are weighted as in a balanced sample.
+    '''
+    n, W, mean, M2 = 0, 0., np.zeros( X.shape[1] ), np.zeros( X.shape[1] )
+    for start in range( 0, X.shape[0], chunk_size ):
+        X_chunk = np.asarray( X[start:start+chunk_size], dtype = np.float64 )
+        w_chunk = class_weights[ y[start:start+chunk_size] ] if class_weights is not None else np.ones( len(X_chunk) )
+        W_chunk    = w_chunk.sum()
+        if W_chunk == 0: continue
+        mean_chunk = np.dot( w_chunk, X_chunk )/W_chunk
+        M2_chunk   = np.dot( w_chunk, ( X_chunk - mean_chunk )**2 )
+        # combine with the previous chunks (Chan et al.)
+        delta = mean_chunk - mean
+        mean  = mean + delta*W_chunk/( W + W_chunk )
+        M2    = M2 + M2_chunk + delta**2*W*W_chunk/( W + W_chunk )
+        W    += W_chunk
+        n    += len(X_chunk)
+    return mean, np.sqrt( M2/W*n/( n - 1. ) )
+
+class TrainingSequence( Sequence ):
+    ''' Batches of (normalized features, labels[, sample weights]) for model.fit_generator.
+        Every epoch, the rows are shuffled and split into blocks of chunk_size rows; only the current block is read into memory
+        (rows in increasing order) and shuffled again. With class_weights (array indexed by label), sample weights are returned.
+        With shuffle = False, the batches follow the sorted rows, e.g. for predict_generator.
+    '''
+    def __init__( self, X, y, rows, columns, mean, std, class_weights = None, batch_size = 5120, chunk_size = 100000, shuffle = True, seed = 42 ):
+        self.X, self.y     = X, y
+        self.rows          = np.sort( rows )
+        self.columns       = np.asarray( columns )
+        self.mean          = np.asarray( mean )[self.columns]
+        self.std           = np.asarray( std )[self.columns]
+        self.class_weights = class_weights
+        self.batch_size    = batch_size
+        # blocks contain whole batches
+        self.chunk_size    = max( 1, chunk_size//batch_size )*batch_size
+        self.shuffle       = shuffle
+        self.rng           = np.random.RandomState( seed )
+        self.on_epoch_end()
+
+    def __len__( self ):
+        return len( self.batches )
+
+    def on_epoch_end( self ):
+        rows        = self.rng.permutation( self.rows ) if self.shuffle else self.rows
+        self.blocks = [ np.sort( rows[i:i+self.chunk_size] ) for i in range( 0, len(rows), self.chunk_size ) ]
+        self.batches = [ ( i_block, start ) for i_block, block in enumerate( self.blocks ) for start in range( 0, len(block), self.batch_size ) ]
+        self.current = None
+
+    def load( self, i_block ):
+        if self.current == i_block: return
+        rows = self.blocks[i_block]
+        X    = ( self.X[rows][:, self.columns] - self.mean )/self.std
+        y    = np.asarray( self.y[rows] )
+        if self.shuffle:
+            order = self.rng.permutation( len(rows) )
+            X, y  = X[order], y[order]
+        self.current, self.X_block, self.y_block = i_block, X, y
+
+    def __getitem__( self, i ):
+        i_block, start = self.batches[i]
+        self.load( i_block )
+        X = self.X_block[start:start+self.batch_size]
+        y = self.y_block[start:start+self.batch_size]
+        if self.class_weights is None:
+            return X, y
+        return X, y, self.class_weights[y]
+
+    def labels( self ):
+        ''' labels in the order of the batches (shuffle = False) '''
+        return np.asarray( self.y[self.rows] )
@@ -1,5 +1,6 @@
 import pickle, os, time
 import errno
+from collections import OrderedDict
 
 # Logging
 import logging
@@ -24,3 +25,39 @@ class Cache:
 
     def add(self, key, val, overwrite=True):
         return self.DB.add(key, val, overwrite)
+
+class MemoryCache:
+    ''' Bounded in-memory LRU cache with the interface of Cache. Counts hits and misses.
+    '''
+    def __init__(self, maxSize=100000):
+        self.maxSize = maxSize
+        self.data    = OrderedDict()
+        self.hits    = 0
+        self.misses  = 0
+
+    def contains (self, key):
+        if key in self.data:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, key):
+        val = self.data.pop(key)
+        self.data[key] = val # most recently used goes last
+        return val
+
+    def add(self, key, val, overwrite=True):
+        if key in self.data:
+            if not overwrite: return self.data[key]
+            del self.data[key]
+        self.data[key] = val
+        while len(self.data) > self.maxSize:
+            self.data.popitem(last=False)
+        return val
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return "%i hits, %i misses, %i/%i entries" % (self.hits, self.misses, len(self.data), self.maxSize)
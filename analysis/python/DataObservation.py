@@ -47,6 +47,19 @@ class DataObservation():
         else:
             return self.observation( region, channel, setup, overwrite)
 
+    def computeEstimate(self, region, channel, setup, overwrite=False):
+        ''' Like cachedObservation, but never writes to the cache (for worker processes)
+        '''
+        key =  self.uniqueKey(region, channel, setup)
+        if self.cache and self.cache.contains(key) and not overwrite and not (channel == 'SF' or channel == 'all'):
+            return self.cache.get(key), False
+        return self.observation( region, channel, setup, overwrite), True
+
+    def storeEstimate(self, region, channel, setup, res, write=True):
+        if self.cache and write:
+            self.cache.add( self.uniqueKey(region, channel, setup), res, overwrite=True)
+        return res
+
     def observation(self, region, channel, setup, overwrite):
 
         if channel=='all':
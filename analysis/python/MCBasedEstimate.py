@@ -31,9 +31,52 @@ class MCBasedEstimate(SystematicEstimator):
             return sum([self.cachedEstimate(region, c, setup) for c in ['MuMu', 'EE']])
 
         else:
-            preSelection = setup.preselection('MC', channel=channel, isFastSim = self.isFastSim)
-            cut = "&&".join([region.cutString(setup.sys['selectionModifier']), preSelection['cut']])
-            weight = preSelection['weightStr']
+            sample, cut, weight, scale = self.yieldDefinition(region, channel, setup)
 
             logger.debug( "Using cut %s and weight %s"%(cut, weight) )
-            return setup.lumi/1000.*u_float(**self.sample.getYieldFromDraw(selectionString = cut, weightString = weight) )
+            return scale*u_float(**sample.getYieldFromDraw(selectionString = cut, weightString = weight) )
+
+    def yieldDefinition(self, region, channel, setup):
+        ''' Sample, cut, weight and scale factor of the yield in a single lepton channel. Used by _estimate and the single pass YieldEngine.
+        '''
+        preSelection = setup.preselection('MC', channel=channel, isFastSim = self.isFastSim)
+        cut = "&&".join([region.cutString(setup.sys['selectionModifier']), preSelection['cut']])
+        return self.sample, cut, preSelection['weightStr'], setup.lumi/1000.
+
+    def variationYields(self, cells, variations, cacheFile=None, overwrite=False):
+        ''' Yields of the (region, channel, setup) cells for every weight variation, as cachedEstimate with setup.sysClone(sys={'reweight':[variation]}).
+            The sample is read once through the VariationMatrix, stored in cacheFile if given.
+            Returns a list of (val, sigma) arrays of length len(variations), one per cell.
+        '''
+        from StopsDilepton.analysis.VariationMatrix import VariationMatrix
+        import numpy as np
+
+        def singleChannels(channel, setup):
+            if channel=='all': return trilepChannels if setup.parameters['triLep'] else channels
+            elif channel=='SF': return ['MuMu', 'EE']
+            return [channel]
+
+        matrix  = VariationMatrix(self.sample, variations)
+        handles = []
+        for region, channel, setup in cells:
+            cellHandles = []
+            for c in singleChannels(channel, setup):
+                sample, cut, weight, scale = self.yieldDefinition(region, c, setup)
+                cellHandles.append( (matrix.add(cut, weight), scale) )
+            handles.append(cellHandles)
+
+        if cacheFile: matrix.cachedRun(cacheFile, overwrite=overwrite)
+        else:         matrix.run()
+
+        results = []
+        for cellHandles in handles:
+            val, sigma2 = np.zeros(len(variations)), np.zeros(len(variations))
+            for handle, scale in cellHandles:
+                v, s = matrix.getYields(handle)
+                # non-positive yields are replaced by 0 +/- 0, as in cachedEstimate
+                positive = v*scale > 0
+                val    += np.where(positive, v*scale, 0.)
+                sigma2 += np.where(positive, (s*scale)**2, 0.)
+            positive = val > 0
+            results.append( (np.where(positive, val, 0.), np.where(positive, np.sqrt(sigma2), 0.)) )
+        return results
@@ -8,7 +8,7 @@ from math import sqrt
 import json
 
 # StopsDilepton
-from StopsDilepton.analysis.Cache import Cache
+from StopsDilepton.analysis.Cache import Cache, MemoryCache
 from StopsDilepton.tools.u_float import u_float
 from StopsDilepton.analysis.SetupHelpers import channels
 
@@ -16,12 +16,35 @@ from StopsDilepton.analysis.SetupHelpers import channels
 import logging
 logger = logging.getLogger(__name__)
 
+def freeze(obj):
+    ''' Hashable version of nested dicts/lists
+    '''
+    if isinstance(obj, dict):
+        return tuple( (k, freeze(v)) for k, v in sorted(obj.items()) )
+    if isinstance(obj, (list, tuple, set)):
+        return tuple( freeze(v) for v in obj )
+    return obj
+
+def setupFingerprint(setup):
+    ''' Hashable fingerprint of setup.sys, setup.parameters and setup.lumi, computed once per setup.
+        sysClone replaces sys and parameters by new objects, so a stored fingerprint is only used if they are unchanged.
+    '''
+    stored = getattr(setup, '_fingerprint', None)
+    if stored is not None and stored[0] is setup.sys and stored[1] is setup.parameters:
+        return stored[2]
+    sys = dict(setup.sys)
+    sys['reweight'] = tuple(sorted(sys['reweight'])) if sys['reweight'] else sys['reweight'] # order doesn't matter, as in uniqueKey
+    fingerprint = ( freeze(sys), freeze(setup.parameters), freeze(setup.lumi) )
+    setup._fingerprint = ( setup.sys, setup.parameters, fingerprint )
+    return fingerprint
+
 class SystematicEstimator:
     __metaclass__ = abc.ABCMeta
 
     def __init__(self, name, cacheDir=None):
         self.name = name
         self.initCache(cacheDir)
+        self.memo = MemoryCache()
         self.isSignal = False
 
     def initCache(self, cacheDir):
@@ -62,7 +85,16 @@ class SystematicEstimator:
           else:                   return i
         except:                   return i
 
+    def memoKey(self, region, channel, setup):
+        ''' Cheap in-memory equivalent of uniqueKey
+        '''
+        return region, channel, setupFingerprint(setup)
+
     def cachedEstimate(self, region, channel, setup, save=True, overwrite=False):
+        memoKey = self.memoKey(region, channel, setup)
+        if self.memo.contains(memoKey) and not overwrite:
+            return self.memo.get(memoKey)
+
         key =  self.uniqueKey(region, channel, setup)
         if (self.cache and self.cache.contains(key)) and not overwrite:# and not (channel == 'SF' or channel == 'all') :
             res = self.cache.get(key)
@@ -74,7 +106,62 @@ class SystematicEstimator:
             logger.debug( "Adding cached %s result for %r : %r" %(self.name, key, res) )
         else:
             res = self._estimate( region, channel, setup)
-        return res if res > 0 else u_float(0,0)
+        res = res if res > 0 else u_float(0,0)
+        return self.memo.add(memoKey, res)
+
+    def computeEstimate(self, region, channel, setup, overwrite=False):
+        ''' Like cachedEstimate, but never writes to the cache (for worker processes).
+            Returns the result and whether it was newly calculated and still needs storeEstimate.
+        '''
+        key = self.uniqueKey(region, channel, setup)
+        if (self.cache and self.cache.contains(key)) and not overwrite:
+            return self.cache.get(key), False
+        logger.debug( "Calculating %s result for %r"%(self.name, key) )
+        return self._estimate( region, channel, setup), True
+
+    def storeEstimate(self, region, channel, setup, res, write=True):
+        ''' Write a result obtained with computeEstimate to the cache
+        '''
+        if self.cache and write:
+            self.cache.add( self.uniqueKey(region, channel, setup), res, overwrite=True )
+        res = res if res > 0 else u_float(0,0)
+        return self.memo.add( self.memoKey(region, channel, setup), res )
+
+    def cachedEstimates(self, jobs, overwrite=False):
+        ''' Compute all (region, channel, setup) jobs and fill the cache in bulk.
+            Estimators that define 'yieldDefinition' read each sample only once through the YieldEngine,
+            everything else (including the 'SF' and 'all' sums) falls back to cachedEstimate.
+        '''
+        from StopsDilepton.analysis.YieldEngine import YieldEngine
+
+        engines     = {}
+        pending     = {}
+        pendingJobs = {}
+        for region, channel, setup in jobs:
+            if channel in ['SF', 'all'] or not hasattr(self, 'yieldDefinition'): continue
+            key = self.uniqueKey(region, channel, setup)
+            if pending.has_key(key) or (self.cache and self.cache.contains(key) and not overwrite): continue
+            sample, cut, weight, scale = self.yieldDefinition(region, channel, setup)
+            if not engines.has_key(sample.name): engines[sample.name] = YieldEngine(sample)
+            pending[key] = (engines[sample.name], engines[sample.name].add(cut, weight), scale)
+            pendingJobs[key] = (region, channel, setup)
+
+        for engine in engines.values():
+            engine.run()
+
+        computed = {}
+        for key, (engine, handle, scale) in pending.iteritems():
+            res = scale*u_float(**engine.getYield(handle))
+            if self.cache: self.cache.add( key, res, overwrite=True )
+            logger.debug( "Adding cached %s result for %r : %r" %(self.name, key, res) )
+            computed[key] = res if res > 0 else u_float(0,0)
+            self.memo.add( self.memoKey(*pendingJobs[key]), computed[key] )
+
+        results = []
+        for region, channel, setup in jobs:
+            key = self.uniqueKey(region, channel, setup)
+            results.append( computed[key] if computed.has_key(key) else self.cachedEstimate(region, channel, setup, overwrite=overwrite) )
+        return results
 
     @abc.abstractmethod
     def _estimate(self, region, channel, setup):
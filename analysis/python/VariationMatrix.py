@@ -0,0 +1,158 @@
+''' Single-pass yield matrix for weight variations (LHE scale, PDF, alpha_s): one loop over a sample fills
+    sum(w) and sum(w^2) for every registered (cut, weight) cell times every variation factor.
+    Per event the cell flags, the base weights and the variation factors are buffered and the sums are
+    accumulated chunk-wise as matrix products. The result can be stored as .npz and is reused as long as
+    the definition (sample files, cells and variations) is unchanged.
+'''
+# Standard imports
+import os
+import ROOT
+import hashlib
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.analysis.YieldEngine import factorize
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class VariationMatrix:
+
+    def __init__( self, sample, variations, chunkSize = 10000 ):
+        self.sample     = sample
+        self.variations = list( variations )
+        self.chunkSize  = chunkSize
+        self.cuts       = []    # list of tuples of cut atoms
+        self.weights    = []    # list of weight strings
+        self.jobs       = []    # list of (cut index, weight index)
+        self.sumW       = None  # ( len(jobs), len(variations) )
+        self.sumW2      = None
+
+    def add( self, selectionString = None, weightString = None ):
+        ''' Register a cell with the sample selection and weight applied as in sample.getYieldFromDraw. Returns a handle for getYields.
+        '''
+        selectionString_ = self.sample.combineWithSampleSelection( selectionString )
+        weightString_    = self.sample.combineWithSampleWeight( weightString )
+
+        cut    = tuple( sorted( set( factorize( selectionString_, '&&', ['||'] ) ) ) ) if selectionString_ else ()
+        weight = weightString_ if weightString_ else "(1)"
+
+        if cut not in self.cuts: self.cuts.append( cut )
+        if weight not in self.weights: self.weights.append( weight )
+
+        job = ( self.cuts.index( cut ), self.weights.index( weight ) )
+        if job not in self.jobs:
+            self.jobs.append( job )
+            self.sumW = self.sumW2 = None
+        return self.jobs.index( job )
+
+    def __len__( self ):
+        return len(self.jobs)
+
+    def fingerprint( self ):
+        ''' Changes with the files of the sample, the cells and the variations '''
+        return hashlib.md5( repr( ( self.sample.name, sorted( self.sample.files ), self.cuts, self.weights, self.jobs, self.variations ) ) ).hexdigest()
+
+    def run( self ):
+        ''' Loop once over the events passing the common preselection and fill all cells for all variations
+        '''
+        chain = self.sample.chain
+
+        # atoms shared by all cuts go into the TEventList
+        common   = set(self.cuts[0]).intersection( *self.cuts[1:] ) if self.cuts else set()
+        atoms    = sorted( set( a for cut in self.cuts for a in cut ).difference( common ) )
+        cuts     = [ [ atoms.index(a) for a in cut if a not in common ] for cut in self.cuts ]
+
+        eListName = "eList_variations_%s" % self.sample.name
+        chain.Draw( ">>%s" % eListName, "&&".join( "(%s)" % a for a in sorted(common) ) if common else "(1)" )
+        eList = ROOT.gDirectory.Get( eListName )
+        nEvents = eList.GetN()
+
+        logger.info( "Single pass over %i preselected events of sample %s for %i cells and %i variations.",
+                     nEvents, self.sample.name, len(self.jobs), len(self.variations) )
+
+        formulas = [ ROOT.TTreeFormula( "atom_%i" % i, a, chain ) for i, a in enumerate( atoms ) ] \
+                 + [ ROOT.TTreeFormula( "weight_%i" % i, w, chain ) for i, w in enumerate( self.weights ) ] \
+                 + [ ROOT.TTreeFormula( "variation_%i" % i, v, chain ) for i, v in enumerate( self.variations ) ]
+        for f in formulas:
+            if not f.GetNdim():
+                raise RuntimeError( "Could not compile formula '%s' for sample %s" % ( f.GetTitle(), self.sample.name ) )
+        atomFormulas      = formulas[:len(atoms)]
+        weightFormulas    = formulas[len(atoms):len(atoms)+len(self.weights)]
+        variationFormulas = formulas[len(atoms)+len(self.weights):]
+
+        jobCuts    = np.array( [ iCut    for iCut, iWeight in self.jobs ], dtype = np.int64 )
+        jobWeights = np.array( [ iWeight for iCut, iWeight in self.jobs ], dtype = np.int64 )
+
+        sumW   = np.zeros( ( len(self.jobs), len(self.variations) ) )
+        sumW2  = np.zeros( ( len(self.jobs), len(self.variations) ) )
+        passed     = np.zeros( ( self.chunkSize, len(self.cuts) ), dtype = bool )
+        weights    = np.zeros( ( self.chunkSize, len(self.weights) ) )
+        variations = np.zeros( ( self.chunkSize, len(self.variations) ) )
+
+        def flush( n ):
+            w = passed[:n][:, jobCuts] * weights[:n][:, jobWeights]
+            v = variations[:n]
+            sumW[:]  += w.T.dot( v )
+            sumW2[:] += ( w**2 ).T.dot( v**2 )
+
+        def evaluate( f ):
+            f.GetNdata()
+            return f.EvalInstance()
+
+        n = 0
+        treeNumber = -1
+        for i in xrange( nEvents ):
+            if i % 100000 == 0 and i > 0:
+                logger.debug( "At event %i/%i of sample %s", i, nEvents, self.sample.name )
+            chain.LoadTree( eList.GetEntry(i) )
+            if chain.GetTreeNumber() != treeNumber:
+                treeNumber = chain.GetTreeNumber()
+                for f in formulas: f.UpdateFormulaLeaves()
+
+            atomValues = [ evaluate( f ) != 0 for f in atomFormulas ]
+            cutValues  = [ all( atomValues[a] for a in cut ) for cut in cuts ]
+            if not any( cutValues ): continue
+
+            passed[n]     = cutValues
+            weights[n]    = [ evaluate( f ) for f in weightFormulas ]
+            variations[n] = [ evaluate( f ) for f in variationFormulas ]
+            n += 1
+            if n == self.chunkSize:
+                flush( n )
+                n = 0
+        if n > 0: flush( n )
+
+        eList.Delete()
+        self.sumW, self.sumW2 = sumW, sumW2
+        return self.sumW, self.sumW2
+
+    def save( self, filename ):
+        tmp = filename + '.tmp.npz'
+        np.savez_compressed( tmp, sumW = self.sumW, sumW2 = self.sumW2, fingerprint = np.array( self.fingerprint() ) )
+        os.rename( tmp, filename )
+        logger.info( "Written variation matrix (%i cells, %i variations) to %s", len(self.jobs), len(self.variations), filename )
+
+    def load( self, filename ):
+        ''' Load the sums from filename if it was written for the same definition. Returns True on success. '''
+        if not os.path.exists( filename ): return False
+        data = np.load( filename )
+        if str( data['fingerprint'] ) != self.fingerprint() or data['sumW'].shape != ( len(self.jobs), len(self.variations) ):
+            logger.info( "Variation matrix in %s has a different definition, recomputing.", filename )
+            return False
+        self.sumW, self.sumW2 = data['sumW'], data['sumW2']
+        logger.info( "Loaded variation matrix (%i cells, %i variations) from %s", len(self.jobs), len(self.variations), filename )
+        return True
+
+    def cachedRun( self, filename, overwrite = False ):
+        ''' run, reusing and updating the matrix stored in filename '''
+        if overwrite or not self.load( filename ):
+            self.run()
+            self.save( filename )
+
+    def getYields( self, handle ):
+        ''' sum(w) and sqrt(sum(w^2)) of a cell for all variations, same as sample.getYieldFromDraw with the variation as additional weight factor
+        '''
+        if self.sumW is None: self.run()
+        return self.sumW[handle], np.sqrt( self.sumW2[handle] )
@@ -0,0 +1,142 @@
+''' Single-pass yield engine: fill many (cut, weight) combinations of one sample in one event loop.
+    Cuts and weights are split into their '&&' and '*' factors which are evaluated only once per event,
+    the factors common to all cuts are used as a preselection through a TEventList.
+'''
+# Standard imports
+import ROOT
+from math import sqrt
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+def splitTopLevel( string, separator ):
+    ''' Split 'string' at 'separator' where it is not enclosed in brackets
+    '''
+    res   = []
+    depth = 0
+    start = 0
+    i     = 0
+    while i < len(string):
+        c = string[i]
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif depth == 0 and string.startswith( separator, i ):
+            res.append( string[start:i] )
+            i    += len(separator)
+            start = i
+            continue
+        i += 1
+    res.append( string[start:] )
+    return [ s.strip() for s in res if s.strip() ]
+
+def factorize( string, separator, lowerPrecedence ):
+    ''' Split 'string' into factors at 'separator' unless an operator of lower precedence appears on the top level
+    '''
+    if any( len( splitTopLevel( string, op ) ) > 1 for op in lowerPrecedence ):
+        return [ string.strip() ]
+    return splitTopLevel( string, separator )
+
+class YieldEngine:
+
+    def __init__( self, sample ):
+        self.sample  = sample
+        self.cuts    = []    # list of tuples of cut atoms
+        self.weights = []    # list of tuples of weight factors
+        self.jobs    = []    # list of (cut index, weight index)
+        self.results = None
+
+    def add( self, selectionString = None, weightString = None ):
+        ''' Register a yield with the sample selection and weight applied as in sample.getYieldFromDraw. Returns a handle for getYield.
+        '''
+        selectionString_ = self.sample.combineWithSampleSelection( selectionString )
+        weightString_    = self.sample.combineWithSampleWeight( weightString )
+
+        cut    = tuple( sorted( set( factorize( selectionString_, '&&', ['||'] ) ) ) ) if selectionString_ else ()
+        weight = tuple( factorize( weightString_, '*', ['+', '-'] ) ) if weightString_ else ()
+
+        if cut not in self.cuts: self.cuts.append( cut )
+        if weight not in self.weights: self.weights.append( weight )
+
+        self.jobs.append( ( self.cuts.index( cut ), self.weights.index( weight ) ) )
+        self.results = None
+        return len(self.jobs) - 1
+
+    def __len__( self ):
+        return len(self.jobs)
+
+    def run( self ):
+        ''' Loop once over the events passing the common preselection and fill all registered yields
+        '''
+        chain = self.sample.chain
+
+        # atoms shared by all cuts go into the TEventList
+        common   = set(self.cuts[0]).intersection( *self.cuts[1:] ) if self.cuts else set()
+        atoms    = sorted( set( a for cut in self.cuts for a in cut ).difference( common ) )
+        factors  = sorted( set( f for weight in self.weights for f in weight ) )
+
+        cuts     = [ [ atoms.index(a) for a in cut if a not in common ] for cut in self.cuts ]
+        weights  = [ [ factors.index(f) for f in weight ] for weight in self.weights ]
+
+        eListName = "eList_%s" % self.sample.name
+        chain.Draw( ">>%s" % eListName, "&&".join( "(%s)" % a for a in sorted(common) ) if common else "(1)" )
+        eList = ROOT.gDirectory.Get( eListName )
+        nEvents = eList.GetN()
+
+        logger.info( "Single pass over %i preselected events of sample %s for %i yields (%i cut atoms, %i weight factors).",
+                     nEvents, self.sample.name, len(self.jobs), len(atoms), len(factors) )
+
+        formulas = [ ROOT.TTreeFormula( "atom_%i" % i, a, chain ) for i, a in enumerate( atoms ) ] \
+                 + [ ROOT.TTreeFormula( "factor_%i" % i, f, chain ) for i, f in enumerate( factors ) ]
+        for f in formulas:
+            if not f.GetNdim():
+                raise RuntimeError( "Could not compile formula '%s' for sample %s" % ( f.GetTitle(), self.sample.name ) )
+        atomFormulas   = formulas[:len(atoms)]
+        factorFormulas = formulas[len(atoms):]
+
+        sumW  = [ 0. for j in self.jobs ]
+        sumW2 = [ 0. for j in self.jobs ]
+
+        treeNumber = -1
+        for i in xrange( nEvents ):
+            if i % 100000 == 0 and i > 0:
+                logger.debug( "At event %i/%i of sample %s", i, nEvents, self.sample.name )
+            chain.LoadTree( eList.GetEntry(i) )
+            if chain.GetTreeNumber() != treeNumber:
+                treeNumber = chain.GetTreeNumber()
+                for f in formulas: f.UpdateFormulaLeaves()
+
+            atomValues = []
+            for f in atomFormulas:
+                f.GetNdata()
+                atomValues.append( f.EvalInstance() != 0 )
+            passed = [ all( atomValues[a] for a in cut ) for cut in cuts ]
+            if not any( passed ): continue
+
+            factorValues = []
+            for f in factorFormulas:
+                f.GetNdata()
+                factorValues.append( f.EvalInstance() )
+            weightValues = []
+            for weight in weights:
+                w = 1.
+                for f in weight: w *= factorValues[f]
+                weightValues.append( w )
+
+            for j, ( iCut, iWeight ) in enumerate( self.jobs ):
+                if passed[iCut]:
+                    w = weightValues[iWeight]
+                    sumW[j]  += w
+                    sumW2[j] += w**2
+
+        eList.Delete()
+        self.results = [ {'val':sumW[j], 'sigma':sqrt(sumW2[j])} for j in range(len(self.jobs)) ]
+        return self.results
+
+    def getYield( self, handle ):
+        ''' Same format as sample.getYieldFromDraw
+        '''
+        if self.results is None: self.run()
+        return self.results[handle]
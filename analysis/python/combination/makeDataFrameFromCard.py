@@ -9,73 +9,45 @@ https://pandas.pydata.org/pandas-docs/stable/user_guide/advanced.html
 '''
 
 import pandas
+import numpy as np
+
+from StopsDilepton.analysis.dataCard import DataCard
 
 #cardFile = '/afs/hephy.at/data/cms05/StopsDileptonLegacy/results/v8//COMBINED/fitAll/cardFiles/T2tt/observed//T2tt_800_100_combination.txt'
 
 
 
 def getDict(cardFile):
-    #result = {}
-    
     '''
-    Get the meta information in the first go, then fill everything
+    Get the meta information from the parsed card (see dataCard.py), then fill everything
     '''
-    systematics = ['yield']
-    binList = False
-    estimateList = False
-    with open(cardFile) as f:
-        for line in f:
-            if len(line.split())<2: continue
-            if line.split()[0] == "bin":
-                if not binList:
-                    binList = True
-                    bins = line.split()[1:]
-                else:
-                    binList = line.split()[1:]
-            if line.split()[1] == 'lnN' and not line.split()[0].startswith('Stat'):
-                systematics.append(line.split()[0])
-            if line.split()[0] == "process":
-                if not estimateList: estimateList = line.split()[1:]
-    
-    # trick to get unique entries of estimate list
-    uniqueEstmates = list(set(estimateList))
-    processes   = uniqueEstmates + ['obs']
-    systematics += ['stat']
-    
-    # Build the skelleton
-    result = { b: { proc: { sys:0 for sys in systematics} for proc in processes } for b in bins }
+    card = DataCard.fromFile(cardFile)
+    lnN  = [ i for i, (name, type_) in enumerate(zip(card.nuisances, card.nuisanceTypes)) if type_ == 'lnN' and not name.startswith('Stat') ]
+    stat = [ i for i, (name, type_) in enumerate(zip(card.nuisances, card.nuisanceTypes)) if type_ == 'lnN' and name.startswith('Stat') ]
 
-    with open(cardFile) as f:
-        for line in f:
-            if len(line.split())<20: continue
-            # fill observation
-            if line.split()[0] == 'observation':
-                for i,b in enumerate(bins):
-                    result[b]['obs']['yield'] = int(line.split()[i+1])
-            
-            # fill estimates
-            if line.split()[0] == 'rate':
-                for i,b in enumerate(binList):
-                    #print b, uniqueEstmates[(i+1)%len(uniqueEstmates)], line.split()[i+1]
-                    #print b, estimateList[i], float(line.split()[i+1])
-                    result[b][estimateList[i]]['yield'] = float(line.split()[i+1])
-            
-            # now put the uncertainties
-            if line.split()[1] == 'lnN' and not line.split()[0].startswith('Stat'):
-                for i,b in enumerate(binList):
-                    try:
-                        result[b][estimateList[i]][line.split()[0]] = float(line.split()[i+2]) - 1
-                        #print b, line.split()[0], uniqueEstmates[(i)%len(uniqueEstmates)], float(line.split()[i+2]) - 1
-                        #print b, line.split()[0], estimateList[i], float(line.split()[i+2]) - 1
-                    except:
-                        result[b][estimateList[i]][line.split()[0]] = 0
-
-            # stat uncertainties. this needed some level of hardcoding, unfortunately.
-            if line.split()[1] == 'lnN' and line.split()[0].startswith('Stat'):
-                if len(line.split()[0].split('_'))>3:
-                    # examples: dc_2016_Bin0, Stat_Bin0_DY_2016
-                    binname = "dc_%s_%s"%(line.split()[0].split('_')[3], line.split()[0].split('_')[1])
-                    result[binname][line.split()[0].split('_')[2]]['stat'] = float([ x for x in line.split()[2:] if x != '-' ][0]) - 1
+    systematics = ['yield'] + [ card.nuisances[i] for i in lnN ] + ['stat']
+    processes   = card.processes() + ['obs']
+
+    # Build the skelleton
+    result = { b: { proc: { sys:0 for sys in systematics} for proc in processes } for b in card.bins }
+
+    # fill observation
+    for b, obs in zip(card.bins, card.observation):
+        result[b]['obs']['yield'] = int(obs)
+
+    # fill estimates and the uncertainties, '-' is 0
+    uncertainties = np.where(np.isnan(card.values[lnN]), 0., card.values[lnN] - 1)
+    for i, (b, proc) in enumerate(zip(card.columnBins, card.columnProcesses)):
+        result[b][proc]['yield'] = card.rates[i]
+        result[b][proc].update( zip( systematics[1:-1], uncertainties[:,i].tolist() ) )
+
+    # stat uncertainties. this needed some level of hardcoding, unfortunately.
+    for i in stat:
+        name = card.nuisances[i].split('_')
+        if len(name)>3:
+            # examples: dc_2016_Bin0, Stat_Bin0_DY_2016
+            binname = "dc_%s_%s"%(name[3], name[1])
+            result[binname][name[2]]['stat'] = card.values[i][~np.isnan(card.values[i])][0] - 1
 
     return result
 
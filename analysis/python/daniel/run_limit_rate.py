@@ -382,7 +382,7 @@ def wrapper(s):
         if useCache and not overWrite and limitCache.contains(sConfig):
           res = limitCache.get(sConfig)
         else:
-          res = c.calcLimit(cardFileName, options="-v 3 > output.txt", normList = ["DY_norm","multiBoson_norm","TTZ_norm"])
+          res = c.calcLimit(cardFileName, options="-v 3", normList = ["DY_norm","multiBoson_norm","TTZ_norm"])
           c.calcNuisances(cardFileName)
           limitCache.add(sConfig, res, save=True)
     else:
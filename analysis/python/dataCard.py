@@ -0,0 +1,145 @@
+''' Parsed combine data cards and nuisance files (output of diffNuisances, *_nuisances_full.txt).
+    A card is read once into arrays indexed by column (bin, process) and nuisance, a nuisance file into a dict of its lines.
+    Both are memoized by path and mtime, so repeated lookups in the same card don't touch the file again.
+'''
+# Standard imports
+import os
+import numpy as np
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+_cache = {}
+
+def memoized( cls, path ):
+    ''' Instance of cls for path, parsed again if the file was modified '''
+    mtime = os.path.getmtime( path )
+    key   = ( cls.__name__, os.path.abspath( path ) )
+    if not _cache.has_key( key ) or _cache[key][0] != mtime:
+        _cache[key] = ( mtime, cls( path ) )
+    return _cache[key][1]
+
+def toFloat( value, default = float('nan') ):
+    try:
+        return float( value )
+    except ValueError:
+        return default
+
+class DataCard:
+    keywords = [ 'imax', 'jmax', 'kmax', 'shapes', 'bin', 'observation', 'process', 'rate' ]
+
+    def __init__( self, cardFile ):
+        self.cardFile = cardFile
+        with open( cardFile ) as f:
+            self.lines = f.readlines()
+
+        self.bins, self.observation = [], np.zeros( 0 )
+        self.columnBins, self.columnProcesses, self.rates = [], [], np.zeros( 0 )
+        self.nuisances, self.nuisanceTypes, values = [], [], []
+        observation, afterRate = None, False
+        for line in self.lines:
+            tokens = line.split()
+            if len(tokens) == 0 or tokens[0].startswith('#') or tokens[0].startswith('-'): continue
+            if tokens[0] == 'bin':
+                # first 'bin' line: bins of the observation, second: bin of each column
+                if not self.bins: self.bins            = tokens[1:]
+                else:             self.columnBins      = tokens[1:]
+            elif tokens[0] == 'observation':
+                observation = tokens[1:]
+            elif tokens[0] == 'process':
+                # first 'process' line: names, second: indices
+                if not self.columnProcesses: self.columnProcesses = tokens[1:]
+            elif tokens[0] == 'rate':
+                self.rates = np.array( [ toFloat( v, 0. ) for v in tokens[1:] ] )
+                afterRate  = True
+            elif afterRate and len(tokens) >= 2 and tokens[0] not in self.keywords:
+                self.nuisances.append( tokens[0] )
+                self.nuisanceTypes.append( tokens[1] )
+                values.append( [ toFloat( v ) for v in tokens[2:] ] )
+        if observation is not None:
+            self.observation = np.array( [ toFloat( v, 0. ) for v in observation ] )
+
+        # '-' and values that are not numbers are NaN
+        self.values = np.full( ( len(self.nuisances), len(self.columnBins) ), np.nan )
+        for i, v in enumerate( values ):
+            n = min( len(v), len(self.columnBins) )
+            self.values[i, :n] = v[:n]
+
+        self.columnIndex = {}
+        for i, column in enumerate( zip( self.columnBins, self.columnProcesses ) ):
+            self.columnIndex.setdefault( column, i )
+        self.nuisanceIndex = {}
+        for i, name in enumerate( self.nuisances ):
+            self.nuisanceIndex.setdefault( name, i )
+        self.__binNumbers = {}
+
+        logger.debug( "Parsed card %s with %i bins, %i columns and %i nuisances.", cardFile, len(self.bins), len(self.columnBins), len(self.nuisances) )
+
+    @classmethod
+    def fromFile( cls, cardFile ):
+        return memoized( cls, cardFile )
+
+    def processes( self ):
+        ''' Unique process names in the order of the columns '''
+        res = []
+        for p in self.columnProcesses:
+            if p not in res: res.append( p )
+        return res
+
+    def binNumber( self, binName ):
+        ''' Returns something of the form "Bin0" from the comment lines of the card '''
+        if not self.__binNumbers.has_key( binName ):
+            self.__binNumbers[binName] = None
+            for line in self.lines:
+                if binName in line:
+                    self.__binNumbers[binName] = line.split(':')[0].split()[-1]
+                    break
+        return self.__binNumbers[binName]
+
+    def column( self, binNumber, process ):
+        ''' Column index of ( bin, process ), None if not in the card '''
+        return self.columnIndex.get( ( binNumber, process ) )
+
+    def columns( self, binNumbers, process ):
+        ''' Column indices of process in binNumbers, -1 where not in the card '''
+        return np.array( [ self.columnIndex.get( ( b, process ), -1 ) for b in binNumbers ], dtype = np.int64 )
+
+    def uncertainties( self, names, columns ):
+        ''' Relative uncertainties (value-1) of nuisance names[i] in columns[i], 0 for '-', NaN if the nuisance or column doesn't exist '''
+        rows    = np.array( [ self.nuisanceIndex.get( n, -1 ) for n in names ], dtype = np.int64 )
+        columns = np.asarray( columns, dtype = np.int64 )
+        res     = np.full( len(rows), np.nan )
+        valid   = ( rows >= 0 ) & ( columns >= 0 )
+        values  = self.values[ rows[valid], columns[valid] ]
+        res[valid] = np.where( np.isnan( values ), 0., values - 1 )
+        return res
+
+class NuisanceFile:
+
+    def __init__( self, nuisanceFile ):
+        self.nuisanceFile = nuisanceFile
+        self.lines = {}
+        with open( nuisanceFile ) as f:
+            for line in f:
+                tokens = line.split()
+                if tokens and not self.lines.has_key( tokens[0] ):
+                    self.lines[tokens[0]] = line
+        logger.debug( "Parsed nuisance file %s with %i entries.", nuisanceFile, len(self.lines) )
+
+    @classmethod
+    def fromFile( cls, nuisanceFile ):
+        return memoized( cls, nuisanceFile )
+
+    def pull( self, name ):
+        ''' Pull of the nuisance, 0 if not found (e.g. bins with yield 0) '''
+        if not self.lines.has_key( name ): return 0
+        return float( self.lines[name].split(',')[0].split()[-1] )
+
+    def constraint( self, name ):
+        ''' Post-fit constraint of the nuisance, 0 if not found '''
+        if not self.lines.has_key( name ): return 0
+        return float( self.lines[name].split(',')[1].split()[0].replace('*','').replace('!','') )
+
+    def pulls( self, names ):
+        return np.array( [ self.pull( n ) for n in names ], dtype = np.float64 )
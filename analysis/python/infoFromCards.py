@@ -1,33 +1,23 @@
 from StopsDilepton.tools.u_float import u_float
+from StopsDilepton.analysis.dataCard import DataCard, NuisanceFile
 import math
+import numpy as np
+
+# Cards and nuisance files are parsed once (per mtime), see dataCard.py
 
 def getPull(nuisanceFile, name):
-    with open(nuisanceFile) as f:
-      for line in f:
-        if name != line.split()[0]: continue
-        return float(line.split(',')[0].split()[-1])
-    return 0 # Sometimes a bin is not found in the nuisance file because its yield is 0
+    return NuisanceFile.fromFile(nuisanceFile).pull(name) # Sometimes a bin is not found in the nuisance file because its yield is 0
 
 def getConstrain(nuisanceFile, name):
-    with open(nuisanceFile) as f:
-      for line in f:
-        if name != line.split()[0]: continue
-        return float(line.split(',')[1].split()[0].replace('*','').replace('!',''))
-    return 0 # Sometimes a bin is not found in the nuisance file because its yield is 0
+    return NuisanceFile.fromFile(nuisanceFile).constraint(name) # Sometimes a bin is not found in the nuisance file because its yield is 0
 
 
     # Returns something of the form "Bin0" if bin name (as written in the comment lines of the cards) are given
 def getBinNumber(cardFile, binName):
-    with open(cardFile) as f:
-      for line in f:
-        if binName in line: return line.split(':')[0].split()[-1]
+    return DataCard.fromFile(cardFile).binNumber(binName)
 
 def getFittedUncertainty(nuisanceFile, name):
-    with open(nuisanceFile) as f:
-      for line in f:
-        if name != line.split()[0]: continue
-        return float(line.split(',')[1].split()[0].replace('!','').replace('*',''))
-    return 0 # Sometimes a bin is not found in the nuisance file because its yield is 0
+    return NuisanceFile.fromFile(nuisanceFile).constraint(name) # Sometimes a bin is not found in the nuisance file because its yield is 0
 
 
 def getPostFitUncFromCard(cardFile, estimateName, uncName, binName):
@@ -35,24 +25,12 @@ def getPostFitUncFromCard(cardFile, estimateName, uncName, binName):
     return getFittedUncertainty(nuisanceFile, estimateName)*getPreFitUncFromCard(cardFile, estimateName, uncName, binName)
 
 def getPreFitUncFromCard(cardFile, estimateName, uncName, binName):
-    binNumber = getBinNumber(cardFile, binName)
-    with open(cardFile) as f:
-      binList = False
-      estimateList = False
-      for line in f:
-        if len(line.split())==0: continue
-        if line.split()[0] == "bin":
-          if not binList: binList = True
-          else:           binList = line.split()[1:]
-        if line.split()[0] == "process":
-          if not estimateList: estimateList = line.split()[1:]
-        if line.split()[0] != uncName: continue
-        for i in range(len(binList)):
-          if binList[i] == binNumber and estimateList[i]==estimateName:
-            try:    return float(line.split()[2:][i])-1
-            except: 
-              return 0. # muted bin has -, cannot be converted to float
+    card   = DataCard.fromFile(cardFile)
+    column = card.column(card.binNumber(binName), estimateName)
+    unc    = card.uncertainties([uncName], [column if column is not None else -1])[0] # muted bin has -, gives 0
+    if np.isnan(unc):
       raise Warning('No uncertainty ' + uncName + ' for ' + estimateName + ' ' + binName)
+    return float(unc)
 
 def getTotalPostFitUncertainty(cardFile, binName):
     binNumber = getBinNumber(cardFile, binName)
@@ -97,42 +75,24 @@ def getTotalPostFitUncertainty(cardFile, binName):
     total = 0
     for unc in totalUnc.keys():
         total += totalUnc[unc]**2
-    estimatesPostFit = []
-    for e in estimateList:
-        res = getEstimateFromCard(cardFile, e, binName)
-        res = applyAllNuisances(cardFile, e, res, binName)
-        estimatesPostFit.append(res.val)
-    estimatePostFit = sum(estimatesPostFit)
+    estimatePostFit = sum(float(getPostFitEstimatesFromCard(cardFile, e, [binName])[0][0]) for e in estimateList)
     return u_float(estimatePostFit,math.sqrt(total))
     #return uncDict, totalUnc
           #else: 
 
+def getEstimatesFromCard(cardFile, estimateName, binNames):
+    ''' Yields of estimateName in all binNames as arrays (val, sigma) '''
+    card    = DataCard.fromFile(cardFile)
+    columns = card.columns([card.binNumber(b) for b in binNames], estimateName)
+    found   = columns >= 0
+    val     = np.where(found, card.rates[columns] if len(card.rates) else 0., 0.)
+    unc     = card.uncertainties(['Stat_' + b + '_' + estimateName for b in binNames], columns)
+    sigma   = np.where(np.isnan(unc), 0., unc*val)
+    return val, sigma
+
 def getEstimateFromCard(cardFile, estimateName, binName):
-    res = u_float(0)
-    binNumber = getBinNumber(cardFile, binName)
-    uncName = 'Stat_' + binName + '_' + estimateName
-    with open(cardFile) as f:
-      binList = False
-      estimateList = False
-      for line in f:
-        if len(line.split())==0: continue
-        if line.split()[0] == "bin":
-          if not binList: binList = True
-          else:           binList = line.split()[1:]
-        if line.split()[0] == "process":
-          if not estimateList: estimateList = line.split()[1:]
-        if line.split()[0] == "rate":
-            for i in range(len(binList)):
-              if binList[i] == binNumber and estimateList[i]==estimateName:
-                try: res.val = float(line.split()[1:][i])
-                except: res.val = 0
-                #return float(line.split()[1:][i])
-        if line.split()[0] != uncName: continue
-        for i in range(len(binList)):
-          if binList[i] == binNumber and estimateList[i]==estimateName:
-            try:    res.sigma = (float(line.split()[2:][i])-1)*res.val
-            except: res.sigma = 0.
-    return res
+    val, sigma = getEstimatesFromCard(cardFile, estimateName, [binName])
+    return u_float(float(val[0]), float(sigma[0]))
 
 
 def applyNuisance(cardFile, estimate, res, binName):
@@ -144,18 +104,51 @@ def applyNuisance(cardFile, estimate, res, binName):
     scaledRes2   = scaledRes*(1+res.sigma/res.val*getPull(nuisanceFile, 'Stat_' + binNumber + '_' + estimate.name)) if scaledRes.val > 0 else scaledRes
     return scaledRes2
 
-def applyAllNuisances(cardFile, estimate, res, binName):
-    if not estimate in ['DY','multiBoson','TTZ','TTJetsG','TTJetsNG','TTJetsF','other']: return res
+allNuisances = ["unclEn","JER","leptonSF","PU","Lumi","PDF","SFb","topPt","JEC","trigger","SFl"]
+
+def getUncName(estimate):
     if estimate == "TTZ":
-        uncName     = 'ttZ'
+        return 'ttZ'
     elif estimate == 'TTJetsG':
-        uncName     = 'topGaus'
+        return 'topGaus'
     elif estimate == 'TTJetsNG':
-        uncName     = 'topNonGaus'
+        return 'topNonGaus'
     elif estimate == 'TTJetsF':
-        uncName     = 'topFakes'
-    else:
-        uncName      = estimate
+        return 'topFakes'
+    return estimate
+
+def getPostFitEstimatesFromCard(cardFile, estimate, binNames):
+    ''' getEstimateFromCard followed by applyAllNuisances for all binNames at once. Returns arrays (val, sigma) '''
+    val, sigma = getEstimatesFromCard(cardFile, estimate, binNames)
+    if not estimate in ['DY','multiBoson','TTZ','TTJetsG','TTJetsNG','TTJetsF','other']: return val, sigma
+    card         = DataCard.fromFile(cardFile)
+    nuisances    = NuisanceFile.fromFile(cardFile.replace('.txt','_nuisances_full.txt'))
+    binNumbers   = [card.binNumber(b) for b in binNames]
+    columns      = card.columns(binNumbers, estimate)
+
+    def preFitUnc(names, needed):
+        unc     = card.uncertainties(names, columns)
+        missing = np.isnan(unc) & needed
+        if missing.any():
+            i = np.nonzero(missing)[0][0]
+            raise Warning('No uncertainty ' + names[i] + ' for ' + estimate + ' ' + binNames[i])
+        return np.where(needed, unc, 0.)
+
+    uncName      = getUncName(estimate)
+    scale        = 1 + preFitUnc([uncName]*len(binNames), np.ones(len(binNames), dtype=bool))*nuisances.pull(uncName)
+    val, sigma   = val*scale, sigma*scale
+    # only positive yields are scaled further
+    positive     = val > 0
+    statNames    = ['Stat_' + str(b) + '_' + estimate for b in binNumbers]
+    factor       = (1 + preFitUnc(statNames, positive))**nuisances.pulls(statNames)
+    for n in allNuisances:
+        factor  *= (1 + preFitUnc([n]*len(binNames), positive))**nuisances.pull(n)
+    factor       = np.where(positive, factor, 1.)
+    return val*factor, sigma*factor
+
+def applyAllNuisances(cardFile, estimate, res, binName):
+    if not estimate in ['DY','multiBoson','TTZ','TTJetsG','TTJetsNG','TTJetsF','other']: return res
+    uncName      = getUncName(estimate)
     nuisanceFile = cardFile.replace('.txt','_nuisances_full.txt')
     binNumber    = getBinNumber(cardFile, binName)
     scaledRes    = res*(1+getPreFitUncFromCard(cardFile, estimate, uncName, binName)*getPull(nuisanceFile, uncName))
@@ -164,7 +157,6 @@ def applyAllNuisances(cardFile, estimate, res, binName):
     scaledRes2   = scaledRes*(1+getPreFitUncFromCard(cardFile, estimate, 'Stat_' + binNumber + '_' + estimate, binName))**getPull(nuisanceFile, 'Stat_' + binNumber + '_' + estimate) if scaledRes.val > 0 else scaledRes
     #scaledRes2   = scaledRes*math.exp(getPreFitUncFromCard(cardFile, estimate, 'Stat_' + binNumber + '_' + estimate, binName)*getPull(nuisanceFile, 'Stat_' + binNumber + '_' + estimate)) if scaledRes.val > 0 else scaledRes
     #print "{:10}{:10.3f}".format("stat",scaledRes2.val)
-    allNuisances = ["unclEn","JER","leptonSF","PU","Lumi","PDF","SFb","topPt","JEC","trigger","SFl"]
     for n in allNuisances:
         #if getPreFitUncFromCard(cardFile, estimate, n, binName)*getPull(nuisanceFile, n) < -1.:
         #    scaledRes2 = scaledRes2*math.exp(getPreFitUncFromCard(cardFile, estimate, n, binName)*getPull(nuisanceFile, n)) if scaledRes.val > 0 else scaledRes
@@ -0,0 +1,124 @@
+''' Limits of a SUSY scan as numpy structured array with one row per (mStop, mLSP) point and one column per quantile.
+    The grid is stored as .npy file next to limitResults.root, so plotting scripts don't have to open the result file of every mass point.
+'''
+
+# Standard imports
+import os
+import ROOT
+
+# numpy
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.cardFileWriter.combineDriver import readLimitArrays
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+quantiles = ['-1.000', '0.025', '0.160', '0.500', '0.840', '0.975']
+columns   = ['stop', 'lsp'] + quantiles + ['significance']
+gridDtype = np.dtype( [ ( c, np.float64 ) for c in columns ] )
+
+def emptyGrid( points ):
+    ''' Grid for the (mStop, mLSP) points with NaN for all limits '''
+    grid = np.zeros( len(points), dtype = gridDtype )
+    for c in columns:
+        grid[c] = np.nan
+    if len(points):
+        points = np.array( points, dtype = np.float64 )
+        grid['stop'], grid['lsp'] = points[:,0], points[:,1]
+    return grid
+
+def fromResults( results ):
+    ''' Grid from [ ( (mStop, mLSP), {quantile:limit, 'signif':significance} ), ... ] as returned by the wrapper of run_limit.py '''
+    grid = emptyGrid( [ s[:2] for s, res in results ] )
+    for i, ( s, res ) in enumerate( results ):
+        for c in quantiles:
+            if c in res: grid[c][i] = res[c]
+        for key in [ 'significance', 'signif' ]:
+            if res.get( key ) is not None: grid['significance'][i] = res[key]
+    return grid
+
+def fromDataFrame( df ):
+    ''' Grid from a DataFrame with the columns stop, lsp, the quantiles and significance (e.g. limitResults.pkl of run_combination.py) '''
+    grid = emptyGrid( zip( df['stop'].tolist(), df['lsp'].tolist() ) )
+    for c in quantiles + [ 'significance' ]:
+        if c in df: grid[c] = df[c].values
+    return grid
+
+def fromFiles( points, filenames, signifFilenames = None ):
+    ''' Grid from the combine result files (higgsCombine*.root) of the points, read in one go. Missing files give NaN. '''
+    grid = emptyGrid( points )
+    fileIndex, quantile, limit = readLimitArrays( filenames )
+    quantile = np.round( quantile, 3 )
+    for c in quantiles:
+        sel = quantile == float(c)
+        grid[c][ fileIndex[sel] ] = limit[sel]
+    if signifFilenames is not None:
+        fileIndex, quantile, limit = readLimitArrays( signifFilenames )
+        grid['significance'][ fileIndex ] = limit
+    return grid
+
+def save( grid, filename ):
+    np.save( filename, grid )
+    logger.info( "Written limit grid with %i points to %s", len(grid), filename )
+
+def load( filename ):
+    return np.load( filename )
+
+def cached( cacheFile, inputs, build, points = None ):
+    ''' Grid stored in cacheFile, reused as long as none of the inputs is newer (and it has the points, if given). Otherwise build() is stored. '''
+    inputs = [ f for f in inputs if os.path.exists( f ) ]
+    if os.path.exists( cacheFile ) and all( os.path.getmtime( f ) <= os.path.getmtime( cacheFile ) for f in inputs ):
+        grid = load( cacheFile )
+        if points is None or ( len(grid) == len(points) and np.array_equal( np.column_stack( [ grid['stop'], grid['lsp'] ] ), np.array( points, dtype = np.float64 ).reshape( -1, 2 ) ) ):
+            return grid
+        logger.info( "Points of %s changed.", cacheFile )
+    else:
+        logger.info( "%s is missing or older than its inputs.", cacheFile )
+    grid = build()
+    save( grid, cacheFile )
+    return grid
+
+def cachedFromFiles( cacheFile, points, filenames, signifFilenames = None ):
+    ''' fromFiles, stored in cacheFile and reused as long as no result file is newer '''
+    return cached( cacheFile, filenames + ( signifFilenames or [] ), lambda: fromFiles( points, filenames, signifFilenames ), points = points )
+
+def scaled( grid, factors ):
+    ''' Copy of the grid with the limits and significances of each point multiplied by factors '''
+    grid    = grid.copy()
+    factors = np.asarray( factors, dtype = np.float64 )
+    for c in quantiles + [ 'significance' ]:
+        grid[c] *= factors
+    return grid
+
+def filled( grid, other ):
+    ''' Copy of the grid with NaN entries taken from other (same points) '''
+    grid = grid.copy()
+    for c in quantiles + [ 'significance' ]:
+        missing = np.isnan( grid[c] )
+        grid[c][missing] = other[c][missing]
+    return grid
+
+def toDataFrame( grid ):
+    ''' pandas DataFrame with the same columns as the results_df of run_combination.py '''
+    import pandas as pd
+    return pd.DataFrame( grid )
+
+def toGraph2D( name, x, y, z ):
+    ''' TGraph2D of the points with finite z '''
+    x, y, z = [ np.asarray( a, dtype = np.float64 ) for a in [ x, y, z ] ]
+    finite  = np.isfinite( z )
+    x, y, z = [ np.ascontiguousarray( a[finite] ) for a in [ x, y, z ] ]
+    result = ROOT.TGraph2D( len(z), x, y, z ) if len(z) else ROOT.TGraph2D()
+    result.SetName(name)
+    result.SetTitle(name)
+    if len(z):
+        h = result.GetHistogram()
+        h.SetMinimum(z.min())
+        h.SetMaximum(z.max())
+        c = ROOT.TCanvas()
+        result.Draw()
+        del c
+    return result
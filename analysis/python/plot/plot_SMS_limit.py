@@ -32,21 +32,6 @@ parser.add_option("--unblind",          action="store_true",  help="Use real dat
 parser.add_option("--smooth",           action="store_true",  help="Use real data?")
 (options, args) = parser.parse_args()
 
-def toGraph2D(name,title,length,x,y,z):
-    result = ROOT.TGraph2D(length)
-    result.SetName(name)
-    result.SetTitle(title)
-    for i in range(length):
-        result.SetPoint(i,x[i],y[i],z[i])
-    h = result.GetHistogram()
-    h.SetMinimum(min(z))
-    h.SetMaximum(max(z))
-    c = ROOT.TCanvas()
-    result.Draw()
-    del c
-    #res = ROOT.TGraphDelaunay(result)
-    return result
-
 def toGraph(name,title,length,x,y):
     result = ROOT.TGraph(length)
     result.SetName(name)
@@ -103,7 +88,10 @@ if options.signal == 'T2bW':
 import pickle
 import pandas as pd
 import numpy as np
-results = pickle.load(file(defFile.replace('root','pkl'), 'r'))
+import StopsDilepton.analysis.limitGrid as limitGrid
+# the grid of the limits is much faster to load than the pickled DataFrame, it is made again if limitResults.pkl or .root are newer
+results = limitGrid.toDataFrame(limitGrid.cached(defFile.replace('.root','.npy'), [defFile, defFile.replace('.root','.pkl')],
+                                                 lambda: limitGrid.fromDataFrame(pickle.load(file(defFile.replace('root','pkl'), 'r')))))
 
 results_df = results
 #results_df = results_df[(results_df['stop']-results_df['lsp'])<=174]
@@ -137,11 +125,11 @@ if options.signal == 'T8bbllnunu_XCha0p5_XSlep0p5':
     #results_df = results_df[(results_df['stop']%25==0)]
     #results_df = results_df[(results_df['lsp']%25==0)]
 
-exp_graph       = toGraph2D('exp',      'exp',      len(results_df['stop'].tolist()),results_df['stop'].tolist(),results_df['lsp'].tolist(),results_df['0.500'].tolist())
-exp_up_graph    = toGraph2D('exp_up',   'exp_up',   len(results_df['stop'].tolist()),results_df['stop'].tolist(),results_df['lsp'].tolist(),results_df['0.840'].tolist())
-exp_down_graph  = toGraph2D('exp_down', 'exp_down', len(results_df['stop'].tolist()),results_df['stop'].tolist(),results_df['lsp'].tolist(),results_df['0.160'].tolist())
-obs_graph       = toGraph2D('obs',      'obs',      len(results_df['stop'].tolist()),results_df['stop'].tolist(),results_df['lsp'].tolist(),results_df['-1.000'].tolist())
-signif_graph    = toGraph2D('signif',   'signif',   len(results_df['stop'].tolist()),results_df['stop'].tolist(),results_df['lsp'].tolist(),results_df['significance'].tolist())
+exp_graph       = limitGrid.toGraph2D('exp',      results_df['stop'].values, results_df['lsp'].values, results_df['0.500'].values)
+exp_up_graph    = limitGrid.toGraph2D('exp_up',   results_df['stop'].values, results_df['lsp'].values, results_df['0.840'].values)
+exp_down_graph  = limitGrid.toGraph2D('exp_down', results_df['stop'].values, results_df['lsp'].values, results_df['0.160'].values)
+obs_graph       = limitGrid.toGraph2D('obs',      results_df['stop'].values, results_df['lsp'].values, results_df['-1.000'].values)
+signif_graph    = limitGrid.toGraph2D('signif',   results_df['stop'].values, results_df['lsp'].values, results_df['significance'].values)
 
 graphs["exp"]       = exp_graph
 graphs["exp_up"]    = exp_up_graph
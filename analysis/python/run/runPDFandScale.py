@@ -22,6 +22,7 @@ parser.add_option('--skipCentral',          dest="skipCentral", default = False,
 parser.add_option('--nJobs',                dest="nJobs", default=1, type="int", action = "store", help="How many jobs?")
 parser.add_option('--job',                  dest="job", default=0, type="int", action = "store", help="Which job?")
 parser.add_option('--dpm',                  dest='dpm',         default=False,      action='store_true', help='Use dpm?')
+parser.add_option('--variationMatrix',      dest='variationMatrix', default=False,  action='store_true', help='Fill all regions, channels and weight variations in one pass over the sample and cache the yield matrix?')
 (options, args) = parser.parse_args()
 
 # Logging
@@ -36,6 +37,7 @@ import os
 import sys
 import pickle
 import math
+import numpy as np
 
 #RootTools
 from RootTools.core.standard import *
@@ -323,10 +325,11 @@ estimate = MCBasedEstimate(name=sample.name, sample=sample )
 estimate.initCache(cacheDir)
 
 ## Results DB for scale and PDF uncertainties
+# --combine adds the results of all regions, they are committed in batches (the rest at exit)
 
-PDF_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "PDF", ["name", "region", "CR", "channel", "PDFset"])
-scale_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "scale", ["name", "region", "CR", "channel", "PDFset"])
-PS_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "PSscale", ["name", "region", "CR", "channel", "PDFset"])
+PDF_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "PDF", ["name", "region", "CR", "channel", "PDFset"], batchSize=50)
+scale_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "scale", ["name", "region", "CR", "channel", "PDFset"], batchSize=50)
+PS_cache = resultsDB(cacheDir+'PDFandScale_unc.sq', "PSscale", ["name", "region", "CR", "channel", "PDFset"], batchSize=50)
 
 print cacheDir+'PDFandScale_unc.sq'
 
@@ -348,9 +351,32 @@ setupTT.regions     = [regionsLegacy[0]]
 
 setups = [setupSR,setupTTZ1,setupTTZ2,setupTTZ3,setupTTZ4,setupTTZ5,setupTT,setupDYVV]
 
+setupSR.channels   = ['SF','EMu']
+setupDYVV.channels = ['SF']
+setupTTZ1.channels = ['all']
+setupTTZ2.channels = ['all']
+setupTTZ3.channels = ['all']
+setupTTZ4.channels = ['all']
+setupTTZ5.channels = ['all']
+setupTT.channels = ['SF','EMu']
+
+# the weights used by pdfAndScaleUncertainties (central, scale, PDF, alpha_s), the central one first
+allVariations = []
+for var in [LHEweight_original] + scale_variations + PDF_variations + aS_variations:
+    if var not in allVariations: allVariations.append(var)
+variationIndex = { var:i for i, var in enumerate(allVariations) }
+
+# inclusive yield and all regions/channels of the uncertainties
+combineCells = [(noRegions[0], 'all', setupIncl)] + [ (region, c, setup) for setup in setups for c in setup.channels for region in setup.regions ]
+matrixCacheFile = os.path.join(cacheDir, "%s_variationMatrix.npz"%sample.name)
+
 jobs=[]
 
-if not options.skipCentral:
+if options.variationMatrix and not options.combine:
+    # one pass over the sample for all cells and variations, --selectRegion and --nJobs are not needed
+    estimate.variationYields(combineCells, allVariations, cacheFile=matrixCacheFile, overwrite=options.overwrite)
+
+elif not options.skipCentral:
     # First run over seperate channels
     jobs.append((noRegions[0], 'all', setupIncl))
     jobs.append((noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[LHEweight_original]})))
@@ -362,7 +388,7 @@ if not options.skipCentral:
         jobs.append((noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[var]})))
 
 
-if not options.combine:
+if not options.combine and not options.variationMatrix:
     for region in regions:
         logger.info("Queuing jobs for region %s", region)
         for c in ['EE', 'MuMu', 'EMu']:
@@ -446,120 +472,103 @@ if not options.combine:
     
     logger.info("All done.")
 
-setupSR.channels   = ['SF','EMu']
-setupDYVV.channels = ['SF']
-setupTTZ1.channels = ['all']
-setupTTZ2.channels = ['all']
-setupTTZ3.channels = ['all']
-setupTTZ4.channels = ['all']
-setupTTZ5.channels = ['all']
-setupTT.channels = ['SF','EMu']
-
 
 PDF_unc     = []
 Scale_unc   = []
 PS_unc      = []
 
+def variationYields(region, c, setup):
+    ''' Central values and uncertainties of the yield for all weights in allVariations '''
+    if options.variationMatrix:
+        return matrixYields[combineCells.index((region, c, setup))]
+    res = [ estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[var]})) for var in allVariations ]
+    return np.array([ r.val for r in res ]), np.array([ r.sigma for r in res ])
+
+def pdfAndScaleUncertainties(inclYields, yields):
+    ''' Scale envelope, PDF (replicas or hessian) and alpha_s uncertainties from the yields of all variations
+        in a region (yields) and inclusive (inclYields). The varied yields are normalized to the inclusive central yield unless --noKeepNorm.
+    '''
+    inclVal, inclSigma = inclYields
+    val, sigma         = yields
+    index = lambda variations: np.array([ variationIndex[var] for var in variations ], dtype=int)
+
+    def normalization(iCentral, iVariations):
+        ''' inclusive central yield over the inclusive yields of the variations, 1 with --noKeepNorm '''
+        if options.noKeepNorm: return 1
+        zero = inclVal[iVariations] == 0
+        if zero.any():
+            raise ZeroDivisionError("Inclusive yield is 0 for %s"%", ".join(allVariations[i] for i in iVariations[zero]))
+        return inclVal[iCentral]/inclVal[iVariations]
+
+    res = {'sigma_central':u_float(val[variationIndex[LHEweight_original]], sigma[variationIndex[LHEweight_original]])}
+    central = res['sigma_central'].val
+
+    # scale: maximum relative deviation
+    iScale = index(scale_variations)
+    norm   = normalization(variationIndex[LHEweight_original], iScale)
+    scales = np.abs( ( val[iScale]*norm - central ) / central ) if central > 0 else np.ones(len(iScale))
+    res['scale_rel'] = scales.max()
+
+    # PDF
+    res['delta_sigma'] = 0
+    if len(PDF_variations)>0:
+        iCentralPDF = variationIndex[PDF_variations[0]]
+        iPDF        = index(PDF_variations)
+        norm        = normalization(iCentralPDF, iPDF)
+        ## For replicas, just get a list of all sigmas, sort it and then get the 68% interval
+        deltas      = np.sort( val[iPDF]*norm )
+        ## recommendation for hessian is to have delta_sigma = sum_k=1_N( (sigma_k - sigma_0)**2 )
+        ## so I keep the norm for both sigma_k and sigma_0 to obtain the acceptance uncertainty. Correct?
+        delta_squared = ( ( val[iPDF] - val[iCentralPDF] )**2 ).sum()
+        if PDFType == "replicas":
+            # get the 68% interval
+            upper = len(deltas)*84/100-1
+            lower = len(deltas)*16/100 - 1
+            res['delta_sigma'] = (deltas[upper]-deltas[lower])/2
+        elif PDFType == "hessian":
+            res['delta_sigma'] = math.sqrt(delta_squared)
+
+    # alpha_s, recommendation is to multiply uncertainty by 1.5
+    res['delta_sigma_alphaS'] = 0
+    res['delta_sigma_alphaS_rel'] = 0
+    if len(aS_variations)>0:
+        iAS       = index(aS_variations)
+        norm      = normalization(variationIndex[PDF_variations[0]], iAS)
+        deltas_as = val[iAS]*norm
+        scale = 1.5 if PDFset.count("NNPDF") else 1.0
+        res['delta_sigma_alphaS'] = scale * ( deltas_as[0] - deltas_as[1] ) / 2.
+        # add alpha_s and PDF in quadrature
+        res['delta_sigma_total'] = math.sqrt( res['delta_sigma_alphaS']**2 + res['delta_sigma']**2 )
+        if central != 0: res['delta_sigma_alphaS_rel'] = res['delta_sigma_alphaS']/central
+    else:
+        res['delta_sigma_total'] = res['delta_sigma']
+
+    # make it relative wrt central value in region
+    res['delta_sigma_rel'] = res['delta_sigma']/central if central != 0 else 0.001 # eh wurscht
+    return res
+
 if options.combine:
+    if options.variationMatrix:
+        matrixYields = estimate.variationYields(combineCells, allVariations, cacheFile=matrixCacheFile)
+
+    logger.debug("Getting inclusive (noRegions) yield")
+    inclYields = variationYields(noRegions[0], 'all', setupIncl)
+
     for setup in setups:
         for c in setup.channels:#allChannels:
         
             for region in setup.regions:
                 logger.info("Region: %s", region)
-                
-                scales = []
-                showerScales = []
-                deltas = []
-                delta_squared = 0
-                # central yield inclusive and in region
-                logger.debug("Getting inclusive (noRegions) yield")
-                sigma_incl_central  = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[LHEweight_original]}))
-                logger.debug("Getting yield for region with LHEweight_original")
-                sigma_central       = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[LHEweight_original]}))
-                logger.debug("Getting yield for region with centralWeight")
-                sigma_centralWeight = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[centralWeight]}))
-
-                for var in scale_variations:
-                    #print var
-                    logger.debug("Getting inclusive yield with varied weight")
-                    simga_incl_reweight = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[var]}))
-                    norm = sigma_incl_central/simga_incl_reweight if not options.noKeepNorm else 1
-                    
-                    logger.debug("Getting yield for region with varied weight")
-                    sigma_reweight  = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[var]}))
-                    sigma_reweight_acc = sigma_reweight * norm
-                    
-                    #logger.info("Using norm of %s", norm)
-                    unc = abs( ( sigma_reweight_acc - sigma_central) / sigma_central ) if sigma_central > 0 else u_float(1)
-                    scales.append(unc.val)
-                
-                scale_rel = max(scales)
-
-                ## PDF stuff
-                #sigma_incl_central_PDF  = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[LHEweight_original_PDF]}))
-                logger.debug("sigma_incl_central_PDF")
-                sigma_incl_central_PDF  = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[PDF_variations[0]]})) # changed from (1)
-                logger.debug("sigma_centralWeight_PDF")
-                sigma_centralWeight_PDF = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[PDF_variations[0]]}))
-                for i, var in enumerate(PDF_variations):
-                    # calculate x-sec noramlization
-                    logger.debug("simga_incl_reweight")
-                    simga_incl_reweight = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[var]}))
-                    norm = sigma_incl_central_PDF/simga_incl_reweight if not options.noKeepNorm else 1
-
-                    logger.debug("simga_reweight")
-                    sigma_reweight  = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[var]}))
-                    sigma_reweight_acc = sigma_reweight * norm
-
-                    ## For replicas, just get a list of all sigmas, sort it and then get the 68% interval
-                    deltas.append(sigma_reweight_acc.val)
-                    ## recommendation for hessian is to have delta_sigma = sum_k=1_N( (sigma_k - sigma_0)**2 )
-                    ## so I keep the norm for both sigma_k and sigma_0 to obtain the acceptance uncertainty. Correct?
-                    delta_squared += ( sigma_reweight.val - sigma_centralWeight_PDF.val )**2
-                    #print i, delta_squared
-                    #print sigma_reweight.val, sigma_centralWeight_PDF.val
-                
-                deltas = sorted(deltas)
-
-                # calculate uncertainty
-                delta_sigma = 0
-                if PDFType == "replicas" and len(deltas)>0:
-                    # get the 68% interval
-                    upper = len(deltas)*84/100-1
-                    lower = len(deltas)*16/100 - 1
-                    delta_sigma = (deltas[upper]-deltas[lower])/2
-                elif PDFType == "hessian":
-                    delta_sigma = math.sqrt(delta_squared)
-
-                # recommendation is to multiply uncertainty by 1.5
-                deltas_as = []
-                for var in aS_variations:
-                    simga_incl_reweight = estimate.cachedEstimate(noRegions[0], 'all', setupIncl.sysClone(sys={'reweight':[var]}))
-                    norm = sigma_incl_central_PDF/simga_incl_reweight if not options.noKeepNorm else 1
-                    
-                    sigma_reweight  = estimate.cachedEstimate(region, c, setup.sysClone(sys={'reweight':[var]}))
-                    sigma_reweight_acc = sigma_reweight * norm
-
-                    deltas_as.append(sigma_reweight_acc.val)
-
-                if len(deltas_as)>0:
-                    scale = 1.5 if PDFset.count("NNPDF") else 1.0
-                    delta_sigma_alphaS = scale * ( deltas_as[0] - deltas_as[1] ) / 2.
-
-                    # add alpha_s and PDF in quadrature
-                    delta_sigma_total = math.sqrt( delta_sigma_alphaS**2 + delta_sigma**2 )
-                    try:
-                        delta_sigma_alphaS_rel = delta_sigma_alphaS/sigma_central.val
-                    except:
-                        0.001
-                else:
-                    delta_sigma_total = delta_sigma
 
-                # make it relative wrt central value in region
-                try:
-                    delta_sigma_rel = delta_sigma/sigma_central.val
-                except:
-                    delta_sigma_rel = 0.001 # eh wurscht
+                showerScales = []
+                res = pdfAndScaleUncertainties(inclYields, variationYields(region, c, setup))
+                sigma_central          = res['sigma_central']
+                scale_rel              = res['scale_rel']
+                delta_sigma            = res['delta_sigma']
+                delta_sigma_alphaS     = res['delta_sigma_alphaS']
+                delta_sigma_alphaS_rel = res['delta_sigma_alphaS_rel']
+                delta_sigma_total      = res['delta_sigma_total']
+                delta_sigma_rel        = res['delta_sigma_rel']
 
                 if delta_sigma_rel > 1: print "############# ALERTA #################", delta_sigma_rel
 
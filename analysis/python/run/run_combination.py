@@ -417,6 +417,8 @@ obs_graph = toGraph2D('obs','obs',len(bulk_df['stop'].tolist()),bulk_df['stop'].
 obs_comp = toGraph2D('obs_comp','obs_comp',len(comp_df['stop'].tolist()),comp_df['stop'].tolist(),comp_df['lsp'].tolist(),comp_df['-1.000'].tolist())
 
 pickle.dump(results_df, file(limitResultsFilename.replace('root', 'pkl'), 'w'))
+import StopsDilepton.analysis.limitGrid as limitGrid
+limitGrid.save(limitGrid.fromResults(results), limitResultsFilename.replace('.root', '.npy'))
 
 outfile = ROOT.TFile(limitResultsFilename, "recreate")
 scatter        .Write()
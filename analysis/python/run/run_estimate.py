@@ -6,7 +6,7 @@ parser.add_option("--noSystematics",         dest="noSystematics",         defau
 parser.add_option("--selectEstimator",       dest="selectEstimator",       default=None,                action="store",      help="select estimator?")
 parser.add_option("--selectRegion",          dest="selectRegion",          default=None, type="int",    action="store",      help="select region?")
 parser.add_option("--year",                  dest="year",                  default=2016, type="int",    action="store",      help="Which year?")
-#parser.add_option("--nThreads",              dest="nThreads",              default=8, type="int",       action="store",      help="How many threads?")
+parser.add_option("--nThreads",              dest="nThreads",              default=1, type="int",       action="store",      help="How many worker processes? Results are written to the cache by the main process.")
 parser.add_option('--logLevel',              dest="logLevel",              default='INFO',              action='store',      help="log level?", choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'])
 parser.add_option("--control",               dest="control",               default=None,                action='store',      choices=[None, "DY", "VV", "DYVV", "TTZ1", "TTZ2", "TTZ3", "TTZ4", "TTZ5"], help="For CR region?")
 parser.add_option("--useGenMet",             dest="useGenMet",             default=False,               action='store_true', help="use genMET instead of recoMET, used for signal studies")
@@ -14,6 +14,7 @@ parser.add_option("--overwrite",             dest="overwrite",             defau
 parser.add_option("--aggregate",             dest="aggregate",             default=False,               action='store_true', help="run over aggregated signal regions")
 parser.add_option("--all",                   dest="all",                   default=False,               action='store_true', help="Run over all SR and CR?")
 parser.add_option('--dpm',                   dest='dpm',                   default=False,               action='store_true', help='Use dpm?')
+parser.add_option('--singlePass',            dest='singlePass',            default=False,               action='store_true', help='Compute all regions, channels and systematics reading each sample only once?')
 
 (options, args) = parser.parse_args()
 
@@ -116,14 +117,28 @@ for channel in (trilepChannels if (options.control and options.control.count('TT
             else:                 jobs.extend(estimate.getBkgSysJobs(r, channel, setup, puUpOrDown = puUpOrDown))
 
 
-#if options.noMultiThreading: 
-results = map(wrapper, jobs)
-#else:
-#    from multiprocessing import Pool
-#    pool = Pool(processes=options.nThreads)
-#    results = pool.map(wrapper, jobs)
-#    pool.close()
-#    pool.join()
+def worker(i):
+        # jobs are inherited from the parent process, only the index and the result are pickled
+        r,channel,setup = jobs[i]
+        res, new = estimate.computeEstimate(r, channel, setup, overwrite=options.overwrite)
+        return i, res, new
+
+if options.singlePass and hasattr(estimate, 'cachedEstimates'):
+    results = zip([estimate.uniqueKey(*job) for job in jobs], estimate.cachedEstimates(jobs, overwrite=options.overwrite))
+elif options.nThreads > 1:
+    from multiprocessing import Pool
+    pool = Pool(processes=options.nThreads)
+    results = []
+    # imap keeps the order of the jobs, the main process is the only one writing to the cache
+    for i, res, new in pool.imap(worker, range(len(jobs)), chunksize=1):
+        r,channel,setup_ = jobs[i]
+        res = estimate.storeEstimate(r, channel, setup_, res, write=new)
+        results.append( (estimate.uniqueKey(r, channel, setup_), res) )
+        logger.debug('Done with job %i/%i', i+1, len(jobs))
+    pool.close()
+    pool.join()
+else:
+    results = map(wrapper, jobs)
 
 
 for channel in (['all'] if ((options.control and options.control.count('TTZ')) or options.aggregate) else ['SF','all']):
@@ -136,4 +151,5 @@ for channel in (['all'] if ((options.control and options.control.count('TTZ')) o
             else:                 map(lambda args:estimate.cachedEstimate(*args, save=True, overwrite=options.overwrite), estimate.getBkgSysJobs(r, channel, setup, puUpOrDown = puUpOrDown))
         logger.info('Done with region: %s', r)
     logger.info('Done with channel: %s', channel)
+if hasattr(estimate, 'memo'): logger.info('In-memory estimate cache: %s', estimate.memo.stats())
 logger.info('Done.')
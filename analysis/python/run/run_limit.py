@@ -47,6 +47,8 @@ argParser.add_argument("--removeLowStatSignal", default = False, action = "store
 argParser.add_argument("--extension",      default = '', action = "store", help="Extension to dir name?")
 argParser.add_argument("--year",           default=2016,     action="store",      help="Which year?")
 argParser.add_argument("--dpm",            default= False,   action="store_true",help="Use dpm?",)
+argParser.add_argument("--nCombineJobs",   default=1,        action="store",      type=int,   help="Number of combine fits to run at the same time")
+argParser.add_argument("--combineTimeout", default=None,     action="store",      type=float, help="Kill combine fits after this many seconds")
 args = argParser.parse_args()
 
 removeSR = [ int(r) for r in args.removeSR ] if len(args.removeSR)>0 else False
@@ -214,6 +216,16 @@ limitCache    = Cache(cacheFileName, verbosity=2)
 cacheFileNameS  = os.path.join(limitDir, 'calculatedSignifs')
 signifCache     = Cache(cacheFileNameS, verbosity=2)
 
+# Run the fits of all mass points in parallel (the cards are still written one by one)
+if args.nCombineJobs > 1 and args.only is None and not args.dryRun:
+    from StopsDilepton.tools.cardFileWriter.combineDriver import CombineDriver, readLimitTrees
+    combineDriver = CombineDriver(nWorkers = args.nCombineJobs, timeout = args.combineTimeout)
+else:
+    combineDriver = None
+
+# (card, xSecScale) of the fitted points
+fitInputs = {}
+
 fastSim = False # default value
 if   args.signal == "T2tt" and not args.fullSim:    fastSim = True
 elif args.signal == "T2bW":                         fastSim = True
@@ -260,6 +272,7 @@ def wrapper(s):
     #            xSecScale = 0.01
     c = cardFileWriter.cardFileWriter()
     c.releaseLocation = os.path.abspath('.') # now run directly in the run directory
+    c.combineTimeout  = args.combineTimeout
 
     logger.info("Running over signal: %s", s.name)
 
@@ -681,6 +694,16 @@ def wrapper(s):
     # limit
     if args.dryRun:
         return None
+    # the limit grid is read from the result files next to the card
+    fitInputs[sConfig] = ( cardFileName, xSecScale )
+    if combineDriver is not None:
+        # fits run in the background, the results are collected with collect
+        # the jobs return the result files, they are read together in collect
+        limitJob  = combineDriver.calcLimit(cardFileName, readResult = False)
+        signifJob = combineDriver.calcSignif(cardFileName, readResult = False) if not (useCache and not overWrite and signifCache.contains(sConfig)) else None
+        nuisancesJob = combineDriver.calcNuisances(cardFileName) if not args.skipFitDiagnostics else None
+        return sConfig, xSecScale, cardFileName, limitJob, signifJob, nuisancesJob
+
     if useCache and not overWrite and limitCache.contains(sConfig):
         res = limitCache.get(sConfig)
     res = c.calcLimit(cardFileName)
@@ -874,6 +897,9 @@ def wrapper(s):
                 print "{:10}{:<10.2f}".format("triBoson", triBoson_prefit_hSR/total)
 
 
+    return finish(sConfig, res, xSecScale)
+
+def finish(sConfig, res, xSecScale):
     if xSecScale != 1:
         for k in res:
             res[k] *= xSecScale
@@ -905,6 +931,29 @@ def wrapper(s):
           return None
 
 
+def collect(jobs):
+    ''' Wait for the fits that were submitted to the combineDriver, the limit trees of all mass points are read in one go '''
+    for sConfig, xSecScale, cardFileName, limitJob, signifJob, nuisancesJob in jobs:
+        if nuisancesJob is not None and not nuisancesJob.get():
+            raise RuntimeError( "FitDiagnostics failed for %s" % cardFileName )
+    # failed jobs return None and get empty results
+    limits  = readLimitTrees( [ job[3].get() or '' for job in jobs ] )
+    signifs = readLimitTrees( [ job[4].get() or '' if job[4] is not None else '' for job in jobs ] )
+
+    results = []
+    for ( sConfig, xSecScale, cardFileName, limitJob, signifJob, nuisancesJob ), res, signif in zip( jobs, limits, signifs ):
+        limitCache.add(sConfig, res)
+        if not res:
+            logger.error("Limit calculation failed for %r", sConfig)
+            continue
+        if signifJob is None:
+            res.update(signifCache.get(sConfig))
+        elif signif:
+            res['signif'] = signif['-1.000']
+            signifCache.add(sConfig,res)
+        results.append(finish(sConfig, res, xSecScale))
+    return results
+
 ######################################
 # Load the signals and run the code! #
 ######################################
@@ -1036,7 +1085,12 @@ for i, j in enumerate(jobs):
         print "~removing ", j.name
         del jobs[i]
 
-results = map(wrapper, jobs)
+if combineDriver is not None:
+    submitted = [j for j in map(wrapper, jobs) if j]
+    combineDriver.join()
+    results = collect(submitted)
+else:
+    results = map(wrapper, jobs)
 results = [r for r in results if r]
 
 
@@ -1052,51 +1106,25 @@ else:
     os.makedirs(os.path.join(baseDir, 'limits', args.signal, limitPrefix))
   limitResultsFilename = os.path.join(baseDir, 'limits', args.signal, limitPrefix,'limitResults.root')
 
-## new try, other thing is buggy
-def toGraph2D(name,title,length,x,y,z):
-    result = ROOT.TGraph2D(length)
-    result.SetName(name)
-    result.SetTitle(title)
-    for i in range(length):
-        result.SetPoint(i,x[i],y[i],z[i])
-    h = result.GetHistogram()
-    h.SetMinimum(min(z))
-    h.SetMaximum(max(z))
-    c = ROOT.TCanvas()
-    result.Draw()
-    del c
-    #res = ROOT.TGraphDelaunay(result)
-    return result
+import numpy as np
+import StopsDilepton.analysis.limitGrid as limitGrid
 
 if not args.signal == 'ttHinv':
-    mStop_list = []
-    mLSP_list  = []
-    exp_list   = []
-    obs_list   = []
-    exp_up_list   = []
-    exp_down_list   = []
-    
-    for r in results:
-        s, res = r
-        mStop, mNeu = s
-        #if mStop%50>0: continue
-        #if mNeu%50>0 and not mNeu>(mStop-125): continue
-        mStop_list.append(mStop)
-        mLSP_list.append(mNeu)
-        exp_list.append(res['0.500'])
-        exp_up_list.append(res['0.160'])
-        exp_down_list.append(res['0.840'])
-        obs_list.append(res['-1.000'])
-    
-    scatter         = ROOT.TGraph(len(mStop_list))
+    # limits and significances of all points read from the result files in one go, reused as long as no file changed
+    points = [ s for s, res in results ]
+    cards  = [ fitInputs[s][0].replace('.txt', '') for s in points ]
+    grid   = limitGrid.cachedFromFiles(os.path.join(limitDir, 'limitGrid.npy'), points, [ c+'.root' for c in cards ], [ c+'_signif.root' for c in cards ])
+    grid   = limitGrid.scaled(grid, [ fitInputs[s][1] for s in points ])
+    # significances from the cache of earlier runs have no result file
+    grid   = limitGrid.filled(grid, limitGrid.fromResults(results))
+
+    scatter         = ROOT.TGraph(len(grid), np.ascontiguousarray(grid['stop']), np.ascontiguousarray(grid['lsp'])) if len(grid) else ROOT.TGraph()
     scatter.SetName('scatter')
-    for i in range(len(mStop_list)):
-        scatter.SetPoint(i,mStop_list[i],mLSP_list[i])
-    
-    exp_graph       = toGraph2D('exp','exp',len(mStop_list),mStop_list,mLSP_list,exp_list)
-    exp_up_graph    = toGraph2D('exp_up','exp_up',len(mStop_list),mStop_list,mLSP_list,exp_up_list)
-    exp_down_graph  = toGraph2D('exp_down','exp_down',len(mStop_list),mStop_list,mLSP_list,exp_down_list)
-    obs_graph       = toGraph2D('obs','obs',len(mStop_list),mStop_list,mLSP_list,obs_list)
+
+    exp_graph       = limitGrid.toGraph2D('exp',      grid['stop'], grid['lsp'], grid['0.500'])
+    exp_up_graph    = limitGrid.toGraph2D('exp_up',   grid['stop'], grid['lsp'], grid['0.160'])
+    exp_down_graph  = limitGrid.toGraph2D('exp_down', grid['stop'], grid['lsp'], grid['0.840'])
+    obs_graph       = limitGrid.toGraph2D('obs',      grid['stop'], grid['lsp'], grid['-1.000'])
     
     outfile = ROOT.TFile(limitResultsFilename, "recreate")
     scatter        .Write()
@@ -1105,6 +1133,9 @@ if not args.signal == 'ttHinv':
     exp_up_graph   .Write()
     obs_graph      .Write()
     outfile.Close()
+
+    # grid of all quantiles for plot_SMS_limit.py
+    limitGrid.save(grid, limitResultsFilename.replace('.root', '.npy'))
     
     print limitResultsFilename
 
@@ -14,6 +14,7 @@ from StopsDilepton.tools.user            import plot_directory
 from StopsDilepton.tools.helpers         import deltaPhi
 from Analysis.Tools.metFilters            import getFilterCut
 from StopsDilepton.tools.cutInterpreter  import cutInterpreter
+from StopsDilepton.plots.channelSelection import ChannelSelection
 #from StopsDilepton.tools.RecoilCorrector import RecoilCorrector
 from StopsDilepton.tools.mt2Calculator   import mt2Calculator
 from Analysis.Tools.puProfileCache import *
@@ -283,105 +284,111 @@ def getLeptonSelection( mode ):
 #nTrueInt12fb_puRW        = getReweightingFunction(data="PU_2016_12000_XSecCentral", mc="Spring16")
 
 #
-# Loop over channels
+# Fill all channels in one loop over each sample
 #
-yields     = {}
-allPlots   = {}
-allModes   = ['mumu','mue','ee']
-for index, mode in enumerate(allModes):
-  yields[mode] = {}
-  if args.year == 2016:
-    data_sample = Run2016
-    data_sample.texName = "data (2016)"
-  elif args.year == 2017:
-    data_sample = Run2017
-    data_sample.texName = "data (2017)"
-  elif args.year == 2018:
-    data_sample = Run2018
-    data_sample.texName = "data (2018)"
-
-  data_sample.setSelectionString([getFilterCut(isData=True, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
-  if args.preHEM:
-    data_sample.addSelectionString("run<319077")
-  if args.postHEM:
-    data_sample.addSelectionString("run>=319077")
-  data_sample.name           = "data"
-  data_sample.read_variables = ["event/I","run/I"]
-  data_sample.style          = styles.errorStyle(ROOT.kBlack)
-  data_sample.scale          = 1.
-  lumi_scale                 = data_sample.lumi/1000
-  if args.preHEM:   lumi_scale *= 0.37
-  if args.postHEM:  lumi_scale *= 0.63
-
-  if args.noData:
-    if args.year == 2016: lumi_scale = 35.9
-    elif args.year == 2017: lumi_scale = 41.9
-    elif args.year == 2018: lumi_scale = 60.0
-  weight_ = lambda event, sample: event.weight
-
-
-  for sample in mc: sample.style = styles.fillStyle(sample.color)
-
-  for sample in mc + signals:
-    sample.scale          = lumi_scale
-   #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-   #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonHIPSF*event.reweightDilepTriggerBackup*nTrueInt27fb_puRW(event.nTrueInt)*event.reweightBTag_SF
-    sample.read_variables = ['reweightPU/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F', 'GenMET_pt/F', 'GenMET_phi/F']
-    #if (('ttjets' in sample.name) or ('ttlep' in sample.name)) and args.isr:
-    #    sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F', 'reweight_nISR/F']
-    #    sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU*event.reweightLeptonTrackingSF*event.reweight_nISR
-    #else:
-    if args.reweightPU:
-        # Need individual pu reweighting functions for each sample in 2017, so nTrueInt_puRW is only defined here
-        if args.year == 2017:
-            logger.info("Getting PU profile and weight for sample %s", sample.name)
-            puProfiles = puProfile( source_sample = sample )
-            mcHist = puProfiles.cachedTemplate( selection="( 1 )", weight='genWeight', overwrite=False ) # use genWeight for amc@NLO samples. No problems encountered so far
-            nTrueInt_puRW = getReweightingFunction(data="PU_2017_41860_XSec%s"%args.reweightPU, mc=mcHist)
-        # Use the nTrueInt_puRW function
-        sample.weight         = lambda event, sample: nTrueInt_puRW(event.Pileup_nTrueInt) * event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
-    else:
-        sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
-    sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
-
-  for sample in signals:
-      if args.signal == "T2tt" or args.signal == "T8bbllnunu" or args.signal == "compilation":
-        sample.scale          = lumi_scale
-        sample.read_variables = ['reweightPU/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F']
-        sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
-        sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
-        #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightLeptonFastSimSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-        #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonFastSimSF*event.reweightBTag_SF*event.reweightDilepTriggerBackup*event.reweightLeptonTrackingSF
-      elif args.signal == "DM":
-        sample.scale          = lumi_scale
-        sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-        sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU*event.reweightLeptonTrackingSF
-        sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
-      else:
-        raise NotImplementedError
+allModes         = ['mumu','mue','ee']
+channelSelection = ChannelSelection( [ (mode, getLeptonSelection(mode)) for mode in allModes ] )
+read_variables  += ["nGoodMuons/I", "nGoodElectrons/I", "isOS/I", "isMuMu/I", "isEE/I", "isEMu/I"]
+sequence.append( channelSelection.sequence )
 
-  
-  if not args.noData:
-    stack = Stack(mc, data_sample)
+if args.year == 2016:
+  data_sample = Run2016
+  data_sample.texName = "data (2016)"
+elif args.year == 2017:
+  data_sample = Run2017
+  data_sample.texName = "data (2017)"
+elif args.year == 2018:
+  data_sample = Run2018
+  data_sample.texName = "data (2018)"
+
+data_sample.setSelectionString([getFilterCut(isData=True, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
+if args.preHEM:
+  data_sample.addSelectionString("run<319077")
+if args.postHEM:
+  data_sample.addSelectionString("run>=319077")
+data_sample.name           = "data"
+data_sample.read_variables = ["event/I","run/I"]
+data_sample.style          = styles.errorStyle(ROOT.kBlack)
+data_sample.scale          = 1.
+lumi_scale                 = data_sample.lumi/1000
+if args.preHEM:   lumi_scale *= 0.37
+if args.postHEM:  lumi_scale *= 0.63
+
+if args.noData:
+  if args.year == 2016: lumi_scale = 35.9
+  elif args.year == 2017: lumi_scale = 41.9
+  elif args.year == 2018: lumi_scale = 60.0
+weight_ = lambda event, sample: event.weight
+
+
+for sample in mc: sample.style = styles.fillStyle(sample.color)
+
+for sample in mc + signals:
+  sample.scale          = lumi_scale
+ #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+ #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonHIPSF*event.reweightDilepTriggerBackup*nTrueInt27fb_puRW(event.nTrueInt)*event.reweightBTag_SF
+  sample.read_variables = ['reweightPU/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F', 'GenMET_pt/F', 'GenMET_phi/F']
+  #if (('ttjets' in sample.name) or ('ttlep' in sample.name)) and args.isr:
+  #    sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F', 'reweight_nISR/F']
+  #    sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU*event.reweightLeptonTrackingSF*event.reweight_nISR
+  #else:
+  if args.reweightPU:
+      # Need individual pu reweighting functions for each sample in 2017, so nTrueInt_puRW is only defined here
+      if args.year == 2017:
+          logger.info("Getting PU profile and weight for sample %s", sample.name)
+          puProfiles = puProfile( source_sample = sample )
+          mcHist = puProfiles.cachedTemplate( selection="( 1 )", weight='genWeight', overwrite=False ) # use genWeight for amc@NLO samples. No problems encountered so far
+          nTrueInt_puRW = getReweightingFunction(data="PU_2017_41860_XSec%s"%args.reweightPU, mc=mcHist)
+      # Use the nTrueInt_puRW function
+      sample.weight         = lambda event, sample: nTrueInt_puRW(event.Pileup_nTrueInt) * event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
   else:
-    stack = Stack(mc)
+      sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
+  sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
+
+for sample in signals:
+    if args.signal == "T2tt" or args.signal == "T8bbllnunu" or args.signal == "compilation":
+      sample.scale          = lumi_scale
+      sample.read_variables = ['reweightPU/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F']
+      sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
+      sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
+      #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightLeptonFastSimSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+      #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonFastSimSF*event.reweightBTag_SF*event.reweightDilepTriggerBackup*event.reweightLeptonTrackingSF
+    elif args.signal == "DM":
+      sample.scale          = lumi_scale
+      sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+      sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU*event.reweightLeptonTrackingSF
+      sample.setSelectionString([getFilterCut(isData=False, year=args.year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
+    else:
+      raise NotImplementedError
+
 
-  stack.extend( [ [s] for s in signals ] )
+if not args.noData:
+  stack = Stack(mc, data_sample)
+else:
+  stack = Stack(mc)
+
+stack.extend( [ [s] for s in signals ] )
 
-  if args.small:
-        for sample in stack.samples:
-            sample.normalization = 1.
-            sample.reduceFiles( factor = 40 )
-            sample.scale /= sample.normalization
+if args.small:
+      for sample in stack.samples:
+          sample.normalization = 1.
+          sample.reduceFiles( factor = 40 )
+          sample.scale /= sample.normalization
 
+#
+# Plots for each channel, the weight is 0 for events of the other channels
+#
+yields     = {}
+allPlots   = {}
+for index, mode in enumerate(allModes):
   # Use some defaults
-  Plot.setDefaults(stack = stack, weight = staticmethod(weight_), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
+  Plot.setDefaults(stack = stack, weight = staticmethod(channelSelection.weight(weight_, mode)), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
   
   plots = []
 
   plots.append(Plot(
     name = 'yield', texX = 'yield', texY = 'Number of Events',
-    attribute = lambda event, sample: 0.5 + index,
+    attribute = lambda event, sample, index = index: 0.5 + index,
     binning=[3, 0, 3],
   ))
 
@@ -705,10 +712,15 @@ for index, mode in enumerate(allModes):
    
 
 
-  plotting.fill(plots, read_variables = read_variables, sequence = sequence)
+  allPlots[mode] = plots
+
+plotting.fill(sum([allPlots[mode] for mode in allModes], []), read_variables = read_variables, sequence = sequence)
+
+for index, mode in enumerate(allModes):
+  yields[mode] = {}
 
   # Get normalization yields from yield histogram
-  for plot in plots:
+  for plot in allPlots[mode]:
     if plot.name == "yield":
       for i, l in enumerate(plot.histos):
         for j, h in enumerate(l):
@@ -721,8 +733,7 @@ for index, mode in enumerate(allModes):
   yields[mode]["MC"] = sum(yields[mode][s.name] for s in mc)
   dataMCScale        = yields[mode]["data"]/yields[mode]["MC"] if yields[mode]["MC"] != 0 else float('nan')
 
-  drawPlots(plots, mode, dataMCScale)
-  allPlots[mode] = plots
+  drawPlots(allPlots[mode], mode, dataMCScale)
 
 # Add the different channels into SF and all
 for mode in ["SF","all"]:
@@ -18,6 +18,7 @@ from StopsDilepton.tools.user            import plot_directory
 from StopsDilepton.tools.helpers         import deltaPhi
 from StopsDilepton.tools.objectSelection import getFilterCut
 from StopsDilepton.tools.cutInterpreter  import cutInterpreter
+from StopsDilepton.plots.channelSelection import ChannelSelection
 from StopsDilepton.plots.pieChart        import makePieChart
 
 #
@@ -170,7 +171,8 @@ def drawPlots(plots, mode, dataMCScale):
 # Read variables and sequences
 #
 read_variables = ["weight/F", "l1_eta/F" , "l1_phi/F", "l2_eta/F", "l2_phi/F", "JetGood[pt/F,eta/F,phi/F]", "dl_mass/F", "dl_eta/F", "dl_mt2ll/F", "dl_mt2bb/F", "dl_mt2blbl/F",
-                  "MET_pt/F", "MET_phi/F", "metSig/F", "ht/F", "nBTag/I", "nJetGood/I"]
+                  "MET_pt/F", "MET_phi/F", "metSig/F", "ht/F", "nBTag/I", "nJetGood/I",
+                  "run/I", "luminosityBlock/I", "event/l"] # event identity for the batched MVA evaluation
 
 #
 # MVA
@@ -182,16 +184,18 @@ if args.keras_directory in ['T2tt_dM350_smaller-TTLep_pow/v1_lep_pt_10/njet2p-re
 else:
     from StopsDilepton.MVA.default_classifier_lep_pt import training_variables_list, get_dict
 
-from StopsDilepton.MVA.KerasReader import KerasReader
+from StopsDilepton.MVA.KerasReader import KerasReader, KerasSequence
 from StopsDilepton.tools.user import  MVA_model_directory
 
 kerasReader = KerasReader( args.keras_directory , training_variables_list)
+# evaluates the classifier in batches, once per sample, for the events passing the selection of the plots
+kerasSequence = KerasSequence( kerasReader, read_variables, get_dict, selectionString = cutInterpreter.cutString(args.selection) )
 
 sequence = []
 
 def MVA( event, sample ):
 
-    event.MVA = kerasReader.eval( get_dict( event ) )
+    kerasSequence( event, sample )
     event.pass_MVAthreshold = MVAmin < event.MVA <= MVAmax
 
 sequence.append(MVA)
@@ -222,92 +226,98 @@ def getLeptonSelection( mode ):
 
 
 #
-# Loop over channels
+# Fill all channels in one loop over each sample
 #
-yields     = {}
-allPlots   = {}
-allModes   = ['mumu','mue','ee']
-for index, mode in enumerate(allModes):
-  yields[mode] = {}
-  #if   mode=="mumu": data_sample = DoubleMuon_Run2016_backup
-  #elif mode=="ee":   data_sample = DoubleEG_Run2016_backup
-  #elif mode=="mue":  data_sample = MuonEG_Run2016_backup
-  #if   mode=="mumu": data_sample.texName = "data (2 #mu)"
-  #elif mode=="ee":   data_sample.texName = "data (2 e)"
-  #elif mode=="mue":  data_sample.texName = "data (1 #mu, 1 e)"
-  data_sample = Run2016
-  data_sample.texName = "data (2016)"
-  data_sample.setSelectionString([getFilterCut(isData=True, year=args.year), getLeptonSelection(mode)])
-
-  #data_sample.setSelectionString([getFilterCut(isData=True, badMuonFilters = args.badMuonFilters), getLeptonSelection(mode)])
-  data_sample.name           = "data"
-  data_sample.read_variables = ["evt/I","run/I"]
-  data_sample.style          = styles.errorStyle(ROOT.kBlack)
-  lumi_scale                 = data_sample.lumi/1000
-
-  if args.noData: lumi_scale = 36.4
-  weight_ = lambda event, sample: event.weight * event.pass_MVAthreshold
-
-  multiBosonList = [WWNo2L2Nu, WZ, ZZNo2L2Nu, VVTo2L2Nu, triBoson] if args.splitBosons else ([WW, WZ, ZZ, triBoson] if args.splitBosons2 else [multiBoson_16])
-  mc             = [ Top_pow_16, TTZ_16, TTXNoZ_16] + multiBosonList + [DY_HT_LO_16]
-
-  for sample in mc: sample.style = styles.fillStyle(sample.color)
-
-  for sample in mc + signals:
-    sample.scale          = lumi_scale
-    #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-    sample.read_variables = ['reweightPU36fb/F']
-   #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonHIPSF*event.reweightDilepTriggerBackup*nTrueInt27fb_puRW(event.nTrueInt)*event.reweightBTag_SF
-    if (('ttjets' in sample.name) or ('ttlep' in sample.name)) and args.isr:
-        #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F', 'reweight_nISR/F']
-        sample.read_variables = ['reweightPU36fb/F']
-        #sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU36fb*event.reweightLeptonTrackingSF*event.reweight_nISR
-        sample.weight         = lambda event, sample: event.reweightPU36fb
+allModes         = ['mumu','mue','ee']
+channelSelection = ChannelSelection( [ (mode, getLeptonSelection(mode)) for mode in allModes ] )
+read_variables  += ["nGoodMuons/I", "nGoodElectrons/I", "isOS/I", "isMuMu/I", "isEE/I", "isEMu/I"]
+sequence.append( channelSelection.sequence )
+
+#if   mode=="mumu": data_sample = DoubleMuon_Run2016_backup
+#elif mode=="ee":   data_sample = DoubleEG_Run2016_backup
+#elif mode=="mue":  data_sample = MuonEG_Run2016_backup
+#if   mode=="mumu": data_sample.texName = "data (2 #mu)"
+#elif mode=="ee":   data_sample.texName = "data (2 e)"
+#elif mode=="mue":  data_sample.texName = "data (1 #mu, 1 e)"
+data_sample = Run2016
+data_sample.texName = "data (2016)"
+data_sample.setSelectionString([getFilterCut(isData=True, year=args.year), channelSelection.selectionString()])
+
+#data_sample.setSelectionString([getFilterCut(isData=True, badMuonFilters = args.badMuonFilters), channelSelection.selectionString()])
+data_sample.name           = "data"
+data_sample.read_variables = ["evt/I","run/I"]
+data_sample.style          = styles.errorStyle(ROOT.kBlack)
+lumi_scale                 = data_sample.lumi/1000
+
+if args.noData: lumi_scale = 36.4
+weight_ = lambda event, sample: event.weight * event.pass_MVAthreshold
+
+multiBosonList = [WWNo2L2Nu, WZ, ZZNo2L2Nu, VVTo2L2Nu, triBoson] if args.splitBosons else ([WW, WZ, ZZ, triBoson] if args.splitBosons2 else [multiBoson_16])
+mc             = [ Top_pow_16, TTZ_16, TTXNoZ_16] + multiBosonList + [DY_HT_LO_16]
+
+for sample in mc: sample.style = styles.fillStyle(sample.color)
+
+for sample in mc + signals:
+  sample.scale          = lumi_scale
+  #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+  sample.read_variables = ['reweightPU36fb/F']
+ #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonHIPSF*event.reweightDilepTriggerBackup*nTrueInt27fb_puRW(event.nTrueInt)*event.reweightBTag_SF
+  if (('ttjets' in sample.name) or ('ttlep' in sample.name)) and args.isr:
+      #sample.read_variables = ['reweightTopPt/F','reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F', 'reweight_nISR/F']
+      sample.read_variables = ['reweightPU36fb/F']
+      #sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU36fb*event.reweightLeptonTrackingSF*event.reweight_nISR
+      sample.weight         = lambda event, sample: event.reweightPU36fb
+  else:
+      sample.weight         = lambda event, sample: event.reweightPU36fb
+  #sample.setSelectionString([getFilterCut(isData=False, badMuonFilters = args.badMuonFilters), channelSelection.selectionString()])
+  sample.setSelectionString([getFilterCut(isData=False, year=args.year), channelSelection.selectionString()])
+
+for sample in signals:
+    if args.signal == "T2tt" or args.signal == "T8bbllnunu005" or args.signal == "T8bbllnunu05" or args.signal == "T8bbllnunu095" or args.signal == "compilation":
+      sample.scale          = lumi_scale
+      #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightLeptonFastSimSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+      sample.read_variables = ['reweightPU36fb/F']
+      #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonFastSimSF*event.reweightBTag_SF*event.reweightDilepTriggerBackup*event.reweightLeptonTrackingSF
+      sample.weight         = lambda event, sample: event.reweightPU36fb
+      #sample.setSelectionString([getFilterCut(isData=False), channelSelection.selectionString()])
+      sample.setSelectionString([getFilterCut(isData=False, year=args.year), channelSelection.selectionString()])
+    elif args.signal == "DM":
+      sample.scale          = lumi_scale
+      #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
+      sample.read_variables = ['reweightPU36fb/F']
+      #sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU36fb*event.reweightLeptonTrackingSF
+      sample.weight         = lambda event, sample: event.reweightPU36fb
+      #sample.setSelectionString([getFilterCut(isData=False), channelSelection.selectionString()])
+      sample.setSelectionString([getFilterCut(isData=False, year=args.year), channelSelection.selectionString()])
     else:
-        sample.weight         = lambda event, sample: event.reweightPU36fb
-    #sample.setSelectionString([getFilterCut(isData=False, badMuonFilters = args.badMuonFilters), getLeptonSelection(mode)])
-    sample.setSelectionString([getFilterCut(isData=False, year=args.year), getLeptonSelection(mode)])
-
-  for sample in signals:
-      if args.signal == "T2tt" or args.signal == "T8bbllnunu005" or args.signal == "T8bbllnunu05" or args.signal == "T8bbllnunu095" or args.signal == "compilation":
-        sample.scale          = lumi_scale
-        #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightLeptonFastSimSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-        sample.read_variables = ['reweightPU36fb/F']
-        #sample.weight         = lambda event, sample: event.reweightLeptonSF*event.reweightLeptonFastSimSF*event.reweightBTag_SF*event.reweightDilepTriggerBackup*event.reweightLeptonTrackingSF
-        sample.weight         = lambda event, sample: event.reweightPU36fb
-        #sample.setSelectionString([getFilterCut(isData=False), getLeptonSelection(mode)])
-        sample.setSelectionString([getFilterCut(isData=False, year=args.year), getLeptonSelection(mode)])
-      elif args.signal == "DM":
-        sample.scale          = lumi_scale
-        #sample.read_variables = ['reweightDilepTriggerBackup/F','reweightLeptonSF/F','reweightBTag_SF/F','reweightPU36fb/F', 'nTrueInt/F', 'reweightLeptonTrackingSF/F']
-        sample.read_variables = ['reweightPU36fb/F']
-        #sample.weight         = lambda event, sample: event.reweightBTag_SF*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU36fb*event.reweightLeptonTrackingSF
-        sample.weight         = lambda event, sample: event.reweightPU36fb
-        #sample.setSelectionString([getFilterCut(isData=False), getLeptonSelection(mode)])
-        sample.setSelectionString([getFilterCut(isData=False, year=args.year), getLeptonSelection(mode)])
-      else:
-        raise NotImplementedError
+      raise NotImplementedError
 
-  
-  if not args.noData:
-    stack = Stack(mc, data_sample)
-  else:
-    stack = Stack(mc)
 
-  stack.extend( [ [s] for s in signals ] )
+if not args.noData:
+  stack = Stack(mc, data_sample)
+else:
+  stack = Stack(mc)
 
-  if args.small:
-        for sample in stack.samples:
-            sample.reduceFiles( to = 1 )
+stack.extend( [ [s] for s in signals ] )
 
+if args.small:
+      for sample in stack.samples:
+          sample.reduceFiles( to = 1 )
+
+#
+# Plots for each channel, the weight is 0 for events of the other channels
+#
+yields     = {}
+allPlots   = {}
+for index, mode in enumerate(allModes):
   # Use some defaults
-  Plot.setDefaults(stack = stack, weight = staticmethod(weight_), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper')
+  Plot.setDefaults(stack = stack, weight = staticmethod(channelSelection.weight(weight_, mode)), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper')
   
   plots = []
 
   plots.append(Plot(
     name = 'yield', texX = 'yield', texY = 'Number of Events',
-    attribute = lambda event, sample: 0.5 + index,
+    attribute = lambda event, sample, index = index: 0.5 + index,
     binning=[3, 0, 3],
   ))
 
@@ -557,10 +567,15 @@ for index, mode in enumerate(allModes):
     ))
 
 
-  plotting.fill(plots, read_variables = read_variables, sequence = sequence)
+  allPlots[mode] = plots
+
+plotting.fill(sum([allPlots[mode] for mode in allModes], []), read_variables = read_variables, sequence = sequence)
+
+for index, mode in enumerate(allModes):
+  yields[mode] = {}
 
   # Get normalization yields from yield histogram
-  for plot in plots:
+  for plot in allPlots[mode]:
     if plot.name == "yield":
       for i, l in enumerate(plot.histos):
         for j, h in enumerate(l):
@@ -573,10 +588,9 @@ for index, mode in enumerate(allModes):
   yields[mode]["MC"] = sum(yields[mode][s.name] for s in mc)
   dataMCScale        = yields[mode]["data"]/yields[mode]["MC"] if yields[mode]["MC"] != 0 else float('nan')
 
-  drawPlots(plots, mode, dataMCScale)
+  drawPlots(allPlots[mode], mode, dataMCScale)
   makePieChart(os.path.join(plot_directory, args.plot_directory, mode, args.selection), "pie_chart",    yields, mode, mc)
   makePieChart(os.path.join(plot_directory, args.plot_directory, mode, args.selection), "pie_chart_VV", yields, mode, multiBosonList)
-  allPlots[mode] = plots
 
 # Add the different channels into SF and all
 for mode in ["SF","all"]:
@@ -17,6 +17,7 @@ from StopsDilepton.tools.user            import plot_directory
 from StopsDilepton.tools.helpers         import deltaPhi
 from Analysis.Tools.metFilters            import getFilterCut
 from StopsDilepton.tools.cutInterpreter  import cutInterpreter
+from StopsDilepton.plots.channelSelection import ChannelSelection
 from StopsDilepton.tools.objectSelection import muonSelector, eleSelector, getGoodMuons, getGoodElectrons
 
 
@@ -190,44 +191,49 @@ def getLeptonSelection( mode ):
   elif mode=="all":   return "nGoodMuons+nGoodElectrons==2&&isOS&&(((isEE||isMuMu)&&" + offZ+")||isEMu)"
 
 #
-# Loop over channels
+# Fill all channels in one loop over each sample
 #
-yields     = {}
-allPlots   = {}
-allModes   = ['mumu','mue','ee']
-for index, mode in enumerate(allModes):
-  yields[mode] = {}
+allModes         = ['mumu','mue','ee']
+channelSelection = ChannelSelection( [ (mode, getLeptonSelection(mode)) for mode in allModes ] )
+read_variables  += ["nGoodMuons/I", "nGoodElectrons/I", "isOS/I", "isMuMu/I", "isEE/I", "isEMu/I"]
+sequence.append( channelSelection.sequence )
 
-  data_sample.setSelectionString([getFilterCut(isData=True, year=year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
-  data_sample.name           = "data"
-  data_sample.read_variables = ["event/I","run/I","reweightHEM/F"]
-  data_sample.style          = styles.errorStyle(ROOT.kBlack)
-  weight_ = lambda event, sample: event.weight*event.reweightHEM
+data_sample.setSelectionString([getFilterCut(isData=True, year=year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
+data_sample.name           = "data"
+data_sample.read_variables = ["event/I","run/I","reweightHEM/F"]
+data_sample.style          = styles.errorStyle(ROOT.kBlack)
+weight_ = lambda event, sample: event.weight*event.reweightHEM
 
-  for sample in mc:
+for sample in mc:
     sample.read_variables = ['reweightPU/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSip3dSF/F','reweightLeptonHit0SF/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F', 'GenMET_pt/F', 'GenMET_phi/F', "reweightHEM/F"]
     sample.read_variables += ['reweightPU%s/F'%args.reweightPU if args.reweightPU != "Central" else "reweightPU/F"]
     if args.reweightPU == 'Central':
         sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSip3dSF*event.reweightLeptonHit0SF*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
     else:
         sample.weight         = lambda event, sample: getattr(event, "reweightPU"+args.reweightPU if args.reweightPU != "Central" else "reweightPU")*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF
-    sample.setSelectionString([getFilterCut(isData=False, year=year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), getLeptonSelection(mode)])
+    sample.setSelectionString([getFilterCut(isData=False, year=year, skipBadPFMuon=args.noBadPFMuonFilter, skipBadChargedCandidate=args.noBadChargedCandidateFilter), channelSelection.selectionString()])
 
-  for sample in mc: sample.style = styles.fillStyle(sample.color)
+for sample in mc: sample.style = styles.fillStyle(sample.color)
 
-  if not args.noData:
-    stack = Stack(mc, data_sample)
-  else:
-    stack = Stack(mc)
+if not args.noData:
+  stack = Stack(mc, data_sample)
+else:
+  stack = Stack(mc)
 
+#
+# Plots for each channel, the weight is 0 for events of the other channels
+#
+yields     = {}
+allPlots   = {}
+for index, mode in enumerate(allModes):
   # Use some defaults
-  Plot.setDefaults(stack = stack, weight = staticmethod(weight_), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
+  Plot.setDefaults(stack = stack, weight = staticmethod(channelSelection.weight(weight_, mode)), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
   
   plots = []
 
   plots.append(Plot(
     name = 'yield', texX = 'yield', texY = 'Number of Events',
-    attribute = lambda event, sample: 0.5 + index,
+    attribute = lambda event, sample, index = index: 0.5 + index,
     binning=[3, 0, 3],
   ))
 
@@ -613,10 +619,15 @@ for index, mode in enumerate(allModes):
     #  binning=[50, 0, 1],
     #))
 
-  plotting.fill(plots, read_variables = read_variables, sequence = sequence)
+  allPlots[mode] = plots
+
+plotting.fill(sum([allPlots[mode] for mode in allModes], []), read_variables = read_variables, sequence = sequence)
+
+for index, mode in enumerate(allModes):
+  yields[mode] = {}
 
   # Get normalization yields from yield histogram
-  for plot in plots:
+  for plot in allPlots[mode]:
     if plot.name == "yield":
       for i, l in enumerate(plot.histos):
         for j, h in enumerate(l):
@@ -628,8 +639,7 @@ for index, mode in enumerate(allModes):
   yields[mode]["MC"] = sum(yields[mode][s.name] for s in mc)
   dataMCScale        = yields[mode]["data"]/yields[mode]["MC"] if yields[mode]["MC"] != 0 else float('nan')
 
-  drawPlots(plots, mode, dataMCScale)
-  allPlots[mode] = plots
+  drawPlots(allPlots[mode], mode, dataMCScale)
 
 # Add the different channels into SF and all
 for mode in ["SF","all"]:
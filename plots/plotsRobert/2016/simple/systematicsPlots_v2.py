@@ -15,9 +15,10 @@ from StopsDilepton.tools.helpers         import deltaPhi
 from StopsDilepton.tools.objectSelection import getFilterCut
 from StopsDilepton.tools.cutInterpreter  import cutInterpreter
 from StopsDilepton.plots.pieChart        import makePieChart
+from StopsDilepton.plots.systematicSelection import SystematicSelection
+from StopsDilepton.analysis.YieldEngine  import YieldEngine
 
-import pickle, os, time
-import errno
+import pickle, os
 #
 # Arguments
 # 
@@ -30,18 +31,15 @@ argParser.add_argument('--plot_directory',    action='store',      default='syst
 #argParser.add_argument('--selection',         action='store',      default=None)
 argParser.add_argument('--selection',         action='store',            default='njet2p-btag1p-relIso0.12-looseLeptonVeto-mll20-met80-metSig5-dPhiJet0-dPhiJet1')
 argParser.add_argument('--normalizationSelection',  action='store',      default='njet2p-btag1p-relIso0.12-looseLeptonVeto-mll20-met80-metSig5-dPhiJet0-dPhiJet1-mt2llTo100')
-argParser.add_argument('--selectSys',         action='store',      default='all')
+argParser.add_argument('--selectSys',         action='store',      default='all',      help="'all' fills and plots all systematics in one pass, 'combine' plots the stored results, a single systematic is filled and stored only")
 #argParser.add_argument('--noMultiThreading',  action='store_true', default='False', help="noMultiThreading?") # Need no multithreading when doing batch-to-natch
 argParser.add_argument('--showOnly',          action='store',      default=None)
 argParser.add_argument('--small',             action='store_true',     help='Run only on a small subset of the data?', )
-argParser.add_argument('--runLocal',             action='store_true',     help='Run local or submit?', )
 argParser.add_argument('--copyIndexPHP',      action='store_true',     help='copy index.php to directories?', )
 argParser.add_argument('--splitBosons',       action='store_true', default=False)
 argParser.add_argument('--splitTop',          action='store_true', default=False)
 argParser.add_argument('--powheg',            action='store_true', default=True)
-argParser.add_argument('--isChild',           action='store_true', default=False)
 argParser.add_argument('--normalizeBinWidth', action='store_true', default=False,       help='normalize wider bins?')
-argParser.add_argument('--dryRun',            action='store_true', default=False,       help='do not launch subjobs')
 args = argParser.parse_args()
 
 #
@@ -53,25 +51,6 @@ logger    = logger.get_logger(   args.logLevel, logFile = None)
 logger_rt = logger_rt.get_logger(args.logLevel, logFile = None)
 
 
-def waitForLock(filename):
-    lockAcquired = False
-    while not lockAcquired:
-      try:
-           f = os.open(filename + "_lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-           os.close(f)
-           lockAcquired = True
-      except OSError as e:
-           if e.errno == errno.EEXIST:  # Failed as the file already exists.
-             time.sleep(1)
-           else:  # Something unexpected went wrong
-             print e.errno
-             print e
-             print "Problem acquiring the lock"
-             exit(1)
-
-def removeLock(filename):
-    os.system("rm " + filename + "_lock")
-
 #
 # Selections (two leptons with pt > 20 GeV)
 #
@@ -114,43 +93,6 @@ sys_pairs = [\
     ('leptonSF',    'LeptonSFDown', 'LeptonSFUp'),
 ]
 
-#
-# If this is the mother process, launch the childs and exit (I know, this could potententially be dangereous if the --isChild and --selection commands are not given...)
-#
-
-def wrapper(com):
-  import os
-  os.system(com)
-
-#if not args.isChild and args.selection is None and (args.selectSys == "all" or args.selectSys == "combine"):
-if not args.isChild and (args.selectSys == "all" or args.selectSys == "combine"):
-  jobs = []
-  for sys in (all_systematics if args.selectSys == "all" else ["combine"]):
-    command = "python systematicsPlots_v2.py --selection=" + args.selection + (" --noData" if args.noData else "")\
-               + (" --isChild")\
-               + (" --small" if args.small else "")\
-               + (" --plot_directory=" + args.plot_directory)\
-               + (" --logLevel=" + args.logLevel)\
-               + (" --selectSys=" + str(sys))\
-               + (" --signal=" + args.signal)\
-               + (" --splitBosons" if args.splitBosons else "")\
-               + (" --splitTop" if args.splitTop else "")\
-               + (" --powheg" if args.powheg else "")\
-               + (" --normalizeBinWidth" if args.normalizeBinWidth else "")
-    if args.selectSys == 'combine':
-        jobs.append(command)
-    elif args.selectSys == 'all':
-        if args.runLocal:
-            jobs.append(command)
-        else:
-            jobs.append( "submitBatch.py --title='sys' '%s'"%command )
-
-#  if args.noMultiThreading: 
-  logger.info("Running/submitting all systematics.")
-  results = map(wrapper, jobs)
-  logger.info("Done with running/submitting systematics.")
-  exit(0)
-
 if args.noData:                   args.plot_directory += "_noData"
 if args.splitBosons:              args.plot_directory += "_splitMultiBoson"
 if args.signal == "DM":           args.plot_directory += "_DM"
@@ -220,6 +162,30 @@ def weightMC( sys = None ):
     elif sys in weight_systematics: return (lambda event, sample:event.weight*event.reweightLeptonSF*event.reweightDilepTriggerBackup*event.reweightPU36fb*getattr(event, "reweight"+sys), "weight*reweightLeptonSF*reweightDilepTriggerBackup*reweightPU36fb*reweight"+sys)
     elif sys in jme_systematics :   return weightMC( sys = None )
     else:                           raise ValueError( "Systematic %s not known"%sys )
+
+def loadResults( dirname ):
+    ''' Merge results.pkl and the results_<sys>.pkl of single systematics '''
+    allPlots, yields = {}, {}
+    for filename in sorted( os.listdir( dirname ) ):
+        if filename == 'results.pkl' or ( filename.startswith('results_') and filename.endswith('.pkl') ):
+            (allPlots_, yields_) = pickle.load(file( os.path.join(dirname, filename) ))
+            allPlots.update( allPlots_ )
+            yields.update( yields_ )
+    return allPlots, yields
+
+def writeResults( result_file, allPlots, yields ):
+    tmp_file = result_file + '.tmp'
+    pickle.dump( (allPlots, yields), file( tmp_file, 'w' ) )
+    os.rename( tmp_file, result_file )
+
+#
+# All systematics are filled in one loop over each sample: the MC plots share one stack and the loose selection,
+# the selection of each systematic is evaluated per event and enters the plot weight
+#
+selection           = cutInterpreter.cutString(args.selection)
+systematicSelection = SystematicSelection( {sys:addSys(selection, sys) for sys in all_systematics} )
+def weightMCSelected( sys ):
+    return systematicSelection.weight( weightMC( sys = sys )[0], sys )
     
 #
 # Read variables and sequences
@@ -227,8 +193,13 @@ def weightMC( sys = None ):
 read_variables = ["weight/F", "l1_pt/F", "l2_pt/F", "l1_eta/F" , "l1_phi/F", "l2_eta/F", "l2_phi/F", "JetGood[pt/F,eta/F,phi/F,btagCSV/F]", "dl_mass/F", "dl_eta/F", "dl_mt2ll/F", "dl_mt2bb/F", "dl_mt2blbl/F",
                   "met_pt/F", "met_phi/F", "LepGood[pt/F,eta/F,miniRelIso/F]", "nGoodMuons/F", "nGoodElectrons/F", "l1_mIsoWP/F", "l2_mIsoWP/F",
                   "metSig/F", "ht/F", "nBTag/I", "nJetGood/I","run/I","evt/l"]
+# variables of the per event selection of the systematics, read for MC only
+systematic_read_variables = [ ( "%s/I" if v.startswith('nJetGood') or v.startswith('nBTag') else "%s/F" ) % v for v in systematicSelection.variables if v not in [ r.split('/')[0] for r in read_variables ] ]
 
-sequence = []
+def makeSystematicSelection( event, sample ):
+    if sample in mc: systematicSelection.sequence( event, sample )
+
+sequence = [ makeSystematicSelection ]
 
 offZ = "&&abs(dl_mass-91.1876)>15" if not (args.selection.count("onZ") or args.selection.count("allZ") or args.selection.count("offZ")) else ""
 def getLeptonSelection( mode ):
@@ -309,6 +280,7 @@ for index, mode in enumerate(allModes):
     sample.read_variables += ["dl_mt2blbl_%s/F"%s for s in jme_systematics]
     sample.read_variables += ["nJetGood_%s/I"%s   for s in jet_systematics]
     sample.read_variables += ["nBTag_%s/I"%s      for s in jet_systematics]
+    sample.read_variables += [ v for v in systematic_read_variables if v not in sample.read_variables ]
     sample.setSelectionString([getFilterCut(isData=False), getLeptonSelection(mode)])
 
 #    # Apply scale factors in the mt2ll > 100 GeV signal region (except Top which will be already scaled anyway)
@@ -340,7 +312,7 @@ for index, mode in enumerate(allModes):
   if   args.signal == "T2tt": stack_data = Stack( data_sample, T2tt, T2tt2 ) 
   elif args.signal == "DM":   stack_data = Stack( data_sample, DM, DM2) 
   else:                       stack_data = Stack( data_sample )
-  sys_stacks = {sys:copy.deepcopy(stack_mc) for sys in [None] + weight_systematics + jme_systematics }
+  mcSelectionString = systematicSelection.selectionString()
   plots = []
   
 
@@ -358,10 +330,10 @@ for index, mode in enumerate(allModes):
       name            = "dl_mt2ll" if sys is None else "dl_mt2ll_mc_%s" % sys,
       texX            = 'M_{T2}(ll) (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Events",
       binning         = Binning.fromThresholds([0,20,40,60,80,100,140,240,340]),
-      stack           = sys_stacks[sys],
+      stack           = stack_mc,
       attribute        = TreeVariable.fromString( "dl_mt2ll/F" ) if sys is None or sys in weight_systematics else TreeVariable.fromString( "dl_mt2ll_%s/F" % sys ),
-      selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-      weight          = weightMC( sys = sys )[0],
+      selectionString = mcSelectionString,
+      weight          = weightMCSelected( sys ),
       ) for sys in all_systematics }
   plots.extend( dl_mt2ll_mc.values() )
 
@@ -379,11 +351,11 @@ for index, mode in enumerate(allModes):
     dl_mt2bb_mc  = {sys: Plot(
   name = "dl_mt2bb" if sys is None else "dl_mt2bb_mc_%s" % sys,
   texX = 'M_{T2}(bb) (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Events",
-  stack = sys_stacks[sys],
+  stack = stack_mc,
   attribute = TreeVariable.fromString( "dl_mt2bb/F" ) if sys is None or sys in weight_systematics else TreeVariable.fromString( "dl_mt2bb_%s/F" % sys ),
   binning=Binning.fromThresholds([70,90,110,130,150,170,190,210,230,250,300,350,400,450]),
-  selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-  weight = weightMC( sys = sys )[0],
+  selectionString = mcSelectionString,
+  weight = weightMCSelected( sys ),
   ) for sys in all_systematics }
     plots.extend( dl_mt2bb_mc.values() )
 
@@ -400,11 +372,11 @@ for index, mode in enumerate(allModes):
     dl_mt2bb_mc_2  = {sys: Plot(
   name = "dl_mt2bb_2" if sys is None else "dl_mt2bb_mc_2_%s" % sys,
   texX = 'M_{T2}(bb) (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Events",
-  stack = sys_stacks[sys],
+  stack = stack_mc,
   attribute = TreeVariable.fromString( "dl_mt2bb/F" ) if sys is None or sys in weight_systematics else TreeVariable.fromString( "dl_mt2bb_%s/F" % sys ),
   binning         = Binning.fromThresholds([70,90,110,130,150,170,190,210,230,250,300,350,400,450,500,550,600,700,800,1000]),
-  selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-  weight = weightMC( sys = sys )[0],
+  selectionString = mcSelectionString,
+  weight = weightMCSelected( sys ),
   ) for sys in all_systematics }
     plots.extend( dl_mt2bb_mc_2.values() )
 
@@ -423,11 +395,11 @@ for index, mode in enumerate(allModes):
     dl_mt2blbl_mc  = {sys: Plot(
   name = "dl_mt2blbl" if sys is None else "dl_mt2blbl_mc_%s" % sys,
   texX = 'M_{T2}(blbl) (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Events",
-  stack = sys_stacks[sys],
+  stack = stack_mc,
   attribute = TreeVariable.fromString( "dl_mt2blbl/F" ) if sys is None or sys in weight_systematics else TreeVariable.fromString( "dl_mt2blbl_%s/F" % sys ),
   binning=Binning.fromThresholds([0,20,40,60,80,100,120,140,160,200,250,300,350]),
-  selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-  weight = weightMC( sys = sys )[0],
+  selectionString = mcSelectionString,
+  weight = weightMCSelected( sys ),
   ) for sys in all_systematics }
     plots.extend( dl_mt2blbl_mc.values() )
 
@@ -445,11 +417,11 @@ for index, mode in enumerate(allModes):
     dl_mt2blbl_mc_2  = {sys: Plot(
   name = "dl_mt2blbl_2" if sys is None else "dl_mt2blbl_mc_2_%s" % sys,
   texX = 'M_{T2}(blbl) (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Events",
-  stack = sys_stacks[sys],
+  stack = stack_mc,
   attribute = TreeVariable.fromString( "dl_mt2blbl/F" ) if sys is None or sys in weight_systematics else TreeVariable.fromString( "dl_mt2blbl_%s/F" % sys ),
   binning=Binning.fromThresholds([0,20,40,60,80,100,120,140,160,200,250,300,350,400,450,500,600,700]),
-  selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-  weight = weightMC( sys = sys )[0],
+  selectionString = mcSelectionString,
+  weight = weightMCSelected( sys ),
   ) for sys in all_systematics }
     plots.extend( dl_mt2blbl_mc_2.values() )
 
@@ -468,11 +440,11 @@ for index, mode in enumerate(allModes):
   nbtags_mc  = {sys: Plot(
       name = "nbtags" if sys is None else "nbtags_mc_%s" % sys,
       texX = 'number of b-tags (CSVM)', texY = 'Number of Events',
-      stack = sys_stacks[sys],
+      stack = stack_mc,
       attribute = TreeVariable.fromString('nBTag/I') if sys is None or sys in weight_systematics or sys in met_systematics else TreeVariable.fromString( "nBTag_%s/I" % sys ),
       binning=nBtagBinning,
-      selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-      weight = weightMC( sys = sys )[0],
+      selectionString = mcSelectionString,
+      weight = weightMCSelected( sys ),
       ) for sys in all_systematics }
   plots.extend( nbtags_mc.values() )
 
@@ -491,11 +463,11 @@ for index, mode in enumerate(allModes):
   njets_mc  = {sys: Plot(
       name = "njets" if sys is None else "njets_mc_%s" % sys,
       texX = 'number of jets', texY = 'Number of Events',
-      stack = sys_stacks[sys],
+      stack = stack_mc,
       attribute = TreeVariable.fromString('nJetGood/I') if sys is None or sys in weight_systematics or sys in met_systematics else TreeVariable.fromString( "nJetGood_%s/I" % sys ),
       binning= jetBinning,
-      selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-      weight = weightMC( sys = sys )[0],
+      selectionString = mcSelectionString,
+      weight = weightMCSelected( sys ),
       ) for sys in all_systematics }
   plots.extend( njets_mc.values() )
 
@@ -514,11 +486,11 @@ for index, mode in enumerate(allModes):
   met_mc  = {sys: Plot(
       name = "met_pt" if sys is None else "met_pt_mc_%s" % sys,
       texX = 'E_{T}^{miss} (GeV)', texY = 'Number of Events / 50 GeV' if args.normalizeBinWidth else "Number of Event",
-      stack = sys_stacks[sys],
+      stack = stack_mc,
       attribute = TreeVariable.fromString('met_pt/F') if sys not in met_systematics else TreeVariable.fromString( "met_pt_%s/F" % sys ),
       binning=Binning.fromThresholds( metBinning ),
-      selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-      weight = weightMC( sys = sys )[0],
+      selectionString = mcSelectionString,
+      weight = weightMCSelected( sys ),
       ) for sys in all_systematics }
   plots.extend( met_mc.values() )
 
@@ -537,11 +509,11 @@ for index, mode in enumerate(allModes):
   met2_mc  = {sys: Plot(
       name = "met2_pt" if sys is None else "met2_pt_mc_%s" % sys,
       texX = 'E_{T}^{miss} (GeV)', texY = 'Number of Events / 20 GeV' if args.normalizeBinWidth else "Number of Event",
-      stack = sys_stacks[sys],
+      stack = stack_mc,
       attribute = TreeVariable.fromString('met_pt/F') if sys not in met_systematics else TreeVariable.fromString( "met_pt_%s/F" % sys ),
       binning=Binning.fromThresholds( metBinning2 ),
-      selectionString = addSys(cutInterpreter.cutString(args.selection), sys),
-      weight = weightMC( sys = sys )[0],
+      selectionString = mcSelectionString,
+      weight = weightMCSelected( sys ),
       ) for sys in all_systematics }
   plots.extend( met2_mc.values() )
 
@@ -559,18 +531,24 @@ for index, mode in enumerate(allModes):
     plotConfigs.append([ dl_mt2blbl_mc_2, dl_mt2blbl_data_2, 20])
 
 
-  result_file = os.path.join(plot_directory, args.plot_directory, mode, args.selection, 'results.pkl')
-  try: os.makedirs(os.path.join(plot_directory, args.plot_directory, mode, args.selection))
+  result_dir  = os.path.join(plot_directory, args.plot_directory, mode, args.selection)
+  result_file = os.path.join(result_dir, 'results.pkl' if args.selectSys in ["all", "combine"] else 'results_%s.pkl' % args.selectSys)
+  try: os.makedirs(result_dir)
   except: pass
   if args.copyIndexPHP:
-    copyIndexPHP ( os.path.join(plot_directory, args.plot_directory, mode, args.selection) )
+    copyIndexPHP ( result_dir )
 
   if args.selectSys != "combine": 
     normalization_selection_string = cutInterpreter.cutString(args.normalizationSelection)
     #normalization_selection_string = normalization_selection_string.replace('&&dl_mt2ll>100','')
-    mc_weight_func, mc_weight_string = weightMC( sys = (args.selectSys if args.selectSys != 'None' else None) )
 
-    yield_mc = {s.name + (args.selectSys if sys else ""):s.scale*s.getYieldFromDraw( selectionString =  addSys(normalization_selection_string ), weightString = mc_weight_string)['val'] for s in mc}
+    # normalization yields of all systematics, one loop per sample
+    yield_mc = {}
+    for s in mc:
+      engine  = YieldEngine( s )
+      handles = {sys:engine.add( selectionString = addSys(normalization_selection_string ), weightString = weightMC( sys = sys )[1] ) for sys in all_systematics}
+      engine.run()
+      yield_mc.update( {s.name + str(sys):s.scale*engine.getYield( handle )['val'] for sys, handle in handles.iteritems()} )
     if mode == "all": yield_data = sum(s.getYieldFromDraw(       selectionString = normalization_selection_string, weightString = data_weight_string)['val'] for s in data_sample )
     else:             yield_data = data_sample.getYieldFromDraw( selectionString = normalization_selection_string, weightString = data_weight_string)['val']
     
@@ -579,36 +557,16 @@ for index, mode in enumerate(allModes):
     #print "yield_mc", yield_mc
     #print "dl_mt2ll_mc[None].histos[0][0].Integral()",dl_mt2ll_mc[None].histos[0][0],  dl_mt2ll_mc[None].histos[0][0].Integral()
 
-    waitForLock( result_file ) 
-    if os.path.exists(result_file):
-      (allPlots, yields) = pickle.load(file( result_file ))
-      allPlots.update({p.name : p.histos for p in plots})
-      yields.update(yield_mc)
-    else:                           
-      allPlots = {p.name : p.histos for p in plots}
-      yields = yield_mc
+    allPlots = {p.name : p.histos for p in plots}
+    yields = yield_mc
     yields['data'] = yield_data
-    pickle.dump( (allPlots, yields), file( result_file, 'w' ) )
-    removeLock( result_file ) 
+    writeResults( result_file, allPlots, yields )
     logger.info( "Done for sys " + args.selectSys )
 
-#    # Write one  pkl file sys
-#    result_file = os.path.join(plot_directory, args.plot_directory, mode, args.selection, 'results_%s.pkl' % args.selectSys )
-#    allPlots = {p.name : p.histos for p in plots}
-#    yields = yield_mc
-#    yields['data'] = yield_data
-#    pickle.dump( (allPlots, yields), file( result_file, 'w' ) )
-
   else:
-    (allPlots, yields) = pickle.load(file( result_file ))
-#    allPlots, yields = {}, {}
-#    dirname = os.path.join(plot_directory, args.plot_directory, mode, args.selection)
-#    for filename in os.listdir( dirname ):
-#        if filename.startswith('results_') and filename.endswith('.pkl'):
-#            (allPlots_, yields_) = pickle.load(file( os.path.join(dirname, filename) ))
-#            allPlots.update( allPlots_ )
-#            yields.update( yields_ )
+    (allPlots, yields) = loadResults( result_dir )
 
+  if args.selectSys in ["all", "combine"]:
     from RootTools.plot.Plot import addOverFlowBin1D
     for p in plots:
       p.histos = allPlots[p.name]
@@ -19,6 +19,7 @@ from Analysis.Tools.metFilters            import getFilterCut
 from StopsDilepton.tools.cutInterpreter  import cutInterpreter
 from StopsDilepton.tools.mt2Calculator   import mt2Calculator
 from Analysis.Tools.puProfileCache import *
+from StopsDilepton.plots.channelSelection import ChannelSelection
 
 #
 # Arguments
@@ -584,27 +585,26 @@ if args.reweightPU =='nvtx':
         return data_nvtx_histo.GetBinContent( i_bin )/mc_val if mc_val>0 else 1
 
 #
-# Loop over channels
+# Fill all channels in one loop over each sample
 #
-yields     = {}
-allPlots   = {}
-allModes   = ['mumu','mue','ee']
-for index, mode in enumerate(allModes):
-  yields[mode] = {}
-
-  data_sample.setSelectionString([getFilterCut(isData=True, year=year), getLeptonSelection(mode)])
-  data_sample.name           = "data"
-  data_sample.read_variables = ["event/I","run/I", "reweightHEM/F"]
-  data_sample.style          = styles.errorStyle(ROOT.kBlack)
-  weight_ = lambda event, sample: event.weight*event.reweightHEM
-
-  #data_sample_filtered = copy.deepcopy( data_sample )
-  #data_sample_filtered.style = styles.errorStyle(ROOT.kRed)
-  #data_sample_filtered.weight = lambda event, sample: event.weight*event.passes_veto
-  #data_sample_filtered.name   += "_filtered"
-  #data_sample_filtered.texName+= " (filtered)"
-
-  for sample in mc + signals:
+allModes         = ['mumu','mue','ee']
+channelSelection = ChannelSelection( [ (mode, getLeptonSelection(mode)) for mode in allModes ] )
+read_variables  += ["nGoodMuons/I", "nGoodElectrons/I", "isOS/I", "isMuMu/I", "isEE/I", "isEMu/I"]
+sequence.append( channelSelection.sequence )
+
+data_sample.setSelectionString([getFilterCut(isData=True, year=year), channelSelection.selectionString()])
+data_sample.name           = "data"
+data_sample.read_variables = ["event/I","run/I", "reweightHEM/F"]
+data_sample.style          = styles.errorStyle(ROOT.kBlack)
+weight_ = lambda event, sample: event.weight*event.reweightHEM
+
+#data_sample_filtered = copy.deepcopy( data_sample )
+#data_sample_filtered.style = styles.errorStyle(ROOT.kRed)
+#data_sample_filtered.weight = lambda event, sample: event.weight*event.passes_veto
+#data_sample_filtered.name   += "_filtered"
+#data_sample_filtered.texName+= " (filtered)"
+
+for sample in mc + signals:
     sample.read_variables = ['reweightPU/F', 'reweightL1Prefire/F', 'Pileup_nTrueInt/F', 'reweightDilepTrigger/F','reweightLeptonSF/F','reweightBTag_SF/F', 'reweightLeptonTrackingSF/F', 'GenMET_pt/F', 'GenMET_phi/F', 'reweightHEM/F', 'reweightLeptonHit0SF/F', 'reweightLeptonSip3dSF/F']
     # Need individual pu reweighting functions for each sample in 2017, so nTrueInt_puRW is only defined here
 
@@ -630,35 +630,41 @@ for index, mode in enumerate(allModes):
     else: #default
         sample.weight         = lambda event, sample: event.reweightPU*event.reweightDilepTrigger*event.reweightLeptonSF*event.reweightBTag_SF*event.reweightLeptonTrackingSF*event.reweightL1Prefire*weight_sip3d(event)*weight_Hit0(event)
 
-    sample.setSelectionString([getFilterCut(isData=False, year=year), getLeptonSelection(mode)])
+    sample.setSelectionString([getFilterCut(isData=False, year=year), channelSelection.selectionString()])
 
-  if args.splitMET:
-    mc_ = splitMetMC(mc)
-  elif args.splitMETSig:
-    mc_ = splitMetSigMC(mc)
-  elif args.splitNvtx:
-    mc_ = splitNvtxMC(mc)
-  else:
-    mc_ = mc 
+if args.splitMET:
+  mc_ = splitMetMC(mc)
+elif args.splitMETSig:
+  mc_ = splitMetSigMC(mc)
+elif args.splitNvtx:
+  mc_ = splitNvtxMC(mc)
+else:
+  mc_ = mc 
 
-  for sample in mc_: sample.style = styles.fillStyle(sample.color)
+for sample in mc_: sample.style = styles.fillStyle(sample.color)
 
-  if not args.noData:
-    stack = Stack(mc_, data_sample)#, data_sample_filtered)
-  else:
-    stack = Stack(mc_)
+if not args.noData:
+  stack = Stack(mc_, data_sample)#, data_sample_filtered)
+else:
+  stack = Stack(mc_)
 
-  stack.extend( [ [s] for s in signals ] )
+stack.extend( [ [s] for s in signals ] )
 
+#
+# Plots for each channel, the weight is 0 for events of the other channels
+#
+yields     = {}
+allPlots   = {}
+for index, mode in enumerate(allModes):
   # Use some defaults
-  Plot  .setDefaults(stack = stack, weight = staticmethod(weight_), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
-  Plot2D.setDefaults(stack = stack, weight = staticmethod(weight_), selectionString = cutInterpreter.cutString(args.selection), histo_class=ROOT.TH2D)
+  Plot  .setDefaults(stack = stack, weight = staticmethod(channelSelection.weight(weight_, mode)), selectionString = cutInterpreter.cutString(args.selection), addOverFlowBin='upper', histo_class=ROOT.TH1D)
+  Plot2D.setDefaults(stack = stack, weight = staticmethod(channelSelection.weight(weight_, mode)), selectionString = cutInterpreter.cutString(args.selection), histo_class=ROOT.TH2D)
   
   plots   = []
   plots2D = []
   plots.append(Plot(
     name = 'yield', texX = 'yield', texY = 'Number of Events',
-    attribute = lambda event, sample: 0.5 + index,
+    attribute = lambda event, sample, index = index: 0.5 + index,
     binning=[3, 0, 3],
   ))
 
@@ -1263,11 +1269,15 @@ for index, mode in enumerate(allModes):
       binning=[10,0,1],
     ))
 
-   
-  plotting.fill(plots + plots2D, read_variables = read_variables, sequence = sequence)
+  allPlots[mode] = plots + plots2D
+
+plotting.fill(sum([allPlots[mode] for mode in allModes], []), read_variables = read_variables, sequence = sequence)
+
+for index, mode in enumerate(allModes):
+  yields[mode] = {}
 
   # Get normalization yields from yield histogram
-  for plot in plots:
+  for plot in allPlots[mode]:
     if plot.name == "yield":
       for i, l in enumerate(plot.histos):
         for j, h in enumerate(l):
@@ -1280,8 +1290,7 @@ for index, mode in enumerate(allModes):
   yields[mode]["MC"] = sum(yields[mode][s.name] for s in mc_)
   dataMCScale        = yields[mode]["data"]/yields[mode]["MC"] if yields[mode]["MC"] != 0 else float('nan')
 
-  drawPlots(plots + plots2D, mode, dataMCScale)
-  allPlots[mode] = plots + plots2D
+  drawPlots(allPlots[mode], mode, dataMCScale)
 
 # Add the different channels into SF and all
 for mode in ["SF","all"]:
@@ -0,0 +1,44 @@
+''' Lepton channels (mumu, mue, ee, ...) of an event for filling all channels in one loop over a sample.
+    The samples are read with the OR of the channel selections. The channel of each event is obtained from
+    the python version of the channel selection strings and the plots of a channel get a weight that is 0
+    for the events of the other channels.
+'''
+# StopsDilepton
+from StopsDilepton.plots.cutFunction import cutFunction
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class ChannelSelection:
+
+    def __init__( self, selections ):
+        ''' selections: list of ( channel, selectionString ), the channels must be exclusive '''
+        self.channels   = [ channel for channel, selection in selections ]
+        self.selections = dict( selections )
+        self.functions  = []
+        variables       = set()
+        for channel, selection in selections:
+            function, variables_ = cutFunction( selection )
+            self.functions.append( ( channel, function ) )
+            variables.update( variables_ )
+        self.variables = sorted( variables )
+        logger.info( "Channel selection for %s, %i variables evaluated per event.", ", ".join( self.channels ), len(self.variables) )
+
+    def selectionString( self ):
+        ''' Selection passed by the events of any channel '''
+        return "||".join( "(%s)" % self.selections[channel] for channel in self.channels )
+
+    def channel( self, event ):
+        ''' First channel the event belongs to, None otherwise '''
+        for channel, function in self.functions:
+            if function( event ):
+                return channel
+
+    def sequence( self, event, sample ):
+        ''' Sequence function storing the channel as event.channel '''
+        event.channel = self.channel( event )
+
+    def weight( self, weight, channel ):
+        ''' Plot weight that is 0 for events not in channel '''
+        return lambda event, sample: weight( event, sample ) if event.channel == channel else 0
@@ -0,0 +1,34 @@
+''' Python version of a cut string, evaluated per event on the event attributes.
+    Used for the selections that are applied per event when several selections are filled in the same loop over a sample
+    (lepton channels in channelSelection, systematic variations in systematicSelection).
+    Cut strings can be made of '&&', '||', '!', brackets, comparisons, arithmetic and the functions below.
+'''
+# Standard imports
+import re
+import keyword
+from math import sqrt, cos, sin, cosh, exp, log
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+functions  = { 'abs':abs, 'sqrt':sqrt, 'cos':cos, 'sin':sin, 'cosh':cosh, 'exp':exp, 'log':log }
+# names that are not part of a number (e.g. the exponent of 1e5)
+identifier = re.compile( r'(?<![\w.])[A-Za-z_]\w*' )
+
+def cutExpression( cut ):
+    ''' Compiled python expression and variables of a cut string '''
+    expression = re.sub( r'!(?!=)', ' not ', cut.replace( '&&', ' and ' ).replace( '||', ' or ' ) ).strip()
+    variables  = sorted( set( v for v in identifier.findall( expression ) if not keyword.iskeyword( v ) and v not in functions ) )
+    try:
+        code = compile( expression, '<cut>', 'eval' )
+    except SyntaxError:
+        raise ValueError( "Can't evaluate cut '%s' per event." % cut )
+    return code, variables
+
+def cutFunction( cut ):
+    ''' Returns ( function(event), variables ), the function is True if the event passes the cut '''
+    code, variables = cutExpression( cut )
+    def function( event ):
+        return bool( eval( code, functions, { v:getattr( event, v ) for v in variables } ) )
+    return function, variables
@@ -0,0 +1,52 @@
+''' Selections of systematic variations for single pass plotting.
+    The nominal and the JME shifted selections (e.g. nJetGood_JECUp>=2&&dl_mt2ll_JECUp>=100) are split into the '&&' atoms
+    common to all variations, which are applied when reading the samples, and the atoms specific to each variation,
+    which are evaluated per event on the event attributes. All variations can then be filled in the same loop over a sample.
+'''
+# StopsDilepton
+from StopsDilepton.analysis.YieldEngine import factorize
+from StopsDilepton.plots.cutFunction    import cutFunction
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class SystematicSelection:
+
+    def __init__( self, selections ):
+        ''' selections: {systematic:selectionString}, systematic None is the nominal selection '''
+        atoms         = { sys:set( factorize( selection, '&&', ['||'] ) ) for sys, selection in selections.iteritems() }
+        self.common   = sorted( set.intersection( *atoms.values() ) )
+        self.specific = { sys:sorted( a.difference( self.common ) ) for sys, a in atoms.iteritems() }
+
+        self.functions = {}
+        variables      = set()
+        for sys, atoms_ in self.specific.iteritems():
+            if not atoms_: continue
+            function, variables_ = cutFunction( "&&".join( "(%s)" % a for a in atoms_ ) )
+            self.functions[sys] = function
+            variables.update( variables_ )
+        self.variables = sorted( variables )
+        logger.info( "Systematic selection: %i common atoms, %i atoms evaluated per event for %i variations.",
+                     len(self.common), len( set( sum( self.specific.values(), [] ) ) ), len(self.functions) )
+
+    def selectionString( self ):
+        ''' Loose selection passed by the events of any variation '''
+        common   = "&&".join( "(%s)" % a for a in self.common )
+        specific = sorted( set( "&&".join( "(%s)" % a for a in atoms ) for atoms in self.specific.values() ) )
+        if not specific or "" in specific:
+            return common if common else "(1)"
+        any_ = "||".join( "(%s)" % s for s in specific )
+        return "&&".join( [ common, "(%s)" % any_ ] ) if common else "(%s)" % any_
+
+    def passes( self, event ):
+        ''' {systematic:bool} for the event '''
+        return { sys:( self.functions[sys]( event ) if self.functions.has_key( sys ) else True ) for sys in self.specific.keys() }
+
+    def sequence( self, event, sample ):
+        ''' Sequence function storing the result of passes as event.passesSystematic '''
+        event.passesSystematic = self.passes( event )
+
+    def weight( self, weight, sys ):
+        ''' Plot weight that is 0 for events failing the selection of the systematic '''
+        return lambda event, sample: weight( event, sample ) if event.passesSystematic[sys] else 0
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+''' Compare the output of nanoPostProcessing.py with and without --vectorized, branch by branch and event by event. E.g.
+    python nanoPostProcessing.py --small --year 2016 --skim dilep --sample TTLep_pow --targetDir /tmp/perEvent
+    python nanoPostProcessing.py --small --year 2016 --skim dilep --sample TTLep_pow --targetDir /tmp/vectorized --vectorized
+    python compareVectorizedOutput.py --reference /tmp/perEvent/.../TTLep_pow.root --candidate /tmp/vectorized/.../TTLep_pow.root
+'''
+# Standard
+import ROOT
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.columnarSelection import drawArray
+
+def get_parser():
+    import argparse
+    argParser = argparse.ArgumentParser(description = "Argument parser for compareVectorizedOutput")
+    argParser.add_argument('--reference', action='store', type=str, required=True,                  help="Output of the per-event filler")
+    argParser.add_argument('--candidate', action='store', type=str, required=True,                  help="Output of the vectorized filler")
+    argParser.add_argument('--rtol',      action='store', type=float, default=1e-6,                 help="Relative tolerance")
+    argParser.add_argument('--atol',      action='store', type=float, default=1e-9,                 help="Absolute tolerance")
+    argParser.add_argument('--branches',  action='store', nargs='*', type=str, default=None,        help="Only compare these branches")
+    argParser.add_argument('--logLevel',  action='store', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], default='INFO', help="Log level for logging" )
+    return argParser
+
+args = get_parser().parse_args()
+
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None )
+
+files = [ ROOT.TFile.Open( f ) for f in [args.reference, args.candidate] ]
+trees = [ f.Get("Events") for f in files ]
+
+nEvents = [ t.GetEntries() for t in trees ]
+if nEvents[0] != nEvents[1]:
+    logger.error( "Different number of events: %i vs. %i", *nEvents )
+    raise SystemExit(1)
+
+names = [ set( b.GetName() for b in t.GetListOfBranches() ) for t in trees ]
+for missing in names[0].difference( names[1] ):
+    logger.warning( "Branch %s missing in candidate", missing )
+for extra in names[1].difference( names[0] ):
+    logger.warning( "Branch %s only in candidate", extra )
+
+branches = sorted( names[0].intersection( names[1] ) ) if args.branches is None else args.branches
+
+# JEC/JER variations are filled from separate code paths and are always compared
+variations        = [ 'jesTotalUp', 'jesTotalDown', 'jerUp', 'jer', 'jerDown' ]
+variationBranches = [ b+'_'+var for var in variations for b in [ 'nJetGood', 'nBTag', 'met_pt', 'met_phi', 'dl_mt2ll', 'dl_mt2bb', 'dl_mt2blbl' ] ]
+
+failed = []
+for branch in variationBranches:
+    if branch in names[0] and branch not in names[1]:
+        logger.error( "Variation branch %s missing in candidate", branch )
+        failed.append( branch )
+    elif branch in names[0] and branch not in branches:
+        branches.append( branch )
+for branch in branches:
+    ref, cand = [ drawArray( t, branch, 0, nEvents[0], nRows = 100*nEvents[0] ) for t in trees ]
+    if len(ref) != len(cand):
+        logger.error( "%s: different number of values %i vs. %i", branch, len(ref), len(cand) )
+        failed.append( branch )
+        continue
+    close = np.isclose( ref, cand, rtol = args.rtol, atol = args.atol, equal_nan = True )
+    if not close.all():
+        first = np.nonzero( ~close )[0][0]
+        logger.error( "%s: %i/%i values differ, first at row %i: %r vs. %r", branch, (~close).sum(), len(ref), first, ref[first], cand[first] )
+        failed.append( branch )
+    elif not np.array_equal( ref[~np.isnan(ref)], cand[~np.isnan(cand)] ):
+        logger.info( "%s: identical within tolerance, max. abs. difference %g", branch, np.nanmax( np.abs( ref - cand ) ) )
+    else:
+        logger.debug( "%s: bit-identical", branch )
+
+logger.info( "Compared %i branches of %i events, %i differ: %s", len(branches), nEvents[0], len(failed), ",".join( failed ) )
+raise SystemExit( 1 if failed else 0 )
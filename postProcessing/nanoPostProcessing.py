@@ -31,7 +31,9 @@ import StopsDilepton.tools.user as user
 from StopsDilepton.tools.mt2Calculator       import mt2Calculator
 from StopsDilepton.tools.helpers             import closestOSDLMassToMZ, writeObjToFile, m3, deltaR, bestDRMatchInCollection, deltaPhi, nonEmptyFile, getSortedZCandidates, getMinDLMass
 from StopsDilepton.tools.addJERScaling       import addJERScaling
-from StopsDilepton.tools.objectSelection     import muonSelector, eleSelector, getGoodMuons, getGoodElectrons,  getGoodJets, isBJet, jetId, isBJet, getGoodPhotons, getGenPartsAll, getJets, getPhotons, getAllJets, filterGenPhotons, genPhotonSelector, mergeCollections, genLepFromZ
+from StopsDilepton.tools.objectSelection     import muonSelector, eleSelector, getGoodMuons, getGoodElectrons,  getGoodJets, isBJet, jetId, isBJet, getGoodPhotons, getGenPartsAll, genVars, getJets, getPhotons, getAllJets, filterGenPhotons, genPhotonSelector, mergeCollections, genLepFromZ
+from StopsDilepton.tools.objectCollection    import getJetCollection
+from StopsDilepton.tools.genRecord           import GenRecord, GenParts
 from StopsDilepton.tools.getGenBoson         import getGenZ, getGenPhoton
 from StopsDilepton.tools.polReweighting      import getPolWeights
 from StopsDilepton.tools.triggerEfficiency   import triggerEfficiency
@@ -106,10 +108,19 @@ def get_parser():
     argParser.add_argument('--reapplyJECS',                 action='store_true',                                                        help="Reapply JECs to data?")
     argParser.add_argument('--reduceSizeBy',                action='store',     type=int,                                               help="Reduce the size of the sample by a factor of...")
     argParser.add_argument('--event',                       action='store',     type=int, default=-1,                                   help="Just process event no")
+    argParser.add_argument('--vectorized',                  action='store_true',                                                        help="Compute the lepton/jet selection, HT, nBTag and dilepton kinematics chunk-wise with numpy?")
+    argParser.add_argument('--vectorizedGenRecord',         action='store_true',                                                        help="Compute the gen photon isolation, parent lists and gen lepton ancestry with numpy arrays of the gen record?")
+    argParser.add_argument('--chunkSize',                   action='store',     type=int, default=100000,                               help="Number of events per chunk in the vectorized mode")
+    argParser.add_argument('--nanoToolsCacheDir',           action='store',     type=str, default=None,                                 help="Directory of the cache of the nanoAOD-tools output (no cache if not given)")
+    argParser.add_argument('--nanoToolsCacheSize',          action='store',     type=float, default=200,                                help="Maximum size of the nanoAOD-tools cache in GB")
+    argParser.add_argument('--nWorkers',                    action='store',     type=int, default=1,                                    help="Split the event range of this job among this many processes and merge their output")
 
     return argParser
 
-options = get_parser().parse_args()
+parser  = get_parser()
+options = parser.parse_args()
+if options.vectorized and options.keepAllJets:
+    parser.error( "--vectorized does not support --keepAllJets" )
 
 # Logging
 import StopsDilepton.tools.logger as _logger
@@ -352,19 +363,19 @@ else:
 
 renormISR = False
 if options.susySignal:
-    from StopsDilepton.samples.helpers import getT2ttSignalWeight, getT2ttISRNorm
+    from StopsDilepton.samples.signalMetadata import SignalMetadata
     logger.info( "SUSY signal samples to be processed: %s", ",".join(s.name for s in samples) )
     assert len(samples)==1, "Can only process one SUSY sample at a time."
     logger.info( "Signal weights will be drawn from %s files. If that's not the whole sample, stuff will be wrong.", len(samples[0].files))
     logger.info( "Fetching signal weights..." )
     logger.info( "Weights will be stored in %s for future use.", output_directory)
     print "loading weights from here:", os.path.join( user.cache_dir, str(options.year)), samples[0], samples[0].name
-    signalWeight = getT2ttSignalWeight( samples[0], lumi = targetLumi, cacheDir = os.path.join( user.cache_dir, str(options.year)) ) #Can use same x-sec/weight for T8bbllnunu as for T2tt
+    # weights, x-sec variations and ISR normalizations of all mass points, loaded once
+    signalMetadata = SignalMetadata.fromCache( samples[0], lumi = targetLumi, year = options.year, signal = nameForISR, cacheDir = os.path.join( user.cache_dir, str(options.year)) ) #Can use same x-sec/weight for T8bbllnunu as for T2tt
     logger.info("Done fetching signal weights.")
 
     logger.info("Fetching the normalization for the ISR weights.")
-    masspoints = signalWeight.keys()
-    if getT2ttISRNorm(sample, masspoints[0][0], masspoints[0][1], masspoints, options.year, signal=nameForISR, cacheDir = os.path.join( user.cache_dir, str(options.year))):
+    if signalMetadata.hasISRNorm():
         renormISR = True
         logger.info("Successfully loaded ISR normalzations.")
     else:
@@ -768,8 +779,24 @@ if not options.skipNanoTools:
     # remove empty files. this is necessary in 2018 because empty miniAOD files exist.
     sample.files = [ f for f in sample.files if nonEmptyFile(f) ]
     newFileList = []
+    cachedFiles = set()
+    if options.nanoToolsCacheDir:
+        from StopsDilepton.tools.nanoToolsCache import NanoToolsCache
+        nanoToolsCache = NanoToolsCache( options.nanoToolsCacheDir, maxSizeGB = options.nanoToolsCacheSize )
+    else:
+        nanoToolsCache = None
     logger.info("Starting nanoAOD postprocessing")
     for f in sample.files:
+        if nanoToolsCache:
+            # everything that determines the output of the modules below
+            cacheKey, cacheDescription = nanoToolsCache.key( f, cut = cut, year = options.year, era = era, isData = sample.isData, fastSim = options.fastSim,
+                                                             overwriteJEC = options.overwriteJEC, JER = JER, JERera = JERera, metSigParams = metSigParams, METBranchName = METBranchName )
+            cachedFile = nanoToolsCache.get( cacheKey )
+            if cachedFile:
+                cachedFiles.add( cachedFile )
+                newFileList.append( cachedFile )
+                continue
+
         JMECorrector = createJMECorrector(isMC=(not sample.isData), dataYear=options.year, runPeriod=era, jesUncert="Total", jetType = "AK4PFchs", metBranchName=METBranchName, isFastSim=options.fastSim, applySmearing=False)
         modules = [
             JMECorrector()
@@ -793,6 +820,8 @@ if not options.skipNanoTools:
         if not options.reuseNanoAOD:
             p.run()
         newFileList += [output_directory + '/' + f.split('/')[-1].replace('.root', '_for_%s_%s.root'%(sample.name, file_hash))]
+        if nanoToolsCache:
+            nanoToolsCache.add( cacheKey, newFileList[-1], cacheDescription )
     logger.info("Done. Replacing input files for further processing.")
     
     sample.files = newFileList
@@ -810,6 +839,14 @@ muSelector_  = muonSelector("tightMiniIso02", year = options.year )
 
 genPhotonSel_TTG_OR = genPhotonSelector( 'overlapTTGamma' )
 
+if options.vectorized:
+    from StopsDilepton.tools.columnarSelection  import ChunkedSelection
+    from StopsDilepton.tools.objectSelection    import electronVars, muonVars
+    from StopsDilepton.tools.helpers            import getObjDict
+    def makeColumnarSelection():
+        return ChunkedSelection( sample.chain, chunkSize = options.chunkSize, year = options.year, jetAbsEtaCut = 2.4, addSystematicVariations = addSystematicVariations )
+    columnarSelection = makeColumnarSelection()
+
 mothers = {"D":0, "B":0}
 grannies_D = {}
 grannies_B = {}
@@ -826,23 +863,45 @@ def filler( event ):
         ## overlap removal by lukas ##
         # GEN Particles
         logger.debug("Getting GenParts")
-        gPart = getGenPartsAll(r)
+        if options.vectorizedGenRecord:
+            # arrays of the gen record, dicts are only made for the particles that are used
+            genRecord = GenRecord.fromReader( r )
+            gPart     = GenParts( r, genRecord.n, genVars )
+        else:
+            gPart = getGenPartsAll(r)
         # GEN Jets
         logger.debug("Getting GenJets")
         gJets = getJets( r, jetVars=['pt','eta','phi','mass','partonFlavour','hadronFlavour','index'], jetColl="GenJet" )
 
         # Overlap removal flags for ttgamma/ttbar and Zgamma/DY
         logger.debug("GenPhotons")
-        GenPhoton                  = filterGenPhotons( gPart, status='last' )
+        if options.vectorizedGenRecord:
+            photonIndices = genRecord.photons()
+            parentIds    = {}
+            def photonParentIds( i ):
+                if i not in parentIds: parentIds[i] = genRecord.parentIds( i )
+                return parentIds[i]
+
+            # OR ttgamma/tt, DY/ZG, WG/WJets
+            isoIndices                 = photonIndices[ genRecord.isIsolated( photonIndices, coneSize=0.2,  ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ) ].tolist()
+            GenIsoPhoton               = [ gPart[i] for i in isoIndices ]
+            GenIsoPhotonNoMeson        = [ gPart[i] for i in isoIndices if not hasMesonMother( photonParentIds( i ) ) ]
+
+            # OR singleT/tG
+            isoIndicesSingleT          = photonIndices[ genRecord.isIsolated( photonIndices, coneSize=0.05, ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ) ].tolist()
+            GenIsoPhotonSingleT        = [ gPart[i] for i in isoIndicesSingleT ]
+            GenIsoPhotonNoMesonSingleT = [ gPart[i] for i in isoIndicesSingleT if not hasMesonMother( photonParentIds( i ) ) and not photonFromTopDecay( photonParentIds( i ) ) ]
+        else:
+            GenPhoton                  = filterGenPhotons( gPart, status='last' )
 
-        # OR ttgamma/tt, DY/ZG, WG/WJets
-        GenIsoPhoton               = filter( lambda g: isIsolatedPhoton( g, gPart, coneSize=0.2,  ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ), GenPhoton    )
-        GenIsoPhotonNoMeson        = filter( lambda g: not hasMesonMother( getParentIds( g, gPart ) ), GenIsoPhoton )
+            # OR ttgamma/tt, DY/ZG, WG/WJets
+            GenIsoPhoton               = filter( lambda g: isIsolatedPhoton( g, gPart, coneSize=0.2,  ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ), GenPhoton    )
+            GenIsoPhotonNoMeson        = filter( lambda g: not hasMesonMother( getParentIds( g, gPart ) ), GenIsoPhoton )
 
-        # OR singleT/tG
-        GenIsoPhotonSingleT        = filter( lambda g: isIsolatedPhoton( g, gPart, coneSize=0.05, ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ), GenPhoton    )
-        GenIsoPhotonNoMesonSingleT = filter( lambda g: not hasMesonMother( getParentIds( g, gPart ) ), GenIsoPhotonSingleT )
-        GenIsoPhotonNoMesonSingleT = filter( lambda g: not photonFromTopDecay( getParentIds( g, gPart ) ), GenIsoPhotonNoMesonSingleT )
+            # OR singleT/tG
+            GenIsoPhotonSingleT        = filter( lambda g: isIsolatedPhoton( g, gPart, coneSize=0.05, ptCut=5, excludedPdgIds=[12,-12,14,-14,16,-16] ), GenPhoton    )
+            GenIsoPhotonNoMesonSingleT = filter( lambda g: not hasMesonMother( getParentIds( g, gPart ) ), GenIsoPhotonSingleT )
+            GenIsoPhotonNoMesonSingleT = filter( lambda g: not photonFromTopDecay( getParentIds( g, gPart ) ), GenIsoPhotonNoMesonSingleT )
 
         event.isTTGamma = len( filter( lambda g: genPhotonSel_TTG_OR(g), GenIsoPhotonNoMeson        ) ) > 0
         #event.isZWGamma = len( filter( lambda g: genPhotonSel_ZG_OR(g),  GenIsoPhotonNoMeson        ) ) > 0
@@ -855,7 +914,7 @@ def filler( event ):
             event.overlapRemoval = not event.isTTGamma #good TTbar event
 
 
-        genLepsFromZ    = genLepFromZ(gPart)
+        genLepsFromZ    = [ gPart[i] for i in genRecord.leptonsFromZ() ] if options.vectorizedGenRecord else genLepFromZ(gPart)
         genZs           = getSortedZCandidates(genLepsFromZ)
         if len(genZs)>0:
             event.genZ_mass = genZs[0][0]
@@ -876,19 +935,20 @@ def filler( event ):
                         raise
 
     if options.susySignal:
-        r.GenSusyMStop = max([p['mass']*(abs(p['pdgId']==1000006)) for p in gPart])
-        r.GenSusyMNeutralino = max([p['mass']*(abs(p['pdgId']==1000022)) for p in gPart])
+        maxMass = genRecord.maxMass if options.vectorizedGenRecord else lambda pdgId: max([p['mass']*(abs(p['pdgId']==pdgId)) for p in gPart])
+        r.GenSusyMStop = maxMass(1000006)
+        r.GenSusyMNeutralino = maxMass(1000022)
         if 'T8bbllnunu' in options.samples[0]:
-            r.GenSusyMChargino = max([p['mass']*(abs(p['pdgId']==1000024)) for p in gPart])
-            r.GenSusyMSlepton = max([p['mass']*(abs(p['pdgId']==1000011)) for p in gPart]) #FIXME check PDG ID of slepton in sample
+            r.GenSusyMChargino = maxMass(1000024)
+            r.GenSusyMSlepton = maxMass(1000011) #FIXME check PDG ID of slepton in sample
             logger.debug("Slepton is selectron with mass %i", r.GenSusyMSlepton)
             event.sleptonPdg = 1000011
             if not r.GenSusyMSlepton > 0:
-                r.GenSusyMSlepton = max([p['mass']*(abs(p['pdgId']==1000013)) for p in gPart])
+                r.GenSusyMSlepton = maxMass(1000013)
                 logger.debug("Slepton is smuon with mass %i", r.GenSusyMSlepton)
                 event.sleptonPdg = 1000013
             if not r.GenSusyMSlepton > 0:
-                r.GenSusyMSlepton = max([p['mass']*(abs(p['pdgId']==1000015)) for p in gPart])
+                r.GenSusyMSlepton = maxMass(1000015)
                 logger.debug("Slepton is stau with mass %i", r.GenSusyMSlepton)
                 event.sleptonPdg = 1000015
             event.mCha  = int(round(r.GenSusyMChargino,0))
@@ -898,18 +958,19 @@ def filler( event ):
         #    event.weight_pol_L = pol_weights[0]
         #    event.weight_pol_R = pol_weights[1]
 
-        try:
-            event.weight=signalWeight[(int(r.GenSusyMStop), int(r.GenSusyMNeutralino))]['weight'] #* r.genWeight
-            #print 'weight', signalWeight[(int(r.GenSusyMStop), int(r.GenSusyMNeutralino))]['weight']
-        except KeyError:
+        metadata = signalMetadata.get(int(r.GenSusyMStop), int(r.GenSusyMNeutralino))
+        if metadata is not None:
+            event.weight = metadata[0] #* r.genWeight
+        else:
             logger.info("Couldn't find weight for %s, %s. Setting weight to 0.", r.GenSusyMStop, r.GenSusyMNeutralino)
             event.weight = 0.
         event.mStop = int(r.GenSusyMStop)
         event.mNeu  = int(r.GenSusyMNeutralino)
-        try:
-            event.reweightXSecUp    = signalWeight[(r.GenSusyMStop, r.GenSusyMNeutralino)]['xSecFacUp']
-            event.reweightXSecDown  = signalWeight[(r.GenSusyMStop, r.GenSusyMNeutralino)]['xSecFacDown']
-        except KeyError:
+        metadata = signalMetadata.get(r.GenSusyMStop, r.GenSusyMNeutralino)
+        if metadata is not None:
+            event.reweightXSecUp    = metadata[1]
+            event.reweightXSecDown  = metadata[2]
+        else:
             logger.info("Couldn't find weight for %s, %s. Setting weight to 0.", r.GenSusyMStop, r.GenSusyMNeutralino)
             event.reweightXSecUp    = 0.
             event.reweightXSecDown  = 0.
@@ -952,7 +1013,7 @@ def filler( event ):
     # top pt reweighting
     if isMC:
         event.reweightTopPt     = topPtReweightingFunc(getTopPtsForReweighting(r)) * topScaleF if doTopPtReweighting else 1.
-        ISRnorm = getT2ttISRNorm(samples[0], r.GenSusyMStop, r.GenSusyMNeutralino, masspoints, options.year, signal=nameForISR, cacheDir=os.path.join( user.cache_dir, str(options.year))) if renormISR else 1
+        ISRnorm = signalMetadata.getISRNorm(r.GenSusyMStop, r.GenSusyMNeutralino) if renormISR else 1
         event.reweight_nISR     = isr.getWeight(r, norm=ISRnorm )             if options.susySignal else 1
         event.reweight_nISRUp   = isr.getWeight(r, norm=ISRnorm, sigma=1)     if options.susySignal else 1
         event.reweight_nISRDown = isr.getWeight(r, norm=ISRnorm, sigma=-1)    if options.susySignal else 1
@@ -970,8 +1031,13 @@ def filler( event ):
         event.reweightL1Prefire, event.reweightL1PrefireUp, event.reweightL1PrefireDown = L1PW.getWeight(allSlimmedPhotons, allSlimmedJets)
 
     # get leptons before jets in order to clean jets
-    electrons_pt10  = getGoodElectrons(r, ele_selector = eleSelector_)
-    muons_pt10      = getGoodMuons(r,     mu_selector = muSelector_ )
+    if options.vectorized:
+        vec = columnarSelection.event( sample.chain.GetReadEntry() )
+        electrons_pt10  = [ getObjDict(r, 'Electron_', electronVars, i) for i in vec['electrons'] ]
+        muons_pt10      = [ getObjDict(r, 'Muon_',     muonVars,     i) for i in vec['muons'] ]
+    else:
+        electrons_pt10  = getGoodElectrons(r, ele_selector = eleSelector_)
+        muons_pt10      = getGoodMuons(r,     mu_selector = muSelector_ )
 
     for e in electrons_pt10:
         e['pdgId']      = int( -11*e['charge'] )
@@ -1002,15 +1068,27 @@ def filler( event ):
     jetPtVar = 'pt_nom' # see comment below
 
     # with the latest change, getAllJets calculates the correct jet pt (removing JER) and stores it as Jet_pt again. No need for Jet_pt_nom anymore
-    allJetsNotClean = getAllJets(r, [], ptCut=0, absEtaCut=99, jetVars=jetVarNames, jetCollections=["Jet"], idVar=None)
-    reallyAllJets= getAllJets(r, leptons, ptCut=0, absEtaCut=99, jetVars=jetVarNames, jetCollections=["Jet"], idVar='jetId') # keeping robert's comment: ... yeah, I know.
-    allJets      = filter(lambda j:abs(j['eta'])<jetAbsEtaCut, reallyAllJets)
-    jets         = filter(lambda j:jetId(j, ptCut=30, absEtaCut=jetAbsEtaCut, ptVar=jetPtVar), allJets)
-    soft_jets    = filter(lambda j:jetId(j, ptCut=0,  absEtaCut=jetAbsEtaCut) and j['pt']<30., allJets) if options.keepAllJets else []
-    bJets        = filter(lambda j:isBJet(j, tagger="DeepCSV", year=options.year) and abs(j['eta'])<=2.4    , jets)
-    nonBJets     = filter(lambda j:not ( isBJet(j, tagger="DeepCSV", year=options.year) and abs(j['eta'])<=2.4 ), jets)
-
-    nHEMJets = len(filter( lambda j:j['pt']>20 and j['eta']>-3.2 and j['eta']<-1.0 and j['phi']>-2.0 and j['phi']<-0.5, allJets ))
+    if options.vectorized:
+        # only the selected jets are turned into dicts
+        jetDicts     = { i:getObjDict(r, 'Jet_', jetVarNames, i) for i in vec['jets'] }
+        jets         = [ jetDicts[i] for i in vec['jets'] ]
+        soft_jets    = []
+        bJets        = [ jetDicts[i] for i in vec['bJets'] ]
+        nonBJets     = [ jetDicts[i] for i in vec['nonBJets'] ]
+        nHEMJets     = vec['nHEMJets']
+    else:
+        # same selections as getAllJets & filter, but on a Collection of the jets: only the stored jets are turned into dicts
+        jetCollection   = getJetCollection(r, jetVars=jetVarNames)
+        allJetsNotClean = jetCollection.select(lambda j:jetId(j, ptCut=0, absEtaCut=99, idVar=None)).sort('pt')
+        reallyAllJets= jetCollection.select(lambda j:jetId(j, ptCut=0, absEtaCut=99, idVar='jetId')).cleanedAgainst(leptons).sort('pt') # keeping robert's comment: ... yeah, I know.
+        allJets      = reallyAllJets.select(lambda j:abs(j['eta'])<jetAbsEtaCut)
+        jets         = allJets.select(lambda j:jetId(j, ptCut=30, absEtaCut=jetAbsEtaCut, ptVar=jetPtVar))
+        soft_jets    = allJets.select(lambda j:jetId(j, ptCut=0,  absEtaCut=jetAbsEtaCut) & (j['pt']<30.)).toDicts() if options.keepAllJets else []
+        bJets        = jets.select(lambda j:isBJet(j, tagger="DeepCSV", year=options.year) & (abs(j['eta'])<=2.4)).toDicts()
+        nonBJets     = jets.select(lambda j:~( isBJet(j, tagger="DeepCSV", year=options.year) & (abs(j['eta'])<=2.4) )).toDicts()
+        jets         = jets.toDicts()
+
+        nHEMJets = len(allJets.select( lambda j:(j['pt']>20) & (j['eta']>-3.2) & (j['eta']<-1.0) & (j['phi']>-2.0) & (j['phi']<-0.5) ))
 
     if isData:
         event.reweightHEM = (r.run>=319077 and nHEMJets==0) or r.run<319077
@@ -1055,7 +1133,7 @@ def filler( event ):
         # Compute M3 and the three indiced of the jets entering m3
         event.m3, event.m3_ind1, event.m3_ind2, event.m3_ind3 = m3( jets )
 
-    event.ht         = sum([j[jetPtVar] for j in jets])
+    event.ht         = sum([j[jetPtVar] for j in jets]) if not options.vectorized else vec['ht']
     event.metSig     = event.met_pt/sqrt(event.ht) if event.ht>0 else float('nan')
     event.nBTag      = len(bJets)
 
@@ -1085,16 +1163,23 @@ def filler( event ):
         for var in ['jesTotalUp', 'jesTotalDown', 'jerUp', 'jerDown', 'unclustEnUp', 'unclustEnDown']: # don't use 'jer' as of now
             setattr(event, 'met_pt_'+var,  getattr(r, 'METFixEE2017_pt_'+var)  if options.year == 2017 else getattr(r, 'MET_pt_'+var) )
             setattr(event, 'met_phi_'+var, getattr(r, 'METFixEE2017_phi_'+var) if options.year == 2017 else getattr(r, 'MET_phi_'+var) )
-            if not var.startswith('unclust'):
+            if not var.startswith('unclust') and options.vectorized:
+                jetDicts.update( { i:getObjDict(r, 'Jet_', jetVarNames, i) for i in vec['jets_'+var] if not jetDicts.has_key(i) } )
+                jets_sys[var]       = [ jetDicts[i] for i in vec['jets_'+var] ]
+                bjets_sys[var]      = [ jetDicts[i] for i in vec['bJets_'+var] ]
+                nonBjets_sys[var]   = [ jetDicts[i] for i in vec['nonBJets_'+var] ]
+                ht = vec['ht_'+var]
+            elif not var.startswith('unclust'):
                 corrFactor = 'corr_JER' if var == 'jer' else None
                 alljets_sys[var]    = allJetsNotClean
-                jets_sys[var]       = filter(lambda j: jetId(j, ptCut=30, absEtaCut=jetAbsEtaCut, ptVar='pt_'+var if not var=='jer' else 'pt_nom', corrFactor=corrFactor), allJets)
-                bjets_sys[var]      = filter(lambda j: isBJet(j) and abs(j['eta'])<2.4, jets_sys[var])
-                nonBjets_sys[var]   = filter(lambda j: not ( isBJet(j) and abs(j['eta'])<2.4), jets_sys[var])
+                jets_sys[var]       = allJets.select(lambda j: jetId(j, ptCut=30, absEtaCut=jetAbsEtaCut, ptVar='pt_'+var if not var=='jer' else 'pt_nom', corrFactor=corrFactor))
+                bjets_sys[var]      = jets_sys[var].select(lambda j: isBJet(j) & (abs(j['eta'])<2.4))
+                nonBjets_sys[var]   = jets_sys[var].select(lambda j: ~( isBJet(j) & (abs(j['eta'])<2.4) ))
                 
                 # calculate ht
-                ht = sum([j['pt_nom']*j['corr_JER'] for j in jets_sys[var]]) if var == 'jer' else sum([j['pt_'+var] for j in jets_sys[var]])
+                ht = sum((jets_sys[var]['pt_nom']*jets_sys[var]['corr_JER']).tolist()) if var == 'jer' else sum(jets_sys[var]['pt_'+var].tolist())
 
+            if not var.startswith('unclust'):
                 setattr(event, "nJetGood_"+var, len(jets_sys[var]))
                 setattr(event, "ht_"+var,       ht)
                 setattr(event, "nBTag_"+var,    len(bjets_sys[var]))
@@ -1191,15 +1276,18 @@ def filler( event ):
             event.isEMu  = l_pdgs==[11,13]
             event.isOS   = event.l1_pdgId*event.l2_pdgId<0
 
-            l1 = ROOT.TLorentzVector()
-            l1.SetPtEtaPhiM(leptons[0]['pt'], leptons[0]['eta'], leptons[0]['phi'], 0 )
-            l2 = ROOT.TLorentzVector()
-            l2.SetPtEtaPhiM(leptons[1]['pt'], leptons[1]['eta'], leptons[1]['phi'], 0 )
-            dl = l1+l2
-            event.dl_pt   = dl.Pt()
-            event.dl_eta  = dl.Eta()
-            event.dl_phi  = dl.Phi()
-            event.dl_mass = dl.M()
+            if options.vectorized:
+                event.dl_pt, event.dl_eta, event.dl_phi, event.dl_mass = vec['dl_pt'], vec['dl_eta'], vec['dl_phi'], vec['dl_mass']
+            else:
+                l1 = ROOT.TLorentzVector()
+                l1.SetPtEtaPhiM(leptons[0]['pt'], leptons[0]['eta'], leptons[0]['phi'], 0 )
+                l2 = ROOT.TLorentzVector()
+                l2.SetPtEtaPhiM(leptons[1]['pt'], leptons[1]['eta'], leptons[1]['phi'], 0 )
+                dl = l1+l2
+                event.dl_pt   = dl.Pt()
+                event.dl_eta  = dl.Eta()
+                event.dl_phi  = dl.Phi()
+                event.dl_mass = dl.M()
             mt2Calculator.setLeptons(event.l1_pt, event.l1_eta, event.l1_phi, event.l2_pt, event.l2_eta, event.l2_phi)
 
             # To check MC truth when looking at the TTZToLLNuNu sample
@@ -1216,6 +1304,9 @@ def filler( event ):
             if event.nPhotonGood > 0:
               gamma = ROOT.TLorentzVector()
               gamma.SetPtEtaPhiM(photons[0]['pt'], photons[0]['eta'], photons[0]['phi'], photons[0]['mass'] )
+              if options.vectorized:
+                  dl = ROOT.TLorentzVector()
+                  dl.SetPtEtaPhiM(event.dl_pt, event.dl_eta, event.dl_phi, event.dl_mass)
               dlg = dl + gamma
               event.dlg_mass = dlg.M()
 
@@ -1304,16 +1395,24 @@ def filler( event ):
                 setattr(event, 'reweightBTag_'+var, btagEff.getBTagSF_1a( var, bJets, filter( lambda j: abs(j['eta'])<2.4, nonBJets ) ) )
     # gen information on extra leptons
     if isMC and not options.skipGenLepMatching:
-        genSearch.init( gPart )
         # Start with status 1 gen leptons in acceptance
-        gLep = filter( lambda p:abs(p['pdgId']) in [11, 13] and p['status']==1 and p['pt']>20 and abs(p['eta'])<2.5, gPart )
+        if options.vectorizedGenRecord:
+            gLep = [ gPart[i] for i in genRecord.finalStateLeptons( ptCut = 20, absEtaCut = 2.5 ) ]
+            ancestryCounts = genRecord.ancestryCounts()
+        else:
+            genSearch.init( gPart )
+            gLep = filter( lambda p:abs(p['pdgId']) in [11, 13] and p['status']==1 and p['pt']>20 and abs(p['eta'])<2.5, gPart )
         for l in gLep:
-            ancestry = [ gPart[x]['pdgId'] for x in genSearch.ancestry( l ) ]
-            l["n_D"]   =  sum([ancestry.count(p) for p in D_mesons])
-            l["n_B"]   =  sum([ancestry.count(p) for p in B_mesons])
-            l["n_W"]   =  sum([ancestry.count(p) for p in [24, -24]])
-            l["n_t"]   =  sum([ancestry.count(p) for p in [6, -6]])
-            l["n_tau"] =  sum([ancestry.count(p) for p in [15, -15]])
+            if options.vectorizedGenRecord:
+                for key, counts in ancestryCounts.iteritems():
+                    l[key] = int( counts[ l['index'] ] )
+            else:
+                ancestry = [ gPart[x]['pdgId'] for x in genSearch.ancestry( l ) ]
+                l["n_D"]   =  sum([ancestry.count(p) for p in D_mesons])
+                l["n_B"]   =  sum([ancestry.count(p) for p in B_mesons])
+                l["n_W"]   =  sum([ancestry.count(p) for p in [24, -24]])
+                l["n_t"]   =  sum([ancestry.count(p) for p in [6, -6]])
+                l["n_tau"] =  sum([ancestry.count(p) for p in [15, -15]])
             matched_lep = bestDRMatchInCollection(l, leptons_pt10)
             if matched_lep:
                 l["lepGoodMatchIndex"] = matched_lep['index']
@@ -1356,32 +1455,29 @@ filename, ext = os.path.splitext( os.path.join(output_directory, sample.name + '
 if len(eventRanges)>1:
     raise RuntimeError("Using fileBasedSplitting but have more than one event range!")
 
-clonedEvents = 0
-convertedEvents = 0
-outputLumiList = {}
-for ievtRange, eventRange in enumerate( eventRanges ):
-
-    logger.info( "Processing range %i/%i from %i to %i which are %i events.",  ievtRange, len(eventRanges), eventRange[0], eventRange[1], eventRange[1]-eventRange[0] )
+def processEventRange( eventRange, outfilename, reopen = False ):
+    ''' Run the filler on the event range and write the Events tree to outfilename.
+        Returns the number of cloned and converted events and the lumis of the processed data events.
+    '''
+    global reader, columnarSelection
+    if reopen:
+        # in a worker process: open the input again instead of sharing the file descriptors of the parent
+        sample.clear()
+        reader = sample.treeReader( variables = read_variables, selectionString = "&&".join(skimConds) )
+        if options.vectorized:
+            columnarSelection = makeColumnarSelection()
 
-    _logger.   add_fileHandler( outfilename.replace('.root', '.log'), options.logLevel )
-    _logger_rt.add_fileHandler( outfilename.replace('.root', '_rt.log'), options.logLevel )
-    
     tmp_directory = ROOT.gDirectory
     outputfile = ROOT.TFile.Open(outfilename, 'recreate')
     tmp_directory.cd()
 
-    if options.small: 
-        logger.info("Running 'small'. Not more than 10000 events") 
-        nMaxEvents = eventRange[1]-eventRange[0]
-        eventRange = ( eventRange[0], eventRange[0] +  min( [nMaxEvents, 10000] ) )
-
     # Set the reader to the event range
     reader.setEventRange( eventRange )
 
     logger.info("Cloning tree.")
     clonedTree = reader.cloneTree( branchKeepStrings, newTreename = "Events", rootfile = outputfile )
 
-    clonedEvents += clonedTree.GetEntries()
+    clonedEvents = clonedTree.GetEntries()
     # Clone the empty maker in order to avoid recompilation at every loop iteration
     maker = treeMaker_parent.cloneWithoutCompile( externalTree = clonedTree )
 
@@ -1389,6 +1485,7 @@ for ievtRange, eventRange in enumerate( eventRanges ):
     # Do the thing
     reader.start()
 
+    outputLumiList = {}
     while reader.run():
         maker.run()
         if sample.isData:
@@ -1399,14 +1496,70 @@ for ievtRange, eventRange in enumerate( eventRanges ):
                     if reader.event.luminosityBlock not in outputLumiList[reader.event.run]:
                         outputLumiList[reader.event.run].add(reader.event.luminosityBlock)
 
-    convertedEvents += maker.tree.GetEntries()
+    convertedEvents = maker.tree.GetEntries()
     logger.info("Writing tree")
     maker.tree.Write()
     outputfile.Close()
     logger.info( "Written %s", outfilename)
 
-  # Destroy the TTree
+    # Destroy the TTree
     maker.clear()
+    return clonedEvents, convertedEvents, outputLumiList
+
+def processEventRangeInWorker( args ):
+    return processEventRange( *args, reopen = True )
+
+def mergeEventsTrees( partFiles, outfilename ):
+    ''' Merge the Events trees of the partial files in the given order '''
+    merger = ROOT.TFileMerger( False )
+    merger.SetFastMethod( True )
+    merger.OutputFile( outfilename, 'RECREATE' )
+    for partFile in partFiles:
+        merger.AddFile( partFile )
+    if not merger.Merge():
+        raise RuntimeError( "Could not merge %s into %s" % ( ",".join( partFiles ), outfilename ) )
+
+clonedEvents = 0
+convertedEvents = 0
+outputLumiList = {}
+for ievtRange, eventRange in enumerate( eventRanges ):
+
+    logger.info( "Processing range %i/%i from %i to %i which are %i events.",  ievtRange, len(eventRanges), eventRange[0], eventRange[1], eventRange[1]-eventRange[0] )
+
+    _logger.   add_fileHandler( outfilename.replace('.root', '.log'), options.logLevel )
+    _logger_rt.add_fileHandler( outfilename.replace('.root', '_rt.log'), options.logLevel )
+
+    if options.small: 
+        logger.info("Running 'small'. Not more than 10000 events") 
+        nMaxEvents = eventRange[1]-eventRange[0]
+        eventRange = ( eventRange[0], eventRange[0] +  min( [nMaxEvents, 10000] ) )
+
+    if options.nWorkers > 1:
+        # contiguous sub-ranges, merged in order
+        bounds    = [ eventRange[0] + ( (eventRange[1]-eventRange[0])*i )//options.nWorkers for i in range( options.nWorkers+1 ) ]
+        subRanges = [ (bounds[i], bounds[i+1]) for i in range( options.nWorkers ) if bounds[i+1] > bounds[i] ]
+        partFiles = [ outfilename.replace('.root', '_part%i.root'%i) for i in range( len(subRanges) ) ]
+        logger.info( "Processing %i sub-ranges in parallel: %s", len(subRanges), ", ".join( "%i-%i"%subRange for subRange in subRanges ) )
+
+        from multiprocessing import Pool
+        pool = Pool( processes = len(subRanges) )
+        results = pool.map( processEventRangeInWorker, zip( subRanges, partFiles ) )
+        pool.close()
+        pool.join()
+
+        mergeEventsTrees( partFiles, outfilename )
+        for partFile in partFiles:
+            os.remove( partFile )
+        logger.info( "Merged %i partial files into %s", len(partFiles), outfilename )
+    else:
+        results = [ processEventRange( eventRange, outfilename ) ]
+
+    for cloned, converted, lumis in results:
+        clonedEvents    += cloned
+        convertedEvents += converted
+        for run, lumiBlocks in lumis.iteritems():
+            outputLumiList.setdefault( run, set() ).update( lumiBlocks )
+
     sample.clear()
 
 
@@ -1420,6 +1573,7 @@ if sample.isData and convertedEvents>0: # avoid json to be overwritten in cases
 
 if not options.keepNanoAOD and not options.skipNanoTools:
     for f in sample.files:
+        if f in cachedFiles: continue
         try:
             os.remove(f)
             logger.info("Removed nanoAOD file: %s", f)
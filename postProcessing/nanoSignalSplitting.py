@@ -9,6 +9,7 @@ import random
 import subprocess
 import datetime
 import shutil
+import numpy as np
 
 from array import array
 from operator import mul
@@ -215,6 +216,18 @@ def get_parser():
         help="Which year?"
         )
 
+    argParser.add_argument('--demultiplex',
+        action='store_true',
+        help="Read the chain once and route the events to the files of the mass points instead of one CopyTree per mass point."
+        )
+
+    argParser.add_argument('--maxOpenFiles',
+        action='store',
+        type=int,
+        default=50,
+        help="Maximum number of output files open at the same time in --demultiplex mode."
+        )
+
 
     return argParser
 
@@ -381,6 +394,71 @@ masspoints = list(chunks(signalWeight.keys(), chunkSize))
 
 job = options.job
 
+massCuts = ( "Max$(GenPart_mass*(abs(GenPart_pdgId)==1000006))", "Max$(GenPart_mass*(abs(GenPart_pdgId)==1000022))" )
+
+def needsWriting( signalFile ):
+    if os.path.exists(signalFile) and deepCheckRootFile(signalFile):
+        c = ROOT.TChain("Events")
+        c.Add(signalFile)
+        if c.GetEntries()==0:
+            options.overwrite = True # :-)
+    return not (os.path.exists(signalFile) and deepCheckRootFile(signalFile)) or options.overwrite
+
+def demultiplex( chain, signalFiles, maxOpenFiles = 50, autoFlush = -30000000 ):
+    ''' Write the events of each mass point to signalFiles[(mStop, mNeu)], evaluating the mass cuts only once per event.
+        At most maxOpenFiles output files are open at the same time, the other mass points are written in subsequent groups.
+        Every selected event is read exactly once. Returns the number of events per mass point.
+    '''
+    nEntries = chain.GetEntries()
+    chain.SetEstimate( nEntries + 1 )
+    if chain.Draw( ":".join( massCuts ), "", "goff" ) < 0:
+        raise RuntimeError( "Could not draw %s" % ":".join( massCuts ) )
+    n = chain.GetSelectedRows()
+    assert n == nEntries, "Expected one row per event, got %i for %i events." % ( n, nEntries )
+    v1, v2 = chain.GetV1(), chain.GetV2()
+    v1.SetSize( n )
+    v2.SetSize( n )
+    masses = np.stack( [ np.frombuffer( v1, dtype = np.float64, count = n ), np.frombuffer( v2, dtype = np.float64, count = n ) ], axis = 1 )
+
+    # entry numbers of each mass point (in increasing order)
+    entries = {}
+    if n > 0:
+        points, inverse = np.unique( masses, axis = 0, return_inverse = True )
+        order   = np.argsort( inverse, kind = 'mergesort' )
+        entries = dict( zip( map( tuple, points.tolist() ), np.split( order, np.cumsum( np.bincount( inverse, minlength = len(points) ) )[:-1] ) ) )
+    logger.info( "Found %i mass points in %i events.", len(entries), nEntries )
+
+    if nEntries > 0: chain.LoadTree( 0 )
+    nEvents = {}
+    todo    = sorted( signalFiles.keys() )
+    for group in [ todo[i:i+maxOpenFiles] for i in range( 0, len(todo), maxOpenFiles ) ]:
+        files, trees, route = [], [], []
+        for i_point, s in enumerate( group ):
+            outF = ROOT.TFile.Open( signalFiles[s], "RECREATE" )
+            outF.cd()
+            t = chain.CloneTree( 0 )
+            t.SetAutoFlush( autoFlush )
+            files.append( outF )
+            trees.append( t )
+            e = entries.get( s, np.zeros( 0, dtype = 'int64' ) )
+            route.append( np.stack( [ e, np.full( len(e), i_point, dtype = 'int64' ) ], axis = 1 ) )
+
+        # read the events of the group in the order of the chain
+        route = np.concatenate( route )
+        route = route[ np.argsort( route[:,0], kind = 'mergesort' ) ]
+        logger.info( "Writing %i events to %i files.", len(route), len(group) )
+        for entry, i_point in route.tolist():
+            chain.GetEntry( entry )
+            trees[i_point].Fill()
+
+        for s, outF, t in zip( group, files, trees ):
+            nEvents[s] = t.GetEntries()
+            outF.cd()
+            outF.Write()
+            outF.Close()
+            logger.info( "Written %i events for mStop %i mNeu %i to %s", nEvents[s], s[0], s[1], signalFiles[s] )
+    return nEvents
+
 print "All masspoints:"
 print masspoints
 
@@ -398,32 +476,37 @@ if options.T2tt or options.T8bbllnunu  or options.T2bW or options.T2bt or option
     print "Initialising chain, otherwise first mass point is empty"
     print output.chain
     if options.small: output.reduceFiles( to = 1 )
+
+    if options.T2tt: signal_prefix = 'T2tt_'
+    elif options.T2bW: signal_prefix = 'T2bW_'
+    elif options.T2bt: signal_prefix = 'T2bt_'
+    elif options.T8bbstausnu: signal_prefix = 'T8bbstausnu_XCha%s_XStau%s'%(x_cha,x_stau)
+    elif options.T8bbllnunu: signal_prefix = 'T8bbllnunu_XCha%s_XSlep%s_'%(x_cha,x_slep)
+    else: logger.info("Model isn't specified") 
+    signalFiles = { s:os.path.join(signalDir, signal_prefix + str(s[0]) + '_' + str(s[1]) + '.root' ) for s in masspoints[job] }
+    #signalFile = os.path.join(signalDir, 'T2tt_'+str(s[0])+'_'+str(s[1])+'.root' )
+
+    if options.demultiplex:
+        # one pass over the chain for all mass points of the job
+        demultiplexed = demultiplex( output.chain, { s:signalFiles[s] for s in masspoints[job] if needsWriting(signalFiles[s]) }, maxOpenFiles = options.maxOpenFiles )
+
     for i,s in enumerate(masspoints[job]):
         #cut = "GenSusyMStop=="+str(s[0])+"&&GenSusyMNeutralino=="+str(s[1]) #FIXME
         logger.info("Going to write masspoint mStop %i mNeu %i", s[0], s[1])
-        cut = "Max$(GenPart_mass*(abs(GenPart_pdgId)==1000006))=="+str(s[0])+"&&Max$(GenPart_mass*(abs(GenPart_pdgId)==1000022))=="+str(s[1])
+        cut = massCuts[0]+"=="+str(s[0])+"&&"+massCuts[1]+"=="+str(s[1])
         logger.debug("Using cut %s", cut)
-        if options.T2tt: signal_prefix = 'T2tt_'
-        elif options.T2bW: signal_prefix = 'T2bW_'
-        elif options.T2bt: signal_prefix = 'T2bt_'
-        elif options.T8bbstausnu: signal_prefix = 'T8bbstausnu_XCha%s_XStau%s'%(x_cha,x_stau)
-        elif options.T8bbllnunu: signal_prefix = 'T8bbllnunu_XCha%s_XSlep%s_'%(x_cha,x_slep)
-        else: logger.info("Model isn't specified") 
-        signalFile = os.path.join(signalDir, signal_prefix + str(s[0]) + '_' + str(s[1]) + '.root' )
-        #signalFile = os.path.join(signalDir, 'T2tt_'+str(s[0])+'_'+str(s[1])+'.root' )
+        signalFile = signalFiles[s]
         logger.debug("Ouput file will be %s", signalFile)
-        if os.path.exists(signalFile) and deepCheckRootFile(signalFile):
-            c = ROOT.TChain("Events")
-            c.Add(signalFile)
-            if c.GetEntries()==0:
-                options.overwrite = True # :-)
-
-        if not (os.path.exists(signalFile) and deepCheckRootFile(signalFile)) or options.overwrite:
-            outF = ROOT.TFile.Open(signalFile, "RECREATE")
-            t = output.chain.CopyTree(cut)
-            nEvents = t.GetEntries()
-            outF.Write()
-            outF.Close()
+
+        if ( options.demultiplex and s in demultiplexed ) or ( not options.demultiplex and needsWriting(signalFile) ):
+            if options.demultiplex:
+                nEvents = demultiplexed[s]
+            else:
+                outF = ROOT.TFile.Open(signalFile, "RECREATE")
+                t = output.chain.CopyTree(cut)
+                nEvents = t.GetEntries()
+                outF.Write()
+                outF.Close()
             logger.info( "Number of events %i", nEvents)
             inF = ROOT.TFile.Open(signalFile, "READ")
             try:
@@ -1,6 +1,7 @@
 # Standard imports 
 import os
 import ROOT
+import numpy as np
 
 # RootTools
 from RootTools.core.standard import *
@@ -132,16 +133,19 @@ def getT2ttSignalWeight(sample, lumi, cacheDir):
         logger.info("Writing signal weights to %s", cacheFile)
         writeObjToFile(cacheFile, hNEvents)
 
-    for i in range (mMax):
-        for j in range (mMax):
-            n = hNEvents.GetBinContent(hNEvents.FindBin(i,j))
-            if n>0:
-                print "nEvents", i, j, n
-                print "x-sec", xSecSusy_.getXSec(channel=channel,mass=i,sigma=0)
-            if n>0:
-                signalWeight[(i,j)] = {'weight':lumi*xSecSusy_.getXSec(channel=channel,mass=i,sigma=0)/n, 'xSecFacUp':xSecSusy_.getXSec(channel=channel,mass=i,sigma=1)/xSecSusy_.getXSec(channel=channel,mass=i,sigma=0), 'xSecFacDown':xSecSusy_.getXSec(channel=channel,mass=i,sigma=-1)/xSecSusy_.getXSec(channel=channel,mass=i,sigma=0)}
-                print lumi*xSecSusy_.getXSec(channel=channel,mass=i,sigma=0)/n
-    #            logger.info( "Found mStop %5i mNeu %5i Number of events: %6i, xSec: %10.6f, weight: %6.6f (+1 sigma rel: %6.6f, -1 sigma rel: %6.6f)", i,j,n, xSecSusy_.getXSec(channel=channel,mass=i,sigma=0),  signalWeight[(i,j)]['weight'], signalWeight[(i,j)]['xSecFacUp'], signalWeight[(i,j)]['xSecFacDown'] )
+    # non-empty bins of the 1 GeV x 1 GeV histogram, read in one go (bin i+1, j+1 contains mStop = i, mNeu = j)
+    if hNEvents.GetNbinsX() != mMax or hNEvents.GetNbinsY() != mMax or hNEvents.GetXaxis().GetXmin() != 0 or hNEvents.GetYaxis().GetXmin() != 0:
+        raise ValueError( "Unexpected binning of hNEvents in %s" % cacheFile )
+    dtype  = {'TH2F':np.float32, 'TH2D':np.float64, 'TH2I':np.int32, 'TH2S':np.int16}[hNEvents.ClassName()]
+    counts = np.frombuffer( hNEvents.GetArray(), dtype = dtype, count = hNEvents.GetSize() ).reshape( mMax+2, mMax+2 ).astype( np.float64 )
+    j, i   = np.nonzero( counts[1:mMax+1, 1:mMax+1] > 0 )
+    n      = counts[j+1, i+1]
+
+    xSec, xSecUp, xSecDown = [ xSecSusy_.getXSec(channel=channel, mass=i, sigma=sigma) for sigma in [0, 1, -1] ]
+    weight = lumi*xSec/n
+    for i_, j_, w_, up_, down_ in zip( i.tolist(), j.tolist(), weight.tolist(), (xSecUp/xSec).tolist(), (xSecDown/xSec).tolist() ):
+        signalWeight[(i_,j_)] = {'weight':w_, 'xSecFacUp':up_, 'xSecFacDown':down_}
+    logger.info( "Found %i mass points in %s", len(signalWeight), sample.name )
     del hNEvents
     return signalWeight
 
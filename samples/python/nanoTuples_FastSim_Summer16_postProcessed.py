@@ -9,12 +9,8 @@ logger = logging.getLogger(__name__)
 #RootTools
 from RootTools.core.standard import *
 
-signals_T2tt=[]
-signals_T2bW=[]
-signals_T8bbllnunu_XCha0p5_XSlep0p05 = []
-signals_T8bbllnunu_XCha0p5_XSlep0p09 = []
-signals_T8bbllnunu_XCha0p5_XSlep0p5  = []
-signals_T8bbllnunu_XCha0p5_XSlep0p95 = []
+# StopsDilepton
+from StopsDilepton.samples.signalCatalog import SignalCatalog
 
 # Data directory
 try:
@@ -34,103 +30,12 @@ except:
 logger.info("Loading Signal samples from directory %s", os.path.join(data_directory_, postProcessing_directory_))
 
 try:
-    for f in os.listdir(os.path.join(data_directory_, postProcessing_directory_, 'T2tt')):
-        if f.endswith('.root') and f.startswith('T2tt_'):
-            name = f.replace('.root','')
-            mStop, mNeu = name.replace('T2tt_','').split('_')
-    
-            tmp = Sample.fromFiles(\
-                name = name,
-                files = [os.path.join(os.path.join(data_directory_, postProcessing_directory_,'T2tt',f))],
-                treeName = "Events",
-                isData = False,
-                color = 8 ,
-                texName = "#tilde{t} #rightarrow t#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}} ("+mStop+","+mNeu+")"
-            )
-    
-            tmp.mStop = int(mStop)
-            tmp.mNeu = int(mNeu)
-            tmp.isFastSim = True
-    
-            exec("%s=tmp"%name)
-            exec("signals_T2tt.append(%s)"%name)
-    
-    logger.info("Loaded %i T2tt signals", len(signals_T2tt))
-    logger.debug("Loaded T2tt signals: %s", ",".join([s.name for s in signals_T2tt]))
-except:
-    logger.info("No T2tt signals found.")
-
-try:
-    for f in os.listdir(os.path.join(data_directory_, postProcessing_directory_, 'T2bW')):
-        if f.endswith('.root') and f.startswith('T2bW_'):
-            name = f.replace('.root','')
-            mStop, mNeu = name.replace('T2bW_','').split('_')
-    
-            tmp = Sample.fromFiles(\
-                name = name,
-                files = [os.path.join(os.path.join(data_directory_, postProcessing_directory_,'T2bW',f))],
-                treeName = "Events",
-                isData = False,
-                color = 8 ,
-                texName = "#tilde{t} #rightarrow t#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}} ("+mStop+","+mNeu+")"
-            )
-    
-            tmp.mStop = int(mStop)
-            tmp.mNeu = int(mNeu)
-            tmp.isFastSim = True
-    
-            exec("%s=tmp"%name)
-            exec("signals_T2bW.append(%s)"%name)
-    
-    logger.info("Loaded %i T2bW signals", len(signals_T2bW))
-    logger.debug("Loaded T2bW signals: %s", ",".join([s.name for s in signals_T2bW]))
-except:
-    logger.info("No T2bW signals found.")
+    from StopsDilepton.tools.user import cache_dir as cache_dir_
+except ImportError:
+    cache_dir_ = None
 
+catalog = SignalCatalog( os.path.join(data_directory_, postProcessing_directory_), models = ['T2tt', 'T2bW', 'T8bbllnunu'], cacheDir = cache_dir_ )
 
-try:
-    for f in os.listdir(os.path.join(data_directory_, postProcessing_directory_, 'T8bbllnunu')):
-        if f.endswith('.root') and f.startswith('T8bbllnunu_'):
-            name = f.replace('.root','')
-            xChaStr, xSlepStr, mStop, mNeu = name.replace('T8bbllnunu_','').split('_')
-            
-            bcha    = "b#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{#pm}}"
-            nuslep  = "#nu#tilde{l}"
-            lneu    = "l#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}}"
-            ra      = " #rightarrow "
-            
-            xCha = xChaStr.replace('XCha','').replace('p','.')
-            xSlep = xSlepStr.replace('XSlep','').replace('p','.')
-            
-            tmp = Sample.fromFiles(\
-                name = name,
-                files = [os.path.join(os.path.join(data_directory_, postProcessing_directory_,'T8bbllnunu',f))],
-                treeName = "Events",
-                isData = False,
-                color = 8 ,
-                texName = "#tilde{t} #rightarrow b#nu l#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}} ("+mStop+","+mNeu+","+xCha+","+xSlep+")"
-                #texName = "#tilde{t}" + ra + bcha + ra + nuslep + ra + lneu + "("+mStop+","+mNeu+","+xCha+","+xSlep+")"
-            )
-    
-            tmp.mStop   = int(mStop)
-            tmp.mNeu    = int(mNeu)
-            tmp.xCha    = float(xCha)
-            tmp.xSlep   = float(xSlep)
-            tmp.mCha    = int( tmp.xCha * ( tmp.mStop - tmp.mNeu ) + tmp.mNeu )
-            tmp.mSlep   = int( tmp.xSlep * ( tmp.mCha - tmp.mNeu ) + tmp.mNeu )
-            tmp.isFastSim = True
-    
-            exec("%s=tmp"%name)
-            if f.startswith('T8bbllnunu_XCha0p5_XSlep0p05'):
-                exec("signals_T8bbllnunu_XCha0p5_XSlep0p05.append(%s)"%name)
-            elif f.startswith('T8bbllnunu_XCha0p5_XSlep0p5'):
-                exec("signals_T8bbllnunu_XCha0p5_XSlep0p5.append(%s)"%name)
-            elif f.startswith('T8bbllnunu_XCha0p5_XSlep0p95'):
-                exec("signals_T8bbllnunu_XCha0p5_XSlep0p95.append(%s)"%name)
-            elif f.startswith('T8bbllnunu_XCha0p5_XSlep0p09'):
-                exec("signals_T8bbllnunu_XCha0p5_XSlep0p09.append(%s)"%name)
-            
-    logger.info("Loaded %i T8bbllnunu signals", len(signals_T8bbllnunu_XCha0p5_XSlep0p05) + len(signals_T8bbllnunu_XCha0p5_XSlep0p5) + len(signals_T8bbllnunu_XCha0p5_XSlep0p95))
-    logger.debug("Loaded T8bbllnunu signals: %s", ",".join([s.name for s in signals_T8bbllnunu_XCha0p5_XSlep0p05 + signals_T8bbllnunu_XCha0p5_XSlep0p5 + signals_T8bbllnunu_XCha0p5_XSlep0p95]))
-except:
-    logger.info("No T8bbllnunu signals found.")
+# The mass points (e.g. T2tt_650_0) and the lists signals_<group> are created from the catalog on first access
+sys.modules[__name__] = catalog.module( sys.modules[__name__], lists = [ 'signals_T2tt', 'signals_T2bW',
+    'signals_T8bbllnunu_XCha0p5_XSlep0p05', 'signals_T8bbllnunu_XCha0p5_XSlep0p09', 'signals_T8bbllnunu_XCha0p5_XSlep0p5', 'signals_T8bbllnunu_XCha0p5_XSlep0p95' ] )
@@ -0,0 +1,186 @@
+''' Catalog of the FastSim signal scans of a postprocessing directory.
+    The model directories (T2tt, T2bW, T8bbllnunu) are listed once and the index (sample name -> model, file, file mtime,
+    masses, number of events) is stored as pickle in the cache directory. The index is rebuilt when the mtime of a model
+    directory changes. Sample objects are only created when they are accessed.
+'''
+# Standard imports
+import os
+import types
+import pickle
+import hashlib
+
+# RootTools
+from RootTools.core.standard import *
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+def parseT2( model, name ):
+    mStop, mNeu = name.replace( model+'_', '' ).split('_')
+    return { 'mStop':int(mStop), 'mNeu':int(mNeu) }, \
+           "#tilde{t} #rightarrow t#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}} ("+mStop+","+mNeu+")"
+
+def parseT8( model, name ):
+    xChaStr, xSlepStr, mStop, mNeu = name.replace( model+'_', '' ).split('_')
+    xCha  = xChaStr.replace('XCha','').replace('p','.')
+    xSlep = xSlepStr.replace('XSlep','').replace('p','.')
+    attributes = { 'mStop':int(mStop), 'mNeu':int(mNeu), 'xCha':float(xCha), 'xSlep':float(xSlep) }
+    attributes['mCha']  = int( attributes['xCha'] * ( attributes['mStop'] - attributes['mNeu'] ) + attributes['mNeu'] )
+    attributes['mSlep'] = int( attributes['xSlep'] * ( attributes['mCha'] - attributes['mNeu'] ) + attributes['mNeu'] )
+    return attributes, \
+           "#tilde{t} #rightarrow b#nu l#tilde{#chi}_{#lower[-0.3]{1}}^{#lower[0.4]{0}} ("+mStop+","+mNeu+","+xCha+","+xSlep+")"
+
+class SignalCatalog:
+    parsers = { 'T2tt':parseT2, 'T2bW':parseT2, 'T8bbllnunu':parseT8 }
+
+    def __init__( self, directory, models, cacheDir = None ):
+        self.directory = directory
+        self.models    = models
+        self.indexFile = os.path.join( cacheDir, "signalCatalog_%s.pkl" % hashlib.md5( os.path.normpath( directory ) ).hexdigest() ) if cacheDir else None
+        self.__index   = None
+        self.__samples = {}
+
+    def directoryMTimes( self ):
+        ''' mtime of each model directory, None if it doesn't exist '''
+        res = {}
+        for model in self.models:
+            d = os.path.join( self.directory, model )
+            res[model] = os.path.getmtime( d ) if os.path.isdir( d ) else None
+        return res
+
+    @property
+    def index( self ):
+        if self.__index is None:
+            mtimes = self.directoryMTimes()
+            stored = self.load()
+            if stored is not None and stored['mtimes'] == mtimes:
+                self.__index = stored
+            else:
+                self.__index = self.build( mtimes, previous = stored )
+                self.save()
+            logger.info( "Signal catalog of %s: %s", self.directory,
+                         ", ".join( "%i %s" % ( len( self.names( model = model ) ), model ) for model in self.models ) )
+        return self.__index
+
+    def build( self, mtimes, previous = None ):
+        ''' List the model directories, the number of events of unchanged files is kept from previous '''
+        entries = {}
+        for model in self.models:
+            if mtimes[model] is None:
+                logger.info( "No %s signals found.", model )
+                continue
+            d = os.path.join( self.directory, model )
+            for f in os.listdir( d ):
+                if not ( f.endswith('.root') and f.startswith( model+'_' ) ): continue
+                name  = f.replace( '.root', '' )
+                attributes, texName = self.parsers[model]( model, name )
+                entry = { 'model':model, 'group':name.rsplit( '_', 2 )[0], 'file':os.path.join( d, f ), 'mtime':os.path.getmtime( os.path.join( d, f ) ),
+                          'attributes':attributes, 'texName':texName, 'nEvents':None }
+                if previous is not None and previous['entries'].has_key( name ):
+                    old = previous['entries'][name]
+                    if old['file'] == entry['file'] and old['mtime'] == entry['mtime']:
+                        entry['nEvents'] = old['nEvents']
+                entries[name] = entry
+        logger.debug( "Built signal catalog of %s with %i samples.", self.directory, len(entries) )
+        return { 'directory':self.directory, 'mtimes':mtimes, 'entries':entries }
+
+    def load( self ):
+        if self.indexFile is None or not os.path.exists( self.indexFile ): return None
+        try:
+            with open( self.indexFile, 'rb' ) as f:
+                stored = pickle.load( f )
+            # corrupt or incomplete index files are rebuilt
+            directory, mtimes, entries = stored['directory'], stored['mtimes'], stored['entries']
+        except ( IOError, EOFError, ValueError, KeyError, TypeError, pickle.UnpicklingError ) as e:
+            logger.warning( "Could not read signal catalog %s: %s", self.indexFile, str(e) )
+            return None
+        return stored if directory == self.directory else None
+
+    def save( self ):
+        if self.indexFile is None: return
+        tmp = '%s.%i.tmp' % ( self.indexFile, os.getpid() )
+        try:
+            with open( tmp, 'wb' ) as f:
+                pickle.dump( self.__index, f )
+            os.rename( tmp, self.indexFile )
+        except ( IOError, OSError ) as e:
+            logger.warning( "Could not write signal catalog %s: %s", self.indexFile, str(e) )
+
+    def __contains__( self, name ):
+        return self.index['entries'].has_key( name )
+
+    def names( self, model = None, group = None ):
+        return sorted( [ name for name, entry in self.index['entries'].iteritems() if ( model is None or entry['model'] == model ) and ( group is None or entry['group'] == group ) ],
+                       key = lambda name: ( self.index['entries'][name]['attributes']['mStop'], self.index['entries'][name]['attributes']['mNeu'], name ) )
+
+    def groups( self ):
+        ''' Models and model parameter sets, e.g. T2tt or T8bbllnunu_XCha0p5_XSlep0p05 '''
+        return sorted( set( entry['group'] for entry in self.index['entries'].itervalues() ) )
+
+    def sample( self, name ):
+        ''' Sample for the mass point, created once '''
+        if not self.__samples.has_key( name ):
+            entry = self.index['entries'][name]
+            if os.path.exists( entry['file'] ) and os.path.getmtime( entry['file'] ) != entry['mtime']:
+                entry['mtime'], entry['nEvents'] = os.path.getmtime( entry['file'] ), None
+            tmp = Sample.fromFiles(\
+                name = name,
+                files = [ entry['file'] ],
+                treeName = "Events",
+                isData = False,
+                color = 8 ,
+                texName = entry['texName']
+            )
+            for attribute, value in entry['attributes'].iteritems():
+                setattr( tmp, attribute, value )
+            tmp.isFastSim = True
+            self.__samples[name] = tmp
+        return self.__samples[name]
+
+    def samples( self, model = None, group = None, mStop = None, mNeu = None ):
+        ''' Samples of a model or group with mStop and mNeu in the (inclusive) ranges ( min, max ), sorted by masses '''
+        def inRange( value, range_ ):
+            return range_ is None or ( ( range_[0] is None or value >= range_[0] ) and ( range_[1] is None or value <= range_[1] ) )
+        return [ self.sample( name ) for name in self.names( model = model, group = group )
+                 if inRange( self.index['entries'][name]['attributes']['mStop'], mStop ) and inRange( self.index['entries'][name]['attributes']['mNeu'], mNeu ) ]
+
+    def nEvents( self, name ):
+        ''' Number of events in the file of the sample, counted once and stored in the index '''
+        entry = self.index['entries'][name]
+        if entry['nEvents'] is None:
+            import ROOT
+            f = ROOT.TFile.Open( entry['file'] )
+            entry['nEvents'] = int( f.Get( "Events" ).GetEntries() )
+            f.Close()
+            self.save()
+        return entry['nEvents']
+
+    def module( self, module, lists = [] ):
+        ''' Replacement for module that resolves the samples and the lists signals_<group> on attribute access '''
+        return SignalModule( module, self, lists )
+
+class SignalModule( types.ModuleType ):
+
+    def __init__( self, module, catalog, lists ):
+        types.ModuleType.__init__( self, module.__name__, module.__doc__ )
+        self.__dict__.update( module.__dict__ )
+        # the globals of the replaced module are cleared when it is deleted
+        self._module  = module
+        self._catalog = catalog
+        self._lists   = lists
+
+    def __getattr__( self, name ):
+        if name.startswith('__'):
+            if name == '__all__':
+                return [ k for k in self.__dict__.keys() if not k.startswith('_') ] \
+                     + sorted( set( self._lists + [ 'signals_'+g for g in self._catalog.groups() ] ) ) + self._catalog.names()
+            raise AttributeError( name )
+        if name in self._lists or ( name.startswith('signals_') and name[len('signals_'):] in self._catalog.groups() ):
+            value = self._catalog.samples( group = name[len('signals_'):] )
+        elif name in self._catalog:
+            value = self._catalog.sample( name )
+        else:
+            raise AttributeError( "Module %s has no attribute %s" % ( self.__name__, name ) )
+        setattr( self, name, value )
+        return value
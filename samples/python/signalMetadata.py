@@ -0,0 +1,116 @@
+''' Per mass point weights of a SUSY signal scan: (mStop, mLSP) -> weight, x-sec variations and ISR normalization.
+    Built once from getT2ttSignalWeight and the ISR normalization cache (getT2ttISRNorm), stored as .npz next to the signal caches
+    and looked up from a dict in the event loop, so no histogram or database is touched per event.
+    The weights are rebuilt when the signal counts (<sample>_signalCounts.root) change, the ISR normalizations are read again every time.
+'''
+
+# Standard imports
+import os
+
+# numpy
+import numpy as np
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class SignalMetadata:
+    fields = [ 'weight', 'xSecFacUp', 'xSecFacDown', 'isrNorm' ]
+
+    def __init__( self, mStop, mLSP, weight, xSecFacUp, xSecFacDown, isrNorm, countsMTime = None ):
+        ''' Arrays with one entry per mass point, isrNorm is NaN where no normalization is known.
+            countsMTime: mtime of the signal counts the weights were computed from
+        '''
+        self.countsMTime = countsMTime
+        self.mStop, self.mLSP = np.asarray( mStop, dtype = np.int32 ), np.asarray( mLSP, dtype = np.int32 )
+        self.weight, self.xSecFacUp, self.xSecFacDown, self.isrNorm = [ np.asarray( a, dtype = np.float64 ) for a in [ weight, xSecFacUp, xSecFacDown, isrNorm ] ]
+        self.values = { ( mStop_, mLSP_ ):row for mStop_, mLSP_, row in zip( self.mStop.tolist(), self.mLSP.tolist(),
+                        zip( self.weight.tolist(), self.xSecFacUp.tolist(), self.xSecFacDown.tolist(), self.isrNorm.tolist() ) ) }
+
+    @classmethod
+    def fromSignalWeight( cls, signalWeight, isrNorms = {}, countsMTime = None ):
+        ''' From the dict of getT2ttSignalWeight and a dict (mStop, mLSP) -> ISR normalization '''
+        points = sorted( signalWeight.keys() )
+        return cls( [ p[0] for p in points ], [ p[1] for p in points ],
+                    [ signalWeight[p]['weight'] for p in points ], [ signalWeight[p]['xSecFacUp'] for p in points ], [ signalWeight[p]['xSecFacDown'] for p in points ],
+                    [ isrNorms.get( p, float('nan') ) for p in points ], countsMTime = countsMTime )
+
+    @staticmethod
+    def countsMTime( sample, cacheDir ):
+        ''' mtime of the signal counts of getT2ttSignalWeight, None if they don't exist yet '''
+        countsFile = os.path.join( cacheDir, "%s_signalCounts.root" % sample.name )
+        return os.path.getmtime( countsFile ) if os.path.exists( countsFile ) else None
+
+    @staticmethod
+    def readISRNorms( massPoints, year, signal, cacheDir ):
+        ''' ISR normalizations from the cache of getT2ttISRNorm (same keys), read with a single cache instance '''
+        from StopsDilepton.analysis.Cache import Cache
+        cache = Cache( cacheDir, verbosity = 2 )
+        res = {}
+        for mStop, mLSP in massPoints:
+            key = ( mStop, mLSP, signal, year )
+            if cache.contains( key ):
+                res[( mStop, mLSP )] = cache.get( key )
+        return res
+
+    @classmethod
+    def build( cls, sample, lumi, year, signal, cacheDir ):
+        from StopsDilepton.samples.helpers import getT2ttSignalWeight
+        signalWeight = getT2ttSignalWeight( sample, lumi = lumi, cacheDir = cacheDir )
+        return cls.fromSignalWeight( signalWeight, cls.readISRNorms( signalWeight.keys(), year, signal, cacheDir ), countsMTime = cls.countsMTime( sample, cacheDir ) )
+
+    @classmethod
+    def fromCache( cls, sample, lumi, year, signal, cacheDir ):
+        ''' Load from cacheDir or build and store it there. The stored weights are rebuilt if the signal counts changed,
+            the ISR normalizations are always taken from the cache of getT2ttISRNorm (e.g. after getWeightsForSignals.py --overwrite).
+        '''
+        filename = os.path.join( cacheDir, "%s_%s_signalMetadata_lumi%s.npz" % ( sample.name, signal, str(lumi).replace( '.', 'p' ) ) )
+        countsMTime = cls.countsMTime( sample, cacheDir )
+        if os.path.exists( filename ):
+            store = cls.load( filename )
+            if countsMTime is not None and store.countsMTime == countsMTime:
+                isrNorms = cls.readISRNorms( store.massPoints(), year, signal, cacheDir )
+                isrNorm  = np.array( [ isrNorms.get( p, float('nan') ) for p in store.massPoints() ], dtype = np.float64 )
+                if not np.array_equal( np.isnan( isrNorm ), np.isnan( store.isrNorm ) ) or ( isrNorm[~np.isnan( isrNorm )] != store.isrNorm[~np.isnan( store.isrNorm )] ).any():
+                    store = cls( store.mStop, store.mLSP, store.weight, store.xSecFacUp, store.xSecFacDown, isrNorm, countsMTime = countsMTime )
+                    store.save( filename )
+                return store
+            logger.info( "Signal counts of %s changed since %s was written.", sample.name, filename )
+        store = cls.build( sample, lumi, year, signal, cacheDir )
+        store.save( filename )
+        return store
+
+    def save( self, filename ):
+        tmp = filename + '.tmp.npz'
+        np.savez_compressed( tmp, mStop = self.mStop, mLSP = self.mLSP, countsMTime = np.nan if self.countsMTime is None else self.countsMTime,
+                             **{ f:getattr( self, f ) for f in self.fields } )
+        os.rename( tmp, filename )
+        logger.info( "Written signal metadata for %i mass points to %s", len(self), filename )
+
+    @classmethod
+    def load( cls, filename ):
+        data = np.load( filename )
+        logger.info( "Loaded signal metadata for %i mass points from %s", len(data['mStop']), filename )
+        # files written before the mtime of the signal counts was stored have to be rebuilt
+        countsMTime = float( data['countsMTime'] ) if 'countsMTime' in data.files and not np.isnan( data['countsMTime'] ) else None
+        return cls( data['mStop'], data['mLSP'], *[ data[f] for f in cls.fields ], countsMTime = countsMTime )
+
+    def __len__( self ):
+        return len( self.mStop )
+
+    def massPoints( self ):
+        return zip( self.mStop.tolist(), self.mLSP.tolist() )
+
+    def get( self, mStop, mLSP ):
+        ''' ( weight, xSecFacUp, xSecFacDown, isrNorm ) or None '''
+        return self.values.get( ( mStop, mLSP ) )
+
+    def hasISRNorm( self ):
+        return bool( ( ~np.isnan( self.isrNorm ) ).any() )
+
+    def getISRNorm( self, mStop, mLSP ):
+        ''' ISR normalization, False if unknown (as getT2ttISRNorm) '''
+        values = self.get( mStop, mLSP )
+        if values is None or values[3] != values[3]:
+            return False
+        return values[3]
@@ -2,8 +2,11 @@ import ROOT
 
 import shutil
 import os
+import uuid
+import tempfile
 
 from StopsDilepton.tools.helpers import writeObjToFile
+from StopsDilepton.tools.cardFileWriter.combineDriver import limitJob, signifJob, nuisancesJob, defaultExecutable, readLimitTree
 
 # Logging
 import logging
@@ -27,6 +30,9 @@ class cardFileWriter:
     def __init__(self):
         self.reset()
         self.releaseLocation = os.path.abspath('.')
+        # combine is run by the functions of combineDriver
+        self.combineExecutable = defaultExecutable
+        self.combineTimeout    = None
 
     def reset(self):
         self.bins = []
@@ -373,133 +379,60 @@ class cardFileWriter:
         return resFile
 
     def readResFile(self, fname):
-        import ROOT
-        f = ROOT.TFile.Open(fname)
-        t = f.Get("limit")
-        l = t.GetLeaf("limit")
-        qE = t.GetLeaf("quantileExpected")
-        limit = {}
-        preFac = 1.
-        for i in range(t.GetEntries()):
-                t.GetEntry(i)
-#        limit["{0:.3f}".format(round(qE.GetValue(),3))] = preFac*l.GetValue()
-                limit["{0:.3f}".format(round(qE.GetValue(),3))] = preFac*l.GetValue()
-        f.Close()
-        return limit
+        return readLimitTree(fname)
 
     def calcLimit(self, fname=None, options="", normList=[]):
-        import uuid, os
-        ustr          = str(uuid.uuid4())
-        uniqueDirname = os.path.join(self.releaseLocation, ustr)
-        print "Creating %s"%uniqueDirname
-        os.makedirs(uniqueDirname)
-
-        if fname is not None:  # Assume card is already written when fname is not none
-          filename = os.path.abspath(fname)
-        else:
-          filename = fname if fname else os.path.join(uniqueDirname, ustr+".txt")
-          self.writeToFile(filename)
+        if fname is None:
+          # the card and the outputs next to it are removed afterwards
+          tmpDir = tempfile.mkdtemp(dir=self.releaseLocation)
+          try:
+            filename = os.path.join(tmpDir, "card.txt")
+            self.writeToFile(filename)
+            return self.calcLimit(filename, options=options, normList=normList)
+          finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+        # Assume card is already written when fname is not none
+        filename = os.path.abspath(fname)
         resultFilename = filename.replace('.txt','')+'.root'
 
         assert os.path.exists(filename), "File not found: %s"%filename
-        
+
+        postProcess = None
         if normList:
             from StopsDilepton.tools.cardFileWriter.getNorms import getNorms
-            filename += " > output.txt"
-        
-        combineCommand = "cd "+uniqueDirname+";combine --saveWorkspace -M AsymptoticLimits --rMin -1000 --rMax 100 %s %s"%(options,filename)
-        print combineCommand
-        os.system(combineCommand)
-
-        tempResFile = uniqueDirname+"/higgsCombineTest.AsymptoticLimits.mH120.root"
-
-        #print tempResFile  
+            def postProcess( workDir, logFile ):
+                shutil.copyfile(logFile, os.path.join(workDir, 'output.txt'))
+                getNorms(dirName=workDir, normsToExtract=normList)
+                shutil.copyfile(os.path.join(workDir, 'SF.txt'), resultFilename.replace('.root','_SF.txt'))
 
-        try:
-            res= self.readResFile(tempResFile)
-        except:
-            res=None
+        res = limitJob(filename, options=options, executable=self.combineExecutable, tmpDir=self.releaseLocation, timeout=self.combineTimeout, postProcess=postProcess)
+        if not res:
             print "[cardFileWrite] Did not succeed reeding result."
-        if res:
-            shutil.copyfile(tempResFile, resultFilename)
-        
-        if normList:
-            getNorms(dirName=uniqueDirname, normsToExtract=normList)
-            shutil.copyfile(uniqueDirname + '/SF.txt', resultFilename.replace('.root','_SF.txt'))
-        
-        shutil.rmtree(uniqueDirname)
         return res
 
     def calcNuisances(self, fname=None, options="",bonly=False, numToysForShape=200):
-        import uuid, os
-        ustr          = str(uuid.uuid4())
-        uniqueDirname = os.path.join(self.releaseLocation, ustr)
-        print "Creating %s"%uniqueDirname
-        os.makedirs(uniqueDirname)
-        shutil.copyfile(os.path.join(os.environ['CMSSW_BASE'], 'src', 'StopsDilepton', 'tools', 'python', 'cardFileWriter', 'diffNuisances.py'), os.path.join(uniqueDirname, 'diffNuisances.py'))
-
-        if fname is not None:  # Assume card is already written when fname is not none
-          filename = os.path.abspath(fname)
-        else:
-          filename = fname if fname else os.path.join(uniqueDirname, ustr+".txt")
-          self.writeToFile(filename)
-        resultFilename      = filename.replace('.txt','')+'_nuisances.txt'
-        resultFilenameFull  = filename.replace('.txt','')+'_nuisances_full.txt'
-        resultFilename2     = filename.replace('.txt','')+'_nuisances.tex'
-        resultFilename2Full = filename.replace('.txt','')+'_nuisances_full.tex'
+        if fname is None:
+          # the card and the outputs next to it are removed afterwards
+          tmpDir = tempfile.mkdtemp(dir=self.releaseLocation)
+          try:
+            filename = os.path.join(tmpDir, "card.txt")
+            self.writeToFile(filename)
+            return self.calcNuisances(filename, options=options, bonly=bonly, numToysForShape=numToysForShape)
+          finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+        # Assume card is already written when fname is not none
+        filename = os.path.abspath(fname)
 
         assert os.path.exists(filename), "File not found: %s"%filename
 
-        combineCommand  = "cd "+uniqueDirname+";combine --forceRecreateNLL -M FitDiagnostics --saveShapes --saveNormalizations --numToysForShape %s --saveOverall --saveWithUncertainties "%numToysForShape + filename
-        combineCommand +=";python diffNuisances.py  fitDiagnostics.root &> nuisances.txt"
-        combineCommand +=";python diffNuisances.py -a fitDiagnostics.root &> nuisances_full.txt"
-        if bonly:
-          combineCommand +=";python diffNuisances.py -bf latex fitDiagnostics.root &> nuisances.tex"
-          combineCommand +=";python diffNuisances.py -baf latex fitDiagnostics.root &> nuisances_full.tex"
-        else:
-          combineCommand +=";python diffNuisances.py -f latex fitDiagnostics.root &> nuisances.tex"
-          combineCommand +=";python diffNuisances.py -af latex fitDiagnostics.root &> nuisances_full.tex"
-        print combineCommand
-        os.system(combineCommand)
-
-        shutil.copyfile(uniqueDirname+'/fitDiagnostics.root', fname.replace('.txt','_FD.root'))
-
-        tempResFile      = uniqueDirname+"/nuisances.txt"
-        tempResFileFull  = uniqueDirname+"/nuisances_full.txt"
-        tempResFile2     = uniqueDirname+"/nuisances.tex"
-        tempResFile2Full = uniqueDirname+"/nuisances_full.tex"
-        shutil.copyfile(tempResFile, resultFilename)
-        shutil.copyfile(tempResFileFull, resultFilenameFull)
-        shutil.copyfile(tempResFile2, resultFilename2)
-        shutil.copyfile(tempResFile2Full, resultFilename2Full)
-
-        shutil.rmtree(uniqueDirname)
+        if not nuisancesJob(filename, options=options, bonly=bonly, numToysForShape=numToysForShape, executable=self.combineExecutable, tmpDir=self.releaseLocation, timeout=self.combineTimeout):
+            raise RuntimeError( "FitDiagnostics failed for %s" % filename )
         return
 
 
     def calcSignif(self, fname="", options=""):
-        import uuid, os
-        ustr          = str(uuid.uuid4())
-        uniqueDirname = os.path.join(self.releaseLocation, ustr)
-        print "Creating %s"%uniqueDirname
-        os.makedirs(uniqueDirname)
         print fname
-        #if fname=="":
-        #    fname = str(ustr+".txt")
-        #    self.writeToFile(uniqueDirname+"/"+fname)
-        #else:
-        #    self.writeToFile(fname)
-        combineCommand = "cd "+uniqueDirname+";combine --saveWorkspace -M Significance --uncapped 1 --rMin -5 "+fname
-        os.system(combineCommand)
-        #os.system("pushd "+self.releaseLocation+";eval `scramv1 runtime -sh`;popd;cd "+uniqueDirname+";"+self.combineStr+" --saveWorkspace  -M ProfileLikelihood --significance "+fname+" -t -1 --expectSignal=1 ")
-        try:
-            res= self.readResFile(uniqueDirname+"/higgsCombineTest.Significance.mH120.root")
-            os.system("rm -rf "+uniqueDirname+"/higgsCombineTest.Significance.mH120.root")
-        except:
-            res=None
+        res = signifJob(fname, options=options, executable=self.combineExecutable, tmpDir=self.releaseLocation, timeout=self.combineTimeout)
+        if not res:
             print "Did not succeed."
-        #if res:
-        #    os.system("cp "+uniqueDirname+"/higgsCombineTest.ProfileLikelihood.mH120.root "+fname.replace('.txt','')+'.root')
-        shutil.rmtree(uniqueDirname)
-
         return res
@@ -0,0 +1,199 @@
+''' Run combine as managed subprocesses.
+    Every job runs in its own temporary directory, the output of combine is written to a log file next to the card,
+    the return code is checked and jobs that exceed the timeout are killed.
+    CombineDriver runs the jobs in a bounded pool and returns AsyncResults, so many mass points can be fitted at the same time:
+
+        driver = CombineDriver( nWorkers = 8, timeout = 3600 )
+        limits = { name:driver.calcLimit( card ) for name, card in cards.iteritems() }
+        driver.join()
+        limits = { name:limit.get() for name, limit in limits.iteritems() }
+
+    The executable can be changed with the environment variable COMBINE_EXECUTABLE,
+    e.g. to tools/scripts/combineStandIn.py for running without combine.
+'''
+
+# Standard imports
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+# numpy
+import numpy as np
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+defaultExecutable = os.environ.get( 'COMBINE_EXECUTABLE', 'combine' )
+
+# PyROOT is not thread safe
+rootLock = threading.Lock()
+
+def runCommand( command, cwd, logFile, timeout = None, header = True ):
+    ''' Run command (list of arguments) in cwd, stdout and stderr are written to logFile (starting with the command if header).
+        Returns the return code, or None if the command was killed after timeout seconds.
+    '''
+    logger.debug( "Running %s in %s", " ".join( command ), cwd )
+    with open( logFile, 'w' ) as log:
+        if header:
+            log.write( "# %s\n" % " ".join( command ) )
+            log.flush()
+        p = subprocess.Popen( command, cwd = cwd, stdout = log, stderr = subprocess.STDOUT )
+        start = time.time()
+        while p.poll() is None:
+            if timeout is not None and time.time() - start > timeout:
+                p.kill()
+                p.wait()
+                logger.error( "Killed %s after %i seconds. Log: %s", command[0], timeout, logFile )
+                return None
+            time.sleep( 0.2 )
+    if p.returncode != 0:
+        logger.error( "%s returned %i. Log: %s", command[0], p.returncode, logFile )
+    return p.returncode
+
+def readLimitArrays( filenames ):
+    ''' limit and quantileExpected of the limit trees of all files, read with one TChain::Draw.
+        Returns ( index of the file, quantileExpected, limit ) arrays. Missing or broken files have no entries.
+    '''
+    import ROOT
+    # the chain keeps the order of the added files
+    added = [ i for i, filename in enumerate( filenames ) if os.path.exists( filename ) ]
+    with rootLock:
+        chain = ROOT.TChain("limit")
+        for i in added:
+            chain.Add( filenames[i] )
+        nEntries = chain.GetEntries()
+        if nEntries == 0: return np.zeros( 0, dtype = int ), np.zeros( 0 ), np.zeros( 0 )
+        chain.SetEstimate( nEntries + 1 )
+        chain.Draw( "limit:quantileExpected:Entry$", "", "goff" )
+        n = chain.GetSelectedRows()
+        limit, quantile, entry = [ np.frombuffer( v, dtype = np.float64, count = n ).copy() for v in [ chain.GetV1(), chain.GetV2(), chain.GetV3() ] ]
+        # first entry of every file in the chain (files that can not be read have no entries)
+        offsets = np.array( [ chain.GetTreeOffset()[i] for i in range( len(added) ) ], dtype = np.int64 )
+    treeIndex = np.searchsorted( offsets, entry.astype( np.int64 ), side = 'right' ) - 1
+    return np.array( added, dtype = int )[treeIndex], quantile, limit
+
+def readLimitTrees( filenames ):
+    ''' [ {quantileExpected:limit} ] from the limit trees of combine, empty for missing files '''
+    fileIndex, quantile, limit = readLimitArrays( filenames )
+    res = [ {} for f in filenames ]
+    for i, q, l in zip( fileIndex, quantile, limit ):
+        res[i]["{0:.3f}".format(round(q,3))] = float(l)
+    return res
+
+def readLimitTree( filename ):
+    ''' {quantileExpected:limit} from the limit tree of combine '''
+    if not os.path.exists( filename ):
+        raise IOError( "Could not open %s" % filename )
+    return readLimitTrees( [ filename ] )[0]
+
+def splitOptions( options ):
+    ''' Arguments of the options string. Combine is not run in a shell, redirections and other shell syntax are not possible. '''
+    arguments = shlex.split( options )
+    for argument in arguments:
+        if any( c in argument for c in '<>|;&`' ) or '$(' in argument:
+            raise ValueError( "Shell syntax '%s' in combine options '%s' is not supported, the output of combine is written to the log file of the job." % ( argument, options ) )
+    return arguments
+
+def combineJob( cardFile, method, arguments, resultFile = None, executable = None, tmpDir = '.', timeout = None, logFile = None, postProcess = None, readResult = True ):
+    ''' Run combine -M method on cardFile in a temporary directory in tmpDir.
+        Returns the limit tree as dict (copied to resultFile) or None if combine failed.
+        With readResult = False the tree is only copied and resultFile is returned, the results of many jobs can then be read at once with readLimitTrees.
+        postProcess( workDir, logFile ) is called after a successful fit, before the directory is removed.
+    '''
+    cardFile   = os.path.abspath( cardFile )
+    executable = executable if executable is not None else defaultExecutable
+    logFile    = logFile if logFile is not None else cardFile.replace( '.txt', '' ) + '_%s.log' % method
+    workDir    = tempfile.mkdtemp( dir = tmpDir )
+    try:
+        returncode = runCommand( [ executable, '-M', method ] + arguments + [ cardFile ], workDir, logFile, timeout = timeout )
+        if returncode != 0: return None
+        tempResFile = os.path.join( workDir, "higgsCombineTest.%s.mH120.root" % method )
+        if readResult:
+            try:
+                res = readLimitTree( tempResFile )
+            except Exception as e:
+                logger.error( "Could not read result of %s: %s", cardFile, e )
+                return None
+        elif resultFile is not None and os.path.exists( tempResFile ):
+            res = resultFile
+        else:
+            logger.error( "No result of %s", cardFile )
+            return None
+        if resultFile is not None:
+            shutil.copyfile( tempResFile, resultFile )
+        if postProcess is not None:
+            postProcess( workDir, logFile )
+        return res
+    finally:
+        shutil.rmtree( workDir, ignore_errors = True )
+
+def limitJob( cardFile, options = "", **kwargs ):
+    ''' Asymptotic limit, the result is copied to <card>.root '''
+    cardFile = os.path.abspath( cardFile )
+    return combineJob( cardFile, 'AsymptoticLimits', [ '--saveWorkspace', '--rMin', '-1000', '--rMax', '100' ] + splitOptions( options ),
+                       resultFile = cardFile.replace( '.txt', '' ) + '.root', **kwargs )
+
+def signifJob( cardFile, options = "", **kwargs ):
+    ''' Significance, the result is copied to <card>_signif.root '''
+    cardFile = os.path.abspath( cardFile )
+    return combineJob( cardFile, 'Significance', [ '--saveWorkspace', '--uncapped', '1', '--rMin', '-5' ] + splitOptions( options ),
+                       resultFile = cardFile.replace( '.txt', '' ) + '_signif.root', **kwargs )
+
+def nuisancesJob( cardFile, options = "", bonly = False, numToysForShape = 200, executable = None, tmpDir = '.', timeout = None, logFile = None ):
+    ''' FitDiagnostics and the pulls of the nuisances (diffNuisances.py), written next to the card. Returns True on success. '''
+    cardFile   = os.path.abspath( cardFile )
+    executable = executable if executable is not None else defaultExecutable
+    logFile    = logFile if logFile is not None else cardFile.replace( '.txt', '' ) + '_FitDiagnostics.log'
+    workDir    = tempfile.mkdtemp( dir = tmpDir )
+    try:
+        returncode = runCommand( [ executable, '--forceRecreateNLL', '-M', 'FitDiagnostics', '--saveShapes', '--saveNormalizations', '--numToysForShape', str(numToysForShape),
+                                   '--saveOverall', '--saveWithUncertainties' ] + splitOptions( options ) + [ cardFile ], workDir, logFile, timeout = timeout )
+        if returncode != 0: return False
+        shutil.copyfile( os.path.join( workDir, 'fitDiagnostics.root' ), cardFile.replace( '.txt', '_FD.root' ) )
+
+        diffNuisances = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'diffNuisances.py' )
+        if not os.path.exists( diffNuisances ):
+            diffNuisances = os.path.join( os.environ['CMSSW_BASE'], 'src', 'StopsDilepton', 'tools', 'python', 'cardFileWriter', 'diffNuisances.py' )
+        latexOptions = '-bf' if bonly else '-f'
+        for diffOptions, postfix in [ ( [], '_nuisances.txt' ), ( ['-a'], '_nuisances_full.txt' ),
+                                      ( [latexOptions, 'latex'], '_nuisances.tex' ), ( [latexOptions.replace('-', '-a'), 'latex'], '_nuisances_full.tex' ) ]:
+            returncode = runCommand( [ 'python', diffNuisances ] + diffOptions + [ 'fitDiagnostics.root' ], workDir, cardFile.replace( '.txt', '' ) + postfix, timeout = timeout, header = False )
+            if returncode != 0: return False
+        return True
+    finally:
+        shutil.rmtree( workDir, ignore_errors = True )
+
+class CombineDriver:
+    def __init__( self, nWorkers = 4, timeout = None, executable = None, tmpDir = None ):
+        ''' nWorkers combine processes at the same time, each killed after timeout seconds. Temporary directories are created in tmpDir (default: current directory). '''
+        self.nWorkers   = nWorkers
+        self.timeout    = timeout
+        self.executable = executable if executable is not None else defaultExecutable
+        self.tmpDir     = os.path.abspath( tmpDir if tmpDir is not None else '.' )
+        # the work is done in the subprocesses, threads are sufficient to manage them
+        self.pool       = ThreadPool( nWorkers )
+
+    def submit( self, job, *args, **kwargs ):
+        ''' AsyncResult of job( *args, **kwargs ), with the settings of the driver '''
+        kwargs.update( { 'executable':self.executable, 'tmpDir':self.tmpDir, 'timeout':self.timeout } )
+        return self.pool.apply_async( job, args, kwargs )
+
+    def calcLimit( self, cardFile, options = "", readResult = True ):
+        return self.submit( limitJob, cardFile, options = options, readResult = readResult )
+
+    def calcSignif( self, cardFile, options = "", readResult = True ):
+        return self.submit( signifJob, cardFile, options = options, readResult = readResult )
+
+    def calcNuisances( self, cardFile, options = "", bonly = False, numToysForShape = 200 ):
+        return self.submit( nuisancesJob, cardFile, options = options, bonly = bonly, numToysForShape = numToysForShape )
+
+    def join( self ):
+        ''' Wait for all submitted jobs, no new jobs can be submitted afterwards '''
+        self.pool.close()
+        self.pool.join()
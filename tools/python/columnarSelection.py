@@ -0,0 +1,294 @@
+''' Columnar (chunk-wise NumPy) version of the object selection used in nanoPostProcessing.
+    Collections are read as jagged arrays (offsets + flat content) through TTree::Draw and
+    the lepton/jet selection, jet cleaning, HT, nBTag, the JME variations of the jet counts and
+    the dilepton kinematics are computed for the whole chunk at once.
+    The selection follows muonSelector/eleSelector('tightMiniIso02'), getAllJets, jetId and isBJet in objectSelection.
+'''
+# Standard imports
+import numpy as np
+from math import pi
+
+# StopsDilepton
+from StopsDilepton.tools.objectSelection import vidNestedWPBitMap, vidNestedWPBitMapNamingList
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# DeepCSV medium working points, same as isBJet
+deepCSVThresholds = {2016:0.6321, 2017:0.4941, 2018:0.4184}
+
+def offsetsFromCounts( counts ):
+    offsets = np.zeros( len(counts)+1, dtype=np.int64 )
+    offsets[1:] = np.cumsum( counts )
+    return offsets
+
+class JaggedArray:
+    ''' Flat content with per event offsets
+    '''
+    def __init__( self, offsets, content ):
+        self.offsets = offsets
+        self.content = content
+
+    @classmethod
+    def fromCounts( cls, counts, content ):
+        return cls( offsetsFromCounts( counts ), content )
+
+    @property
+    def counts( self ):
+        return np.diff( self.offsets )
+
+    @property
+    def nEvents( self ):
+        return len(self.offsets) - 1
+
+    def eventIndex( self ):
+        ''' event number for every element of the content
+        '''
+        return np.repeat( np.arange( self.nEvents ), self.counts )
+
+    def localIndex( self ):
+        ''' position of every element within its event
+        '''
+        return np.arange( self.offsets[-1] ) - np.repeat( self.offsets[:-1], self.counts )
+
+    def __getitem__( self, i ):
+        return self.content[self.offsets[i]:self.offsets[i+1]]
+
+    def position( self, i, default = float('nan') ):
+        ''' i-th element of every event (default for events with fewer elements)
+        '''
+        res = np.full( self.nEvents, default, dtype = np.float64 )
+        has = self.counts > i
+        res[has] = self.content[ self.offsets[:-1][has] + i ]
+        return res
+
+def drawArray( chain, var, first, nEvents, nRows = None ):
+    ''' Read 'var' for entries [first, first+nEvents) of the chain into a flat float64 array.
+    '''
+    chain.SetEstimate( (nRows if nRows is not None else nEvents) + 1 )
+    if chain.Draw( var, "", "goff", nEvents, first ) < 0:
+        raise RuntimeError( "Could not draw %s" % var )
+    n = chain.GetSelectedRows()
+    if n == 0: return np.zeros( 0 )
+    v1 = chain.GetV1()
+    v1.SetSize( n )
+    return np.frombuffer( v1, dtype = np.float64, count = n ).copy()
+
+def readJagged( chain, counter, branches, first, nEvents ):
+    ''' Read the branches of one collection, e.g. readJagged(chain, 'nJet', ['Jet_pt', 'Jet_eta'], 0, 1000).
+        Returns a dict of JaggedArrays with common offsets.
+    '''
+    counts  = drawArray( chain, counter, first, nEvents ).astype( np.int64 )
+    res = {}
+    for b in branches:
+        content = drawArray( chain, b, first, nEvents, nRows = counts.sum() )
+        if len(content) != counts.sum():
+            raise RuntimeError( "Inconsistent length of %s (%i) and %s (%i)" % (b, len(content), counter, counts.sum()) )
+        res[b] = JaggedArray.fromCounts( counts, content )
+    return res
+
+def deltaPhiArray( phi1, phi2 ):
+    ''' same as helpers.deltaPhi '''
+    dphi = phi2 - phi1
+    dphi = np.where( dphi > pi,   dphi - 2.0*pi, dphi )
+    dphi = np.where( dphi <= -pi, dphi + 2.0*pi, dphi )
+    return np.abs( dphi )
+
+def pairs( countsA, countsB ):
+    ''' All (a, b) index pairs of elements in the same event, given the counts of two collections
+    '''
+    offsetsB = offsetsFromCounts( countsB )
+    evtA     = np.repeat( np.arange( len(countsA) ), countsA )
+    nPairs   = countsB[evtA]
+    iA       = np.repeat( np.arange( len(evtA) ), nPairs )
+    iB       = offsetsB[evtA][iA] + np.arange( nPairs.sum() ) - np.repeat( np.cumsum( nPairs ) - nPairs, nPairs )
+    return iA, iB
+
+def cutBasedEleBitmapArray( bitmap, quality = 'tight', removeCuts = [] ):
+    ''' vectorized cbEleSelector '''
+    bitmap = bitmap.astype( np.int64 )
+    res    = np.ones( len(bitmap), dtype = bool )
+    nCuts  = len(vidNestedWPBitMapNamingList)
+    for i, cut in enumerate( vidNestedWPBitMapNamingList ):
+        if cut in removeCuts: continue
+        res &= ( ( bitmap >> 3*(nCuts-1-i) ) & 7 ) >= vidNestedWPBitMap[quality]
+    return res
+
+def fourMomentumSum( pt1, eta1, phi1, pt2, eta2, phi2 ):
+    ''' pt, eta, phi, mass of the sum of two massless objects (as with TLorentzVector) '''
+    px = pt1*np.cos(phi1) + pt2*np.cos(phi2)
+    py = pt1*np.sin(phi1) + pt2*np.sin(phi2)
+    pz = pt1*np.sinh(eta1) + pt2*np.sinh(eta2)
+    E  = np.sqrt( (pt1*np.cos(phi1))**2 + (pt1*np.sin(phi1))**2 + (pt1*np.sinh(eta1))**2 ) \
+       + np.sqrt( (pt2*np.cos(phi2))**2 + (pt2*np.sin(phi2))**2 + (pt2*np.sinh(eta2))**2 )
+    pt = np.sqrt( px**2 + py**2 )
+    p  = np.sqrt( px**2 + py**2 + pz**2 )
+    with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+        cosTheta = np.where( p > 0, pz/p, 1. )
+        eta      = np.where( cosTheta**2 < 1, -0.5*np.log( (1.-cosTheta)/(1.+cosTheta) ), np.where( pz == 0, 0., np.where( pz > 0, 10e10, -10e10 ) ) )
+    phi  = np.where( (px == 0) & (py == 0), 0., np.arctan2( py, px ) )
+    mm   = E**2 - p**2
+    mass = np.where( mm < 0, -np.sqrt( np.abs(mm) ), np.sqrt( np.abs(mm) ) )
+    return pt, eta, phi, mass
+
+electronBranches = [ 'Electron_'+v for v in ['pt', 'eta', 'phi', 'vidNestedWPBitmap', 'miniPFRelIso_all', 'sip3d', 'lostHits'] ]
+muonBranches     = [ 'Muon_'+v     for v in ['pt', 'eta', 'phi', 'miniPFRelIso_all', 'sip3d', 'dxy', 'dz', 'mediumId'] ]
+jetBranches      = [ 'Jet_'+v      for v in ['pt', 'eta', 'phi', 'jetId', 'btagDeepB', 'pt_nom'] ]
+jetVariations    = [ 'jesTotalUp', 'jesTotalDown', 'jerUp', 'jerDown' ]
+
+class DileptonChunk:
+    ''' Selection results for nEvents consecutive chain entries starting at 'first'.
+    '''
+    def __init__( self, chain, first, nEvents, year, jetAbsEtaCut = 2.4, addSystematicVariations = False ):
+        self.first   = first
+        self.nEvents = nEvents
+        self.variations = jetVariations if addSystematicVariations else []
+
+        electrons = readJagged( chain, 'nElectron', electronBranches, first, nEvents )
+        muons     = readJagged( chain, 'nMuon',     muonBranches,     first, nEvents )
+        jets      = readJagged( chain, 'nJet',      jetBranches + [ 'Jet_pt_'+var for var in self.variations ], first, nEvents )
+
+        # leptons: eleSelector/muonSelector 'tightMiniIso02' with ptCut 10
+        e = { b.split('_',1)[1]:electrons[b].content for b in electronBranches }
+        eleMask = (e['pt'] >= 10) & (np.abs(e['eta']) < 2.4) \
+                & cutBasedEleBitmapArray( e['vidNestedWPBitmap'], 'tight', removeCuts = ['GsfEleRelPFIsoScaledCut'] ) \
+                & (e['miniPFRelIso_all'] < 0.2) & (e['sip3d'] < 4.0) & (e['lostHits'] == 0)
+        m = { b.split('_',1)[1]:muons[b].content for b in muonBranches }
+        muMask  = (m['pt'] >= 10) & (np.abs(m['eta']) < 2.4) & (m['miniPFRelIso_all'] < 0.2) & (m['sip3d'] < 4.0) \
+                & (np.abs(m['dxy']) < 0.05) & (np.abs(m['dz']) < 0.1) & (m['mediumId'] != 0)
+
+        self.electrons = electrons['Electron_pt'].localIndex()[eleMask]
+        self.muons     = muons['Muon_pt'].localIndex()[muMask]
+        self.electron_offsets = offsetsFromCounts( np.bincount( electrons['Electron_pt'].eventIndex()[eleMask], minlength = nEvents ) )
+        self.muon_offsets     = offsetsFromCounts( np.bincount( muons['Muon_pt'].eventIndex()[muMask], minlength = nEvents ) )
+
+        # electrons first, then muons; stable sort in -pt within the event as in leptons_pt10.sort
+        lep_evt  = np.concatenate( ( electrons['Electron_pt'].eventIndex()[eleMask], muons['Muon_pt'].eventIndex()[muMask] ) )
+        lep_pt   = np.concatenate( ( e['pt'][eleMask],  m['pt'][muMask] ) )
+        lep_eta  = np.concatenate( ( e['eta'][eleMask], m['eta'][muMask] ) )
+        lep_phi  = np.concatenate( ( e['phi'][eleMask], m['phi'][muMask] ) )
+        lep_flav = np.concatenate( ( 11*np.ones( eleMask.sum(), dtype=np.int64 ), 13*np.ones( muMask.sum(), dtype=np.int64 ) ) )
+        order    = np.lexsort( ( np.arange( len(lep_evt) ), -lep_pt, lep_evt ) )
+        lep_evt, lep_pt, lep_eta, lep_phi, lep_flav = lep_evt[order], lep_pt[order], lep_eta[order], lep_phi[order], lep_flav[order]
+
+        # leptons with pt>20 are used for jet cleaning and the dilepton quantities
+        hard = lep_pt > 20
+        hard_counts = np.bincount( lep_evt[hard], minlength = nEvents )
+        hard_offsets = offsetsFromCounts( hard_counts )
+        hard_pt, hard_eta, hard_phi, hard_flav = lep_pt[hard], lep_eta[hard], lep_phi[hard], lep_flav[hard]
+
+        self.nGoodMuons     = np.bincount( lep_evt[hard & (lep_flav == 13)], minlength = nEvents )
+        self.nGoodElectrons = np.bincount( lep_evt[hard & (lep_flav == 11)], minlength = nEvents )
+        self.nGoodLeptons   = hard_counts
+
+        # dilepton kinematics from the two leading leptons
+        has2 = hard_counts >= 2
+        i1   = hard_offsets[:-1][has2]
+        i2   = i1 + 1
+        self.dl_pt, self.dl_eta, self.dl_phi, self.dl_mass = [ np.full( nEvents, np.nan ) for i in range(4) ]
+        self.dl_pt[has2], self.dl_eta[has2], self.dl_phi[has2], self.dl_mass[has2] = fourMomentumSum( hard_pt[i1], hard_eta[i1], hard_phi[i1], hard_pt[i2], hard_eta[i2], hard_phi[i2] )
+        self.isEE   = np.zeros( nEvents, dtype = bool )
+        self.isMuMu = np.zeros( nEvents, dtype = bool )
+        self.isEMu  = np.zeros( nEvents, dtype = bool )
+        self.isEE[has2]   = (hard_flav[i1] == 11) & (hard_flav[i2] == 11)
+        self.isMuMu[has2] = (hard_flav[i1] == 13) & (hard_flav[i2] == 13)
+        self.isEMu[has2]  = hard_flav[i1] != hard_flav[i2]
+
+        # jets: getAllJets(ptCut=0, absEtaCut=99, idVar='jetId') cleaned against the pt>20 leptons with deltaR<0.4
+        j = { b.split('_',1)[1]:jets[b].content for b in jets.keys() }
+        jet_evt   = jets['Jet_pt'].eventIndex()
+        jet_index = jets['Jet_pt'].localIndex()
+        idMask    = (j['pt'] > 0) & (np.abs(j['eta']) < 99) & (j['jetId'] > 0)
+
+        iJet, iLep = pairs( jets['Jet_pt'].counts, hard_counts )
+        dR  = np.sqrt( deltaPhiArray( hard_phi[iLep], j['phi'][iJet] )**2 + ( hard_eta[iLep] - j['eta'][iJet] )**2 )
+        unclean = np.zeros( len(jet_evt), dtype = bool )
+        unclean[ iJet[dR < 0.4] ] = True
+
+        allMask = idMask & ~unclean & ( np.abs(j['eta']) < jetAbsEtaCut )
+        order   = np.lexsort( ( jet_index[allMask], -j['pt'][allMask], jet_evt[allMask] ) )
+        sel     = np.nonzero( allMask )[0][order]
+
+        self.jet_evt, self.jet_index = jet_evt[sel], jet_index[sel]
+        pt, eta, phi, btag, pt_nom = j['pt'][sel], j['eta'][sel], j['phi'][sel], j['btagDeepB'][sel], j['pt_nom'][sel]
+
+        self.nHEMJets = np.bincount( self.jet_evt[ (pt > 20) & (eta > -3.2) & (eta < -1.0) & (phi > -2.0) & (phi < -0.5) ], minlength = nEvents )
+
+        # jetId(ptCut=30, ptVar='pt_nom') and isBJet(tagger='DeepCSV', year) with |eta|<=2.4
+        self.isGood = pt_nom > 30
+        self.isB    = self.isGood & ( btag > deepCSVThresholds[year] ) & ( np.abs(eta) <= 2.4 )
+        self.nJetGood = np.bincount( self.jet_evt[self.isGood], minlength = nEvents )
+        self.nBTag    = np.bincount( self.jet_evt[self.isB],    minlength = nEvents )
+        self.ht       = np.bincount( self.jet_evt[self.isGood], weights = pt_nom[self.isGood], minlength = nEvents )
+
+        # JME variations: isBJet is called with its defaults (DeepCSV, 2016) and |eta|<2.4 for the variations
+        self.isGood_sys, self.isB_sys, self.nJetGood_sys, self.nBTag_sys, self.ht_sys = {}, {}, {}, {}, {}
+        for var in self.variations:
+            pt_var = j['pt_'+var][sel]
+            self.isGood_sys[var]   = pt_var > 30
+            self.isB_sys[var]      = self.isGood_sys[var] & ( btag > deepCSVThresholds[2016] ) & ( np.abs(eta) < 2.4 )
+            self.nJetGood_sys[var] = np.bincount( self.jet_evt[self.isGood_sys[var]], minlength = nEvents )
+            self.nBTag_sys[var]    = np.bincount( self.jet_evt[self.isB_sys[var]],    minlength = nEvents )
+            self.ht_sys[var]       = np.bincount( self.jet_evt[self.isGood_sys[var]], weights = pt_var[self.isGood_sys[var]], minlength = nEvents )
+
+        self.jet_offsets = offsetsFromCounts( np.bincount( self.jet_evt, minlength = nEvents ) )
+
+    def contains( self, entry ):
+        return self.first <= entry < self.first + self.nEvents
+
+    def event( self, entry ):
+        ''' Selection results of one chain entry as python lists and numbers
+        '''
+        i   = entry - self.first
+        jet = slice( self.jet_offsets[i], self.jet_offsets[i+1] )
+        res = {
+            'electrons':      self.electrons[self.electron_offsets[i]:self.electron_offsets[i+1]].tolist(),
+            'muons':          self.muons[self.muon_offsets[i]:self.muon_offsets[i+1]].tolist(),
+            'allJets':        self.jet_index[jet].tolist(),
+            'jets':           self.jet_index[jet][self.isGood[jet]].tolist(),
+            'bJets':          self.jet_index[jet][self.isB[jet]].tolist(),
+            'nonBJets':       self.jet_index[jet][self.isGood[jet] & ~self.isB[jet]].tolist(),
+            'nHEMJets':       int(self.nHEMJets[i]),
+            'nJetGood':       int(self.nJetGood[i]),
+            'nBTag':          int(self.nBTag[i]),
+            'ht':             float(self.ht[i]),
+            'nGoodMuons':     int(self.nGoodMuons[i]),
+            'nGoodElectrons': int(self.nGoodElectrons[i]),
+            'nGoodLeptons':   int(self.nGoodLeptons[i]),
+            'isEE':           bool(self.isEE[i]),
+            'isMuMu':         bool(self.isMuMu[i]),
+            'isEMu':          bool(self.isEMu[i]),
+            'dl_pt':          float(self.dl_pt[i]),
+            'dl_eta':         float(self.dl_eta[i]),
+            'dl_phi':         float(self.dl_phi[i]),
+            'dl_mass':        float(self.dl_mass[i]),
+            }
+        for var in self.variations:
+            res['jets_'+var]     = self.jet_index[jet][self.isGood_sys[var][jet]].tolist()
+            res['bJets_'+var]    = self.jet_index[jet][self.isB_sys[var][jet]].tolist()
+            res['nonBJets_'+var] = self.jet_index[jet][self.isGood_sys[var][jet] & ~self.isB_sys[var][jet]].tolist()
+            res['nJetGood_'+var] = int(self.nJetGood_sys[var][i])
+            res['nBTag_'+var]    = int(self.nBTag_sys[var][i])
+            res['ht_'+var]       = float(self.ht_sys[var][i])
+        return res
+
+class ChunkedSelection:
+    ''' Computes DileptonChunks of 'chunkSize' chain entries on demand, e.g. from within the filler:
+        selection.event( chain.GetReadEntry() )
+    '''
+    def __init__( self, chain, chunkSize = 100000, **kwargs ):
+        self.chain     = chain
+        self.chunkSize = chunkSize
+        self.kwargs    = kwargs
+        self.chunk     = None
+
+    def event( self, entry ):
+        if self.chunk is None or not self.chunk.contains( entry ):
+            first   = entry - entry % self.chunkSize
+            nEvents = min( self.chunkSize, self.chain.GetEntries() - first )
+            logger.debug( "Computing columnar selection for entries %i to %i", first, first + nEvents )
+            self.chunk = DileptonChunk( self.chain, first, nEvents, **self.kwargs )
+            # TTree::Draw moved the chain, restore the current entry for the reader
+            self.chain.GetEntry( entry )
+        return self.chunk.event( entry )
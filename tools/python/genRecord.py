@@ -0,0 +1,140 @@
+''' Array based gen record of a nanoAOD event.
+    The mother chains (genPartIdxMother) of all gen particles are walked once, level by level for all particles at the same time,
+    and summarized in the counts used for the gen lepton matching. Parent lists are followed iteratively without copying dicts.
+    The photon isolation is a vectorized deltaR between the candidate photons and all other particles.
+    GenParts replaces the list of getGenPartsAll and only makes the dicts of the particles that are used.
+
+    Conventions:
+    - parents: all mothers along the chain while the mother index is >= 0 (nanoAOD uses -1 for 'no mother').
+    - ancestry (as GenSearch.ancestry): all mothers along the chain, stopping before a proton or a particle without mother.
+'''
+
+# Standard imports
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.helpers           import getVarValue, getObjDict
+from StopsDilepton.tools.mcTools           import B_mesons_abs, D_mesons_abs
+from StopsDilepton.tools.objectCollection  import readColumn
+from StopsDilepton.tools.columnarSelection import deltaPhiArray
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+class GenRecord:
+    variables = [ 'pt', 'eta', 'phi', 'mass', 'pdgId', 'status', 'genPartIdxMother' ]
+
+    def __init__( self, pt, eta, phi, mass, pdgId, status, mother ):
+        self.pt, self.eta, self.phi, self.mass = [ np.asarray( a, dtype = np.float64 ) for a in [ pt, eta, phi, mass ] ]
+        self.pdgId  = np.asarray( pdgId,  dtype = np.int64 )
+        self.status = np.asarray( status, dtype = np.int64 )
+        self.mother = np.asarray( mother, dtype = np.int64 )
+        self.n      = len( self.pdgId )
+        self.__ancestryCounts = None
+
+    @classmethod
+    def fromReader( cls, c ):
+        n = int( getVarValue( c, 'nGenPart' ) )
+        return cls( *[ readColumn( c, 'GenPart_'+var, n ) for var in cls.variables ] )
+
+    @classmethod
+    def fromDicts( cls, genParts ):
+        ''' From the dicts of getGenPartsAll '''
+        return cls( *[ [ p[var] for p in genParts ] for var in cls.variables ] )
+
+    def __validMother( self, cur ):
+        return ( cur >= 0 ) & ( cur < self.n )
+
+    def parentIds( self, i ):
+        ''' pdgIds of all mothers of particle i, nearest first '''
+        res = []
+        cur = self.mother[i]
+        # at most n steps, protects against loops in corrupt records
+        while 0 <= cur < self.n and len(res) < self.n:
+            res.append( int( self.pdgId[cur] ) )
+            cur = self.mother[cur]
+        return res
+
+    def ancestryCounts( self ):
+        ''' Number of D mesons, B mesons, W, top and tau in the ancestry (GenSearch.ancestry convention) of every particle '''
+        if self.__ancestryCounts is None:
+            absId = np.abs( self.pdgId )
+            own   = { 'n_D':np.in1d( absId, list(D_mesons_abs) ), 'n_B':np.in1d( absId, list(B_mesons_abs) ),
+                      'n_W':absId == 24, 'n_t':absId == 6, 'n_tau':absId == 15 }
+            res   = { key:np.zeros( self.n, dtype = np.int32 ) for key in own }
+            # a mother is part of the ancestry if it is not a proton and has a mother itself
+            inAncestry = ( absId != 2212 ) & ( self.mother >= 0 )
+            cur   = self.mother.copy()
+            valid = self.__validMother( cur )
+            valid[valid] &= inAncestry[ cur[valid] ]
+            # at most n steps, protects against loops in corrupt records
+            for step in range( self.n ):
+                if not valid.any(): break
+                for key in own:
+                    res[key][valid] += own[key][ cur[valid] ]
+                cur[valid]  = self.mother[ cur[valid] ]
+                valid &= self.__validMother( cur )
+                valid[valid] &= inAncestry[ cur[valid] ]
+            self.__ancestryCounts = res
+        return self.__ancestryCounts
+
+    def photons( self ):
+        ''' Indices of photons with status > 0 (as filterGenPhotons) '''
+        return np.nonzero( ( np.abs( self.pdgId ) == 22 ) & ( self.status > 0 ) )[0]
+
+    def isIsolated( self, indices, coneSize = 0.2, ptCut = 5, excludedPdgIds = [12,-12,14,-14,16,-16] ):
+        ''' No final state particle (status 1, no photon, not excluded, pt >= ptCut) within coneSize of the particles with the given indices '''
+        indices = np.asarray( indices, dtype = np.int64 )
+        others  = ( self.status == 1 ) & ( self.pdgId != 22 ) & ~np.in1d( self.pdgId, excludedPdgIds ) & ( self.pt >= ptCut )
+        if len(indices) == 0 or not others.any():
+            return np.ones( len(indices), dtype = bool )
+        dEta = self.eta[indices][:,np.newaxis] - self.eta[others][np.newaxis,:]
+        dPhi = deltaPhiArray( self.phi[indices][:,np.newaxis], self.phi[others][np.newaxis,:] )
+        inCone = np.sqrt( dEta**2 + dPhi**2 ) <= coneSize
+        # the particle itself is not an 'other'
+        inCone &= indices[:,np.newaxis] != np.nonzero( others )[0][np.newaxis,:]
+        return ~inCone.any( axis = 1 )
+
+    def finalStateLeptons( self, ptCut = 20, absEtaCut = 2.5 ):
+        ''' Indices of status 1 electrons and muons with pt > ptCut and |eta| < absEtaCut '''
+        return np.nonzero( np.in1d( np.abs( self.pdgId ), [11, 13] ) & ( self.status == 1 ) & ( self.pt > ptCut ) & ( np.abs( self.eta ) < absEtaCut ) )[0]
+
+    def maxMass( self, pdgId ):
+        ''' Largest mass of the particles with pdgId, 0 if there is none (as max([p['mass']*(p['pdgId']==pdgId) for p in genParts])) '''
+        if self.n == 0: raise ValueError( "No gen particles." )
+        return float( np.where( self.pdgId == pdgId, self.mass, 0. ).max() )
+
+    def leptonsFromZ( self ):
+        ''' Indices of e, mu, tau with a Z as direct mother (as genLepFromZ, including its python indexing of mother index -1) '''
+        if self.n == 0: return np.zeros( 0, dtype = np.int64 )
+        if ( self.mother >= self.n ).any() or ( self.mother < -self.n ).any():
+            # genLepFromZ fails and returns no leptons
+            return np.zeros( 0, dtype = np.int64 )
+        isLepton = np.in1d( np.abs( self.pdgId ), [11, 13, 15] )
+        return np.nonzero( isLepton & ( np.abs( self.pdgId[ self.mother ] ) == 23 ) )[0]
+
+class GenParts:
+    ''' The dicts of getGenPartsAll, each one made when it is first used. Iterating makes all of them. '''
+    def __init__( self, c, n, genVars ):
+        self.c       = c
+        self.n       = n
+        self.genVars = genVars
+        self.__dicts = {}
+
+    def __len__( self ):
+        return self.n
+
+    def __getitem__( self, i ):
+        if isinstance( i, slice ):
+            return [ self[j] for j in range( *i.indices( self.n ) ) ]
+        # negative indices as for the list
+        if i < 0: i += self.n
+        if not 0 <= i < self.n: raise IndexError( "gen particle index out of range" )
+        if i not in self.__dicts:
+            self.__dicts[i] = getObjDict( self.c, 'GenPart_', self.genVars, i )
+        return self.__dicts[i]
+
+    def __iter__( self ):
+        for i in range( self.n ):
+            yield self[i]
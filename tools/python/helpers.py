@@ -3,6 +3,7 @@ import ROOT
 from math import pi, sqrt, cos, sin, sinh, log, cosh
 from array import array
 import itertools
+import numpy as np
 
 # Logging
 import logging
@@ -26,6 +27,11 @@ def map_level(f, item, level):
 
 def deltaPhi(phi1, phi2):
     dphi = phi2-phi1
+    if isinstance(dphi, np.ndarray):
+        # element-wise for arrays
+        dphi = np.where(dphi > pi,   dphi - 2.0*pi, dphi)
+        dphi = np.where(dphi <= -pi, dphi + 2.0*pi, dphi)
+        return np.abs(dphi)
     if  dphi > pi:
         dphi -= 2.0*pi
     if dphi <= -pi:
@@ -3,11 +3,9 @@ Lepton SF SUS 2016-18
 Material from https://twiki.cern.ch/twiki/bin/view/CMS/SUSLeptonSF
 '''
 
-import ROOT
-from StopsDilepton.tools.helpers import getObjFromFile
-from StopsDilepton.tools.u_float import u_float
+from StopsDilepton.tools.scaleFactorTable import loadTable, product
 import os
-from math import sqrt
+import numpy as np
 
 class leptonHit0SF:
     def __init__(self, year):
@@ -36,20 +34,17 @@ class leptonHit0SF:
         self.dataDir = "$CMSSW_BASE/src/StopsDilepton/tools/data/leptonSFData"
 
         self.mu  = []
-        self.ele = [getObjFromFile(os.path.expandvars(os.path.join(self.dataDir, file)), key) for (file, key) in keys_ele]
+        self.ele = [loadTable(os.path.join(self.dataDir, file), key) for (file, key) in keys_ele]
         for effMap in self.mu + self.ele: assert effMap
 
     def getPartialSF(self, effMap, pt, eta):
+        return effMap.get(pt, eta)
 
-        bin_x, bin_y = effMap.GetXaxis().FindBin(pt), effMap.GetYaxis().FindBin(eta)
-        sf  = effMap.GetBinContent(bin_x, bin_y)
-        err = effMap.GetBinError  (bin_x, bin_y)
-        return u_float(sf, err)
+    def getPartialSFs(self, effMap, pt, eta):
+        return effMap.getArrays(pt, eta)
 
     def mult(self, list):
-        res = list[0]
-        for i in list[1:]: res = res*i
-        return res
+        return product(list)
 
     def getSF(self, pdgId, pt, eta):
         # protection for the abs(eta)=2.4 case
@@ -61,11 +56,35 @@ class leptonHit0SF:
         elif abs(pdgId)==11:
           if pt >= self.ele_max_pt: pt = self.ele_max_pt-1 # last bin is valid to infinity
           eta_ = abs(eta) if self.ele_abs_eta else eta
-          sf   = self.mult([self.getPartialSF(effMap, pt, eta_) if self.ele_x_is_pt else self.getPartialSF(effMap, eta_, pt) for effMap in self.ele])
+          sf, sigma = self.mult([self.getPartialSF(effMap, pt, eta_) if self.ele_x_is_pt else self.getPartialSF(effMap, eta_, pt) for effMap in self.ele])
         else: 
           raise Exception("Lepton SF for PdgId %i not known"%pdgId)
 
-        return sf.val, (1-sf.sigma)*sf.val, (1+sf.sigma)*sf.val 
+        return sf, (1-sigma)*sf, (1+sigma)*sf
+
+    def getSFs(self, pdgId, pt, eta):
+        ''' Vectorized getSF for arrays of pdgId, pt and eta, same clamping. Returns arrays of sf, sf down and sf up.
+        '''
+        pdgId = np.abs(np.asarray(pdgId))
+        pt    = np.asarray(pt, dtype='float64')
+        eta   = np.asarray(eta, dtype='float64')
+        unknown = (pdgId!=11)&(pdgId!=13)
+        if unknown.any():
+          raise Exception("Lepton SF for PdgId %i not known"%pdgId[unknown][0])
+
+        # protection for the abs(eta)=2.4 case
+        eta = np.where(eta >= 2.4, 2.39, np.where(eta <= -2.4, -2.39, eta))
+
+        sf, sigma = np.ones(len(pt)), np.zeros(len(pt))
+        for flavor, effMaps, x_is_pt, abs_eta, max_pt in [ (13, self.mu,  self.mu_x_is_pt,  self.mu_abs_eta,  self.mu_max_pt),
+                                                            (11, self.ele, self.ele_x_is_pt, self.ele_abs_eta, self.ele_max_pt) ]:
+          sel = pdgId==flavor
+          if not effMaps or not sel.any(): continue
+          pt_  = np.where(pt[sel] >= max_pt, max_pt-1, pt[sel]) # last bin is valid to infinity
+          eta_ = np.abs(eta[sel]) if abs_eta else eta[sel]
+          sf[sel], sigma[sel] = self.mult([self.getPartialSFs(effMap, pt_, eta_) if x_is_pt else self.getPartialSFs(effMap, eta_, pt_) for effMap in effMaps])
+
+        return sf, (1-sigma)*sf, (1+sigma)*sf
 
 if __name__ == "__main__":
     sf_2016 = leptonHit0SF( year = 2016 )
@@ -1,6 +1,6 @@
-import ROOT
-from StopsDilepton.tools.helpers import getObjFromFile
+from StopsDilepton.tools.scaleFactorTable import loadTable
 import os, math
+import numpy as np
 
 # Logging
 import logging
@@ -14,20 +14,18 @@ m_key    = "ratio_eff_eta3_dr030e030_corr"
 class leptonTrackingEfficiency:
     def __init__(self):
 
-        self.e_sf = getObjFromFile(os.path.expandvars(e_file),   e_key)
-        assert self.e_sf, "Could not load ele SF histo %s from file %s."%( e_key, e_file )
+        self.e_sf = loadTable(e_file,   e_key)
 
-        self.e_ptMax = self.e_sf.GetYaxis().GetXmax()
-        self.e_ptMin = self.e_sf.GetYaxis().GetXmin()
+        self.e_ptMax = self.e_sf.yMax
+        self.e_ptMin = self.e_sf.yMin
 
-        self.e_etaMax = self.e_sf.GetXaxis().GetXmax()
-        self.e_etaMin = self.e_sf.GetXaxis().GetXmin()
+        self.e_etaMax = self.e_sf.xMax
+        self.e_etaMin = self.e_sf.xMin
 
-        self.m_sf = getObjFromFile(os.path.expandvars(m_file),   m_key)
-        assert self.m_sf, "Could not load muon SF histo %s from file %s."%( m_key, m_file )
+        self.m_sf = loadTable(m_file,   m_key)
 
-        self.m_etaMax = self.m_sf.GetXaxis().GetXmax()
-        self.m_etaMin = self.m_sf.GetXaxis().GetXmin()
+        self.m_etaMax = self.m_sf.xMax
+        self.m_etaMin = self.m_sf.xMin
 
     def getSF(self, pdgId, pt, eta):
 
@@ -41,10 +39,9 @@ class leptonTrackingEfficiency:
 
             if pt>self.e_ptMax: pt=self.e_ptMax - 1 
             elif pt<=self.e_ptMin: pt=self.e_ptMin + 1
-            val = self.e_sf.GetBinContent( self.e_sf.FindBin(eta, pt) )
+            val, valErr = self.e_sf.get(eta, pt)
             if pt > 80: addUnc = 0.01 * val # Additional 1% on ele with pt > 80
             else: addUnc = 0.
-            valErr = self.e_sf.GetBinError( self.e_sf.FindBin(eta, pt) )
             
             valErr = math.sqrt(valErr**2 + addUnc**2)
 
@@ -58,7 +55,7 @@ class leptonTrackingEfficiency:
                 logger.warning( "Muon eta out of bounds: %3.2f (need %3.2f <= eta <=% 3.2f)", eta, self.m_etaMin, self.m_etaMax )
                 eta = self.m_etaMin
 
-            val = self.m_sf.Eval( eta )
+            val = self.m_sf.eval( eta )
             valErr = 0. # Systematic uncertainty not there yet
 
             return (val, valErr)
@@ -66,4 +63,41 @@ class leptonTrackingEfficiency:
         else:
             raise ValueError( "Lepton pdgId %i neither electron or muon"%pdgId )
 
-
+    def getSFs(self, pdgId, pt, eta):
+        ''' Vectorized getSF for arrays of pdgId, pt and eta. Returns arrays of SF and uncertainty.
+        '''
+        pdgId = np.abs(np.asarray(pdgId))
+        pt    = np.asarray(pt, dtype='float64')
+        eta   = np.asarray(eta, dtype='float64')
+
+        unknown = (pdgId!=11)&(pdgId!=13)
+        if unknown.any():
+            raise ValueError( "Lepton pdgId %i neither electron or muon"%pdgId[unknown][0] )
+
+        val, valErr = np.zeros(len(pt)), np.zeros(len(pt))
+
+        ele = pdgId==11
+        if ele.any():
+            eta_ = eta[ele]
+            outOfBounds = ~((eta_<=self.e_etaMax)&(eta_>=self.e_etaMin))
+            if outOfBounds.any():
+                logger.warning( "%i supercluster eta out of bounds (need %3.2f <= eta <=% 3.2f)", outOfBounds.sum(), self.e_etaMin, self.e_etaMax )
+            eta_ = np.where(~(eta_<=self.e_etaMax), self.e_etaMax, eta_)
+            eta_ = np.where(~(eta_>=self.e_etaMin), self.e_etaMin, eta_)
+            pt_  = pt[ele]
+            pt_  = np.where(pt_>self.e_ptMax, self.e_ptMax - 1, np.where(pt_<=self.e_ptMin, self.e_ptMin + 1, pt_))
+            v, e = self.e_sf.getArrays(eta_, pt_)
+            addUnc = np.where(pt_ > 80, 0.01*v, 0.) # Additional 1% on ele with pt > 80
+            val[ele], valErr[ele] = v, np.sqrt(e**2 + addUnc**2)
+
+        mu = ~ele
+        if mu.any():
+            eta_ = eta[mu]
+            outOfBounds = ~((eta_<=self.m_etaMax)&(eta_>=self.m_etaMin))
+            if outOfBounds.any():
+                logger.warning( "%i muon eta out of bounds (need %3.2f <= eta <=% 3.2f)", outOfBounds.sum(), self.m_etaMin, self.m_etaMax )
+            eta_ = np.where(~(eta_<=self.m_etaMax), self.m_etaMax, eta_)
+            eta_ = np.where(~(eta_>=self.m_etaMin), self.m_etaMin, eta_)
+            val[mu] = self.m_sf.evalArray( eta_ ) # Systematic uncertainty not there yet
+
+        return val, valErr
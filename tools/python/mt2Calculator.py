@@ -1,4 +1,5 @@
 import ROOT, array
+import numpy as np
 from math import pi, sqrt, cos, sin
 
 #wrapper class for MT2 variables
@@ -82,4 +83,55 @@ class MT2Calculator:
         self.mt2.set_momenta(bl1, bl2, pmiss)
         return self.mt2.get_mt2()
 
+#Batch interface: numpy arrays of pt/eta/phi with one entry per event, returns numpy array of mt2 values.
+#Same definitions as the per-event methods above, NaN inputs give NaN.
+    @staticmethod
+    def _pxpy(pt, phi):
+        pt, phi = np.asarray(pt, dtype='float64'), np.asarray(phi, dtype='float64')
+        return pt*np.cos(phi), pt*np.sin(phi)
+    @staticmethod
+    def _p4(pt, eta, phi, mass):
+        pt, eta, phi = np.asarray(pt, dtype='float64'), np.asarray(eta, dtype='float64'), np.asarray(phi, dtype='float64')
+        pz = pt*np.sinh(eta)
+        return np.sqrt(pt**2+pz**2+mass**2), pt*np.cos(phi), pt*np.sin(phi), pz
+    @staticmethod
+    def _mass(a, b):
+        m2 = (a[0]+b[0])**2-(a[1]+b[1])**2-(a[2]+b[2])**2-(a[3]+b[3])**2
+        #same sign convention as TLorentzVector::M()
+        return np.where(m2<0, -np.sqrt(np.abs(m2)), np.sqrt(np.abs(m2)))
+    def _mt2_batch(self, mn, pax, pay, pbx, pby, pmissx, pmissy):
+        args = [ np.ascontiguousarray(a, dtype='float64') for a in (pax, pay, pbx, pby, pmissx, pmissy) ]
+        result = np.empty(len(args[0]), dtype='float64')
+        ROOT.mt2_batch(len(result), mn, *(args+[result]))
+        return result
+
+    def mt2ll_batch(self, met_pt, met_phi, l1_pt, l1_eta, l1_phi, l2_pt, l2_eta, l2_phi):
+        metx, mety = self._pxpy(met_pt, met_phi)
+        l1x, l1y   = self._pxpy(l1_pt, l1_phi)
+        l2x, l2y   = self._pxpy(l2_pt, l2_phi)
+        return self._mt2_batch(self.mt2Mass_ll, l1x, l1y, l2x, l2y, metx, mety)
+    def mt2bb_batch(self, met_pt, met_phi, l1_pt, l1_eta, l1_phi, l2_pt, l2_eta, l2_phi, b1_pt, b1_eta, b1_phi, b2_pt, b2_eta, b2_phi):
+        metx, mety = self._pxpy(met_pt, met_phi)
+        l1x, l1y   = self._pxpy(l1_pt, l1_phi)
+        l2x, l2y   = self._pxpy(l2_pt, l2_phi)
+        b1x, b1y   = self._pxpy(b1_pt, b1_phi)
+        b2x, b2y   = self._pxpy(b2_pt, b2_phi)
+        return self._mt2_batch(self.mt2Mass_bb, b1x, b1y, b2x, b2y, metx+l1x+l2x, mety+l1y+l2y)
+    def mt2blbl_batch(self, met_pt, met_phi, l1_pt, l1_eta, l1_phi, l2_pt, l2_eta, l2_phi, b1_pt, b1_eta, b1_phi, b2_pt, b2_eta, b2_phi, strategy="minMaxMass"):
+        assert strategy=="minMaxMass", "only minMaxMass implemented"
+        metx, mety = self._pxpy(met_pt, met_phi)
+        l1 = self._p4(l1_pt, l1_eta, l1_phi, self.leptonMass)
+        l2 = self._p4(l2_pt, l2_eta, l2_phi, self.leptonMass)
+        b1 = self._p4(b1_pt, b1_eta, b1_phi, self.bjetMass)
+        b2 = self._p4(b2_pt, b2_eta, b2_phi, self.bjetMass)
+        #select lepton/bjet pairing by minimizing maximum mass
+        max1 = np.maximum(self._mass(l1, b1), self._mass(l2, b2))
+        max2 = np.maximum(self._mass(l1, b2), self._mass(l2, b1))
+        straight = max1<max2
+        bl1x = l1[1] + np.where(straight, b1[1], b2[1])
+        bl1y = l1[2] + np.where(straight, b1[2], b2[2])
+        bl2x = l2[1] + np.where(straight, b2[1], b1[1])
+        bl2y = l2[2] + np.where(straight, b2[2], b1[2])
+        return self._mt2_batch(self.mt2Mass_blbl, bl1x, bl1y, bl2x, bl2y, metx, mety)
+
 mt2Calculator = MT2Calculator()
@@ -0,0 +1,124 @@
+''' Content-addressed cache for the output of the nanoAOD-tools step (JME corrections, ISR counter, MET significance).
+    The key is a hash of the identity of the input file (name, ROOT UUID and size) and of the configuration of the modules,
+    so a file is only reused if it was produced from the same input with the same skim, JEC/JER and MET significance settings.
+    Files are validated on retrieval and the least recently used ones are removed when the cache exceeds its size.
+'''
+
+# Standard imports
+import os
+import json
+import shutil
+import hashlib
+import uuid
+import ROOT
+
+# StopsDilepton
+from StopsDilepton.tools.helpers import checkRootFile
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+# Increase when the nanoAOD-tools modules or their usage change in a way that is not captured by the configuration
+version = 1
+
+def fileIdentity( filename ):
+    ''' Name, UUID and size of a ROOT file. The UUID is written when the file is created, so a replaced file gets a new identity.
+    '''
+    f = ROOT.TFile.Open( filename )
+    if not f or f.IsZombie():
+        raise IOError( "File %s not available" % filename )
+    identity = { 'name':filename, 'uuid':f.GetUUID().AsString(), 'size':f.GetSize() }
+    f.Close()
+    return identity
+
+class NanoToolsCache:
+    def __init__( self, cacheDir, maxSizeGB = 100 ):
+        self.cacheDir = cacheDir
+        self.maxSize  = int( maxSizeGB*1024**3 )
+        if not os.path.isdir( cacheDir ):
+            try:
+                os.makedirs( cacheDir )
+            except OSError:
+                # created by another job in the meantime
+                pass
+
+    def key( self, inputFile, **config ):
+        ''' Hash of the input file identity and the configuration (must be json serializable)
+        '''
+        description = { 'version':version, 'input':fileIdentity( inputFile ), 'config':config }
+        return hashlib.sha1( json.dumps( description, sort_keys = True ) ).hexdigest(), description
+
+    def path( self, key ):
+        return os.path.join( self.cacheDir, key[:2], key + '.root' )
+
+    def get( self, key ):
+        ''' Path of a valid cached file or None. Corrupt files are removed.
+        '''
+        path = self.path( key )
+        if not os.path.exists( path ): return None
+        if not checkRootFile( path, checkForObjects = ["Events"] ):
+            logger.warning( "Removing corrupt cache file %s", path )
+            self.remove( key )
+            return None
+        # mark as recently used
+        os.utime( path, None )
+        logger.info( "Reusing cached nanoAOD-tools output %s", path )
+        return path
+
+    def add( self, key, filename, description = None ):
+        ''' Copy filename into the cache. The copy is renamed into place, so readers never see a partial file.
+        '''
+        path = self.path( key )
+        if not os.path.isdir( os.path.dirname( path ) ):
+            try:
+                os.makedirs( os.path.dirname( path ) )
+            except OSError:
+                pass
+        tmp = path + '.tmp_' + uuid.uuid4().hex
+        try:
+            shutil.copyfile( filename, tmp )
+            os.rename( tmp, path )
+        except (IOError, OSError) as e:
+            logger.warning( "Could not add %s to cache: %s", filename, e )
+            if os.path.exists( tmp ): os.remove( tmp )
+            return None
+        if description is not None:
+            with open( path.replace( '.root', '.json' ), 'w' ) as f:
+                json.dump( description, f, sort_keys = True, indent = 2 )
+        logger.info( "Added %s to cache as %s", filename, path )
+        self.evict()
+        return path
+
+    def remove( self, key ):
+        path = self.path( key )
+        for f in [ path, path.replace( '.root', '.json' ) ]:
+            try:
+                os.remove( f )
+            except OSError:
+                pass
+
+    def entries( self ):
+        ''' (last use, size, key) of all cached files '''
+        res = []
+        for subdir in os.listdir( self.cacheDir ):
+            directory = os.path.join( self.cacheDir, subdir )
+            if not os.path.isdir( directory ): continue
+            for f in os.listdir( directory ):
+                if not f.endswith( '.root' ): continue
+                try:
+                    stat = os.stat( os.path.join( directory, f ) )
+                except OSError:
+                    continue
+                res.append( ( stat.st_mtime, stat.st_size, f[:-len('.root')] ) )
+        return res
+
+    def evict( self ):
+        ''' Remove least recently used files until the cache is below its maximum size '''
+        entries = sorted( self.entries() )
+        total   = sum( size for mtime, size, key in entries )
+        for mtime, size, key in entries:
+            if total <= self.maxSize: break
+            logger.info( "Evicting %s from cache", key )
+            self.remove( key )
+            total -= size
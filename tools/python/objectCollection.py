@@ -0,0 +1,122 @@
+''' Struct-of-arrays representation of nanoAOD collections.
+    A Collection holds one numpy array per variable, read once per event from the reader, and the indices of the selected objects.
+    Selections, sorting and cleaning only change the indices, so no dict is built per object and event.
+    Indexing with a variable name returns the values of the selected objects, so the selectors of objectSelection
+    (jetId, isBJet, muonSelector, eleSelector) return the mask for the whole collection.
+    Dicts (same content as getObjDict) are only made for the objects that are iterated over.
+'''
+
+# Standard imports
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.helpers            import getVarValue
+from StopsDilepton.tools.objectSelection    import jetVars, muonVars, electronVars, genVars, jetId, ordValue
+from StopsDilepton.tools.columnarSelection  import deltaPhiArray
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+def readColumn( c, name, n ):
+    ''' The first n values of the array 'name' of the reader c. Missing values are NaN (as in getVarValue).
+        Floating point values are converted to float64, so that arithmetics are the same as with the python floats of getObjDict.
+    '''
+    try:
+        att = getattr( c, name )
+    except AttributeError:
+        return np.full( n, float('nan') )
+    try:
+        values = np.frombuffer( att, dtype = att.typecode, count = n )
+    except (AttributeError, TypeError, ValueError):
+        # no buffer interface (e.g. UChar_t as str) or fewer than n values
+        values = np.array( [ ordValue( att[i] ) for i in range( min( n, len(att) ) ) ] )
+    if len(values) < n:
+        values = np.concatenate( [ values.astype( np.float64 ), np.full( n - len(values), float('nan') ) ] )
+    return np.array( values, dtype = np.float64 if values.dtype.kind == 'f' else values.dtype )
+
+class Collection:
+    def __init__( self, columns, indices ):
+        ''' columns: dict of arrays with the values of all objects, indices: the selected objects '''
+        self.columns = columns
+        self.indices = indices
+
+    @classmethod
+    def fromReader( cls, c, prefix, variables, counter ):
+        ''' e.g. Collection.fromReader( r, 'Jet_', ['pt', 'eta'], 'nJet' ) '''
+        n = int( getVarValue( c, counter ) )
+        columns = { var:readColumn( c, prefix+var, n ) for var in variables if var != 'index' }
+        columns['index'] = np.arange( n )
+        return cls( columns, np.arange( n ) )
+
+    def __len__( self ):
+        return len( self.indices )
+
+    def keys( self ):
+        return self.columns.keys()
+
+    def __getitem__( self, key ):
+        ''' Variable name: values of the selected objects. Slice: Collection. Integer: dict of the object. '''
+        if isinstance( key, basestring ):
+            return self.columns[key][self.indices]
+        elif isinstance( key, slice ):
+            return Collection( self.columns, self.indices[key] )
+        return self.object( self.indices[key] )
+
+    def object( self, i ):
+        ''' dict of object i (index in the full collection) '''
+        return { var:values[i].item() for var, values in self.columns.iteritems() }
+
+    def __iter__( self ):
+        for i in self.indices:
+            yield self.object( i )
+
+    def toDicts( self ):
+        return list( self )
+
+    def __add__( self, other ):
+        ''' Concatenation of two selections of the same collection '''
+        if other.columns is not self.columns:
+            raise ValueError( "Can only add selections of the same collection" )
+        return Collection( self.columns, np.concatenate( [ self.indices, other.indices ] ) )
+
+    def select( self, selector ):
+        ''' Objects for which selector (a function of the Collection that returns a mask, e.g. muonSelector(...)) is true '''
+        mask = np.zeros( len(self), dtype = bool ) | np.asarray( selector( self ), dtype = bool )
+        return Collection( self.columns, self.indices[mask] )
+
+    def sort( self, key, reverse = True ):
+        ''' Stable sort by a variable or by an array of values (largest first by default) '''
+        values = self[key] if isinstance( key, basestring ) else key
+        order  = np.argsort( -values if reverse else values, kind = 'mergesort' )
+        return Collection( self.columns, self.indices[order] )
+
+    def cleanedAgainst( self, others, deltaR = 0.4 ):
+        ''' Objects that are not within deltaR of any of the others (dicts or Collection) '''
+        eta, phi = self['eta'], self['phi']
+        mask = np.ones( len(self), dtype = bool )
+        for other in others:
+            mask &= ~( np.sqrt( deltaPhiArray( other['phi'], phi )**2 + ( other['eta'] - eta )**2 ) < deltaR )
+        return Collection( self.columns, self.indices[mask] )
+
+def getJetCollection( c, jetVars = jetVars, jetColl = "Jet" ):
+    return Collection.fromReader( c, jetColl+'_', jetVars, 'n'+jetColl )
+
+def getAllJetCollection( c, leptons, ptCut = 30, absEtaCut = 2.4, jetVars = jetVars, jetColl = "Jet", idVar = 'jetId' ):
+    ''' Same selection and order as getAllJets for a single jet collection '''
+    jets = getJetCollection( c, jetVars, jetColl = jetColl ).select( lambda j: jetId( j, ptCut = ptCut, absEtaCut = absEtaCut, idVar = idVar ) )
+    return jets.cleanedAgainst( leptons ).sort( 'pt' )
+
+def getMuonCollection( c, collVars = muonVars ):
+    return Collection.fromReader( c, 'Muon_', collVars, 'nMuon' )
+
+def getElectronCollection( c, collVars = electronVars ):
+    return Collection.fromReader( c, 'Electron_', collVars, 'nElectron' )
+
+def getPhotonCollection( c, collVars = None, year = 2016 ):
+    if collVars is None:
+        collVars = ['eta','pt','phi','mass','cutBased'] if (not (year == 2017 or year == 2018)) else ['eta','pt','phi','mass','cutBasedBitmap']
+    return Collection.fromReader( c, 'Photon_', collVars, 'nPhoton' )
+
+def getGenPartCollection( c, genVars = genVars ):
+    return Collection.fromReader( c, 'GenPart_', genVars, 'nGenPart' )
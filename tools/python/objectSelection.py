@@ -6,6 +6,7 @@ from math import *
 import numbers
 import textwrap     # for CutBased Ele ID
 import operator
+import numpy as np
 
 jetVars = ['eta','pt','phi','btagDeepB', 'btagCSVV2', 'jetId', 'area', 'rawFactor', 'corr_JER']
 
@@ -14,6 +15,9 @@ def getJets(c, jetVars=jetVars, jetColl="Jet"):
 
 def jetId(j, ptCut=30, absEtaCut=2.4, ptVar='pt', idVar='jetId', corrFactor=None):
   j_pt = j[ptVar] if not corrFactor else j[ptVar]*j[corrFactor]
+  if isinstance(j_pt, np.ndarray):
+      # all jets of a Collection at once
+      return (j_pt>ptCut) & (np.abs(j['eta'])<absEtaCut) & ( j[idVar] > 0 if idVar is not None else True )
   return j_pt>ptCut and abs(j['eta'])<absEtaCut and ( j[idVar] > 0 if idVar is not None else True )
 
 def getGoodJets(c, ptCut=30, absEtaCut=2.4, jetVars=jetVars, jetColl="Jet", ptVar='pt'):
@@ -104,6 +108,24 @@ def alwaysTrue(*args, **kwargs):
 def alwaysFalse(*args, **kwargs):
   return False
 
+def ordValue(x):
+    ''' ord() for the single characters PyROOT returns for UChar_t, identity for numbers and arrays '''
+    return ord(x) if isinstance(x, str) else x
+
+def passesAll(cuts, l):
+    ''' Same as cuts[0](l) and cuts[1](l) and ... for a single object (dict).
+        For a Collection, where the cuts return arrays, the mask of the objects that pass all cuts.
+    '''
+    res = cuts[0](l)
+    if isinstance(res, np.ndarray):
+        for cut in cuts[1:]:
+            res = res & cut(l)
+        return res
+    for cut in cuts[1:]:
+        if not res: return res
+        res = cut(l)
+    return res
+
 def mergeCollections( a, b ):
     allKeys = []
     for coll in [a[0], b[0]]:
@@ -122,44 +144,47 @@ def mergeCollections( a, b ):
 ## MUONS ##
 def muonSelector( lepton_selection, year, ptCut = 10):
     # tigher isolation applied on analysis level
+    # the selector takes a muon dict or a Collection of muons (then returns a mask), see passesAll
     if lepton_selection == 'tight':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['pfRelIso03_all'] < 0.20 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1 \
-                and l["mediumId"] 
+        cuts = [
+            lambda l: l["pt"]                 >= ptCut,
+            lambda l: abs(l["eta"])           < 2.4,
+            lambda l: l['pfRelIso03_all']     < 0.20,
+            lambda l: l["sip3d"]              < 4.0,
+            lambda l: abs(l["dxy"])           < 0.05,
+            lambda l: abs(l["dz"])            < 0.1,
+            lambda l: l["mediumId"],
+        ]
     elif lepton_selection == 'tightMiniIso02':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['miniPFRelIso_all'] < 0.20 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1 \
-                and l["mediumId"] 
+        cuts = [
+            lambda l: l["pt"]                 >= ptCut,
+            lambda l: abs(l["eta"])           < 2.4,
+            lambda l: l['miniPFRelIso_all']   < 0.20,
+            lambda l: l["sip3d"]              < 4.0,
+            lambda l: abs(l["dxy"])           < 0.05,
+            lambda l: abs(l["dz"])            < 0.1,
+            lambda l: l["mediumId"],
+        ]
     elif lepton_selection == 'tightNoIso':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1 \
-                and l["mediumId"] 
+        cuts = [
+            lambda l: l["pt"]                 >= ptCut,
+            lambda l: abs(l["eta"])           < 2.4,
+            lambda l: l["sip3d"]              < 4.0,
+            lambda l: abs(l["dxy"])           < 0.05,
+            lambda l: abs(l["dz"])            < 0.1,
+            lambda l: l["mediumId"],
+        ]
     elif lepton_selection == 'loose':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['pfRelIso03_all'] < 0.20 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1
+        cuts = [
+            lambda l: l["pt"]                 >= ptCut,
+            lambda l: abs(l["eta"])           < 2.4,
+            lambda l: l['pfRelIso03_all']     < 0.20,
+            lambda l: l["sip3d"]              < 4.0,
+            lambda l: abs(l["dxy"])           < 0.05,
+            lambda l: abs(l["dz"])            < 0.1,
+        ]
+    def func(l):
+        return passesAll(cuts, l)
     return func
 
 def muonSelectorString(relIso03 = 0.2, ptCut = 20, absEtaCut = 2.4, dxy = 0.05, dz = 0.1, index = "Sum"):
@@ -217,44 +242,49 @@ def cbEleSelector( quality, removeCuts = [] ):
         else:
             thresholds.append( 0 )
 
-    # construct the selector
+    # construct the selector (for an array of bitmaps, returns the mask)
     def _selector( integer ):
+        if isinstance( integer, np.ndarray ):
+            bitmap = integer.astype( np.int64 )
+            nCuts  = len(thresholds)
+            return np.all( [ ( ( bitmap >> 3*(nCuts-1-i) ) & 7 ) >= threshold for i, threshold in enumerate( thresholds ) ], axis = 0 )
         return all(map( lambda x: operator.ge(*x), zip( cutBasedEleBitmap(integer), thresholds ) ))
     return _selector
 
 def eleSelector( lepton_selection, year, ptCut = 10):
     # tigher isolation applied on analysis level. cutBased corresponds to Fall17V2 ID for all 2016-2018.
+    # the selector takes an electron dict or a Collection of electrons (then returns a mask), see passesAll
     if lepton_selection == 'tight':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['cutBased']       >= 4 \
-                and l['pfRelIso03_all'] < 0.20 \
-                and l["convVeto"] \
-                and ord(l["lostHits"])  == 0 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1
+        cuts = [
+            lambda l: l["pt"]                   >= ptCut,
+            lambda l: abs(l["eta"])             < 2.4,
+            lambda l: l['cutBased']             >= 4,
+            lambda l: l['pfRelIso03_all']       < 0.20,
+            lambda l: l["convVeto"],
+            lambda l: ordValue(l["lostHits"])   == 0,
+            lambda l: l["sip3d"]                < 4.0,
+            lambda l: abs(l["dxy"])             < 0.05,
+            lambda l: abs(l["dz"])              < 0.1,
+        ]
     elif lepton_selection == 'tightMiniIso02':
         cbEleSelector_ = cbEleSelector( 'tight', removeCuts = ['GsfEleRelPFIsoScaledCut'] )
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and cbEleSelector_(l['vidNestedWPBitmap']) \
-                and l["miniPFRelIso_all"] < 0.2 \
-                and l["sip3d"]          < 4.0 \
-                and ord(l["lostHits"])  == 0 
+        cuts = [
+            lambda l: l["pt"]                   >= ptCut,
+            lambda l: abs(l["eta"])             < 2.4,
+            lambda l: cbEleSelector_(l['vidNestedWPBitmap']),
+            lambda l: l["miniPFRelIso_all"]     < 0.2,
+            lambda l: l["sip3d"]                < 4.0,
+            lambda l: ordValue(l["lostHits"])   == 0,
+        ]
     elif lepton_selection == 'tightNoIso':
         cbEleSelector_ = cbEleSelector( 'tight', removeCuts = ['GsfEleRelPFIsoScaledCut'] )
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l["sip3d"]          < 4.0 \
-                and ord(l["lostHits"])  == 0 \
-                and cbEleSelector_(l['vidNestedWPBitmap']) 
+        cuts = [
+            lambda l: l["pt"]                   >= ptCut,
+            lambda l: abs(l["eta"])             < 2.4,
+            lambda l: l["sip3d"]                < 4.0,
+            lambda l: ordValue(l["lostHits"])   == 0,
+            lambda l: cbEleSelector_(l['vidNestedWPBitmap']),
+        ]
 #    elif lepton_selection == 'tightNoIso':
 #        def func(l):
 #            return \
@@ -267,29 +297,31 @@ def eleSelector( lepton_selection, year, ptCut = 10):
 #                and abs(l["dxy"])       < 0.05 \
 #                and abs(l["dz"])        < 0.1
     elif lepton_selection == 'medium':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['cutBased']       >= 3 \
-                and l['pfRelIso03_all'] < 0.20 \
-                and l["convVeto"] \
-                and ord(l["lostHits"])  == 0 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1
+        cuts = [
+            lambda l: l["pt"]                   >= ptCut,
+            lambda l: abs(l["eta"])             < 2.4,
+            lambda l: l['cutBased']             >= 3,
+            lambda l: l['pfRelIso03_all']       < 0.20,
+            lambda l: l["convVeto"],
+            lambda l: ordValue(l["lostHits"])   == 0,
+            lambda l: l["sip3d"]                < 4.0,
+            lambda l: abs(l["dxy"])             < 0.05,
+            lambda l: abs(l["dz"])              < 0.1,
+        ]
     elif lepton_selection == 'loose':
-        def func(l):
-            return \
-                l["pt"]                 >= ptCut \
-                and abs(l["eta"])       < 2.4 \
-                and l['cutBased']       >= 1 \
-                and l['pfRelIso03_all'] < 0.20 \
-                and l["convVeto"] \
-                and ord(l["lostHits"])  == 0 \
-                and l["sip3d"]          < 4.0 \
-                and abs(l["dxy"])       < 0.05 \
-                and abs(l["dz"])        < 0.1
+        cuts = [
+            lambda l: l["pt"]                   >= ptCut,
+            lambda l: abs(l["eta"])             < 2.4,
+            lambda l: l['cutBased']             >= 1,
+            lambda l: l['pfRelIso03_all']       < 0.20,
+            lambda l: l["convVeto"],
+            lambda l: ordValue(l["lostHits"])   == 0,
+            lambda l: l["sip3d"]                < 4.0,
+            lambda l: abs(l["dxy"])             < 0.05,
+            lambda l: abs(l["dz"])              < 0.1,
+        ]
+    def func(l):
+        return passesAll(cuts, l)
     return func
 
 def eleSelectorString(relIso03 = 0.2, eleId = 4, ptCut = 20, absEtaCut = 2.4, dxy = 0.05, dz = 0.1, index = "Sum", noMissingHits=True):
@@ -2,19 +2,25 @@
 Implementation for CMS analyses
 
 Concurrent writing is not supported in sqlite on network drives, hence there will be problems if multiple (batch) jobs from different worker nodes are writing to the same database file at the same time.
-To circumvent this, we don't care about dataloss since a missing result will just be re-calculated in the next go.
-This whole code is messy, however, it finally seems to work.
+Therefore there are two ways of writing:
 
-Establishing exclusive connections was also not successful, however, one might give it another shot at some point.
-Use sth like
-self.conn.isolation_level = 'EXCLUSIVE'
-self.conn.execute('BEGIN EXCLUSIVE')
+- sqlite (default): every result is committed right away (the table has an index on the key columns).
+  With batchSize > 1 results are collected and committed in batches of 'batchSize' results in a single transaction, the rest at exit or with flush().
+  If the database stays locked longer than 'timeout' seconds, the results are written to a shard instead of being dropped.
+- shards (shard = True): every job appends its results to its own file '<database>.shards/<tableName>.<host>.<pid>.<id>.shard'.
+  No locking is needed and nothing is lost if jobs are killed. Shards are read together with the database and can be merged into it
+  with resultsDB.merge() or tools/scripts/mergeResultsDB.py once the jobs are done.
 
+Reading is done from an in-memory index of database and shards that is loaded on first use and refreshed when a key is not found.
 '''
 
 # Standard imports
 import os
 import time
+import uuid
+import atexit
+import weakref
+import socket
 import sqlite3
 import cPickle
 
@@ -24,130 +30,220 @@ from u_float import u_float
 import logging
 logger = logging.getLogger(__name__)
 
+shardSuffix = '.shard'
+
+# instances with batched writes, flushed at exit without keeping them alive (instances collected before are flushed in __del__)
+batchedInstances = weakref.WeakSet()
+
+@atexit.register
+def flushBatchedInstances():
+    for db in list( batchedInstances ):
+        db.flush()
+
+def shardDirectory( database ):
+    return database + '.shards'
+
+def readShard( filename, offset = 0 ):
+    ''' Read complete records from shard file starting at offset. Returns header, records and the offset after the last complete record.
+    '''
+    header, records = None, []
+    with open( filename, 'rb' ) as f:
+        if offset == 0:
+            try:
+                header = cPickle.load( f )
+                offset = f.tell()
+            except ( EOFError, cPickle.UnpicklingError, ValueError, IndexError ):
+                # header not completely written yet
+                return None, [], 0
+        f.seek( offset )
+        while True:
+            try:
+                records.append( cPickle.load( f ) )
+                offset = f.tell()
+            except ( EOFError, cPickle.UnpicklingError, ValueError, IndexError ):
+                # end of file or record that is still being written
+                break
+    return header, records, offset
+
 class dbopen(object):
     """
-    Simple CM for sqlite3 databases. Commits everything at exit.
+    Simple CM for sqlite3 databases. Commits everything at exit (rolls back on exceptions) and closes the connection.
     """
-    def __init__(self, path, write=True):
+    def __init__(self, path, timeout):
         self.path = path
+        self.timeout = timeout
         self.conn = None
-        self.cursor = None
-        self.write = write
 
     def __enter__(self):
         logger.debug("Connecting to DB file %s", self.path)
-        self.conn = sqlite3.connect(self.path)
-        self.cursor = self.conn.cursor()
-        return self.cursor
+        self.conn = sqlite3.connect(self.path, timeout = self.timeout)
+        self.conn.text_factory = str
+        return self.conn
 
     def __exit__(self, exc_class, exc, traceback):
-        self.conn.commit()
+        if exc_class is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
         self.conn.close()
 
-
-
 class resultsDB:
-    def __init__(self, database, tableName, columns):
+    def __init__(self, database, tableName, columns, shard = False, batchSize = 1, timeout = 60):
         '''
         Will create a table with name tableName, with the provided columns (as a list) and two additional columns: value and time_stamp
         '''
-        self.database_file = database
+        self.database_file  = database
         self.tableName      = tableName
-        self.columns        = self.clean(columns)
-        self.columns        = self.columns + ["value"]
+        self.keyColumns     = self.clean(columns)
+        self.columns        = self.keyColumns + ["value"]
         self.columnString   = ", ".join([ s+" text" for s in self.columns ])
+        self.shard          = shard
+        self.batchSize      = batchSize
+        self.timeout        = timeout
+
+        self.pending        = []    # records (key, value, isBlob, time_stamp, overwrite) not yet committed
+        self.shardFile      = None  # own shard, created on first write
+
+        # in-memory index: key tuple -> list of (value, time_stamp), oldest first
+        self.index          = None
+        self.dbStamp_       = None
+        self.shardOffsets   = {}
 
-        self.connect()
         try:
-            with self.conn:
-                '''
-                Use context manager for connections. Closes the connection on exit.
-                '''
-                executeString = '''CREATE TABLE %s (%s, time_stamp real )'''%(self.tableName, self.columnString)
-                try:
-                    self.conn.execute(executeString)
-                    # try to aviod database malform problems
-                    self.conn.execute('''PRAGMA journal_mode = DELETE''') # WAL doesn't work on network filesystems
-                    self.conn.execute('''PRAGMA synchronus = 2''')
-                except sqlite3.OperationalError:
-                    # Doesn't really matter if that doesn't work.
-                    logger.debug("Table already exists.")
-                except sqlite3.DatabaseError:
-                    logger.debug("Concurrency problem. Table should already exist.")
-        except:
-            pass
-        self.close()
+            with self.connect() as conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS %s (%s, time_stamp real )'''%(self.tableName, self.columnString))
+                conn.execute('''CREATE INDEX IF NOT EXISTS %s_key ON %s (%s)'''%(self.tableName, self.tableName, ", ".join(self.keyColumns)))
+        except sqlite3.DatabaseError as e:
+            logger.warning("Could not create table %s in %s: %s", self.tableName, self.database_file, e)
+
+        if self.batchSize > 1 and not self.shard:
+            batchedInstances.add( self )
+
+    def __del__(self):
+        if self.pending:
+            self.flush()
 
     def clean(self, columns):
         return [ c for c in columns ]
-    
-    def dropTable(self):
-        executeString = '''DROP TABLE %s'''%self.tableName
-        self.connect()
-        with self.conn:
-            self.conn.execute(executeString)
 
     def connect(self):
         '''
-        only establish the connection when needed, not when resultsDB object is created
+        only establish the connection when needed, not when resultsDB object is created. Waits up to 'timeout' seconds for locks.
         '''
-        self.conn = sqlite3.connect(self.database_file)
-    
-    def cursor(self):
-        self.cursor = self.database.cursor()
+        return dbopen(self.database_file, self.timeout)
 
-    def close(self):
+    def dbStamp(self):
+        ''' Changes whenever another process commits to the database
         '''
-        Not really needed anymore if all connections are handled with context manager
+        if not os.path.exists( self.database_file ): return None
+        stat = os.stat( self.database_file )
+        return ( stat.st_mtime, stat.st_size )
+
+    def dropTable(self):
+        self.pending = []
+        with self.connect() as conn:
+            conn.execute('''DROP TABLE %s'''%self.tableName)
+        self.index = None
+
+    def makeKey(self, key):
+        if not sorted(key.keys()) == sorted(self.keyColumns):
+            raise(ValueError("The columns don't match the table. Use the following: %s"%", ".join(self.keyColumns)))
+        return tuple( str(key[c]) for c in self.keyColumns )
+
+    # Reading
+
+    def _insert(self, index, key, value, time_stamp, overwrite):
+        if overwrite or key not in index:
+            index[key] = [ (value, time_stamp) ]
+        else:
+            index[key].append( (value, time_stamp) )
+            index[key].sort( key = lambda v: v[1] )
+
+    def _shardFiles(self):
+        directory = shardDirectory( self.database_file )
+        if not os.path.isdir( directory ): return []
+        return sorted( os.path.join( directory, f ) for f in os.listdir( directory ) if f.startswith( self.tableName + '.' ) and f.endswith( shardSuffix ) )
+
+    def _load(self):
+        ''' Read the complete table into the in-memory index.
         '''
-        self.conn.close()
-        del self.conn
-        
-    def getObjects(self, key):
+        index = {}
+        stamp = self.dbStamp()
+        try:
+            with self.connect() as conn:
+                for row in conn.execute('''SELECT %s, value, time_stamp FROM %s ORDER BY time_stamp'''%(", ".join(self.keyColumns), self.tableName)):
+                    index.setdefault( tuple( str(v) for v in row[:-2] ), [] ).append( ( str(row[-2]), row[-1] ) )
+        except sqlite3.DatabaseError as e:
+            logger.warning("Could not read table %s from %s: %s", self.tableName, self.database_file, e)
+            if self.index is not None: return
+        self.index        = index
+        self.dbStamp_     = stamp
+        self.shardOffsets = {}
+        self._readShards()
+        # results not yet committed by this instance
+        for key, value, isBlob, time_stamp, overwrite in self.pending:
+            self._insert( self.index, key, value, time_stamp, overwrite )
+
+    def _readShards(self):
+        ''' Read records that were appended to shards since the last call.
         '''
-        Get all entries in the database matching the provided key.
+        for filename in self._shardFiles():
+            offset = self.shardOffsets.get( filename, 0 )
+            try:
+                if os.path.getsize( filename ) == offset: continue
+                header, records, offset = readShard( filename, offset )
+            except (IOError, OSError):
+                # shard removed by a merge
+                continue
+            self.shardOffsets[filename] = offset
+            for key, value, isBlob, time_stamp, overwrite in records:
+                self._insert( self.index, key, value, time_stamp, overwrite )
+
+    def _refresh(self):
+        ''' Reload if another process changed the database, otherwise read new shard records.
         '''
-        columns = self.clean(key.keys()+["value", "time_stamp"])
-        selection = " AND ".join([ "%s = '%s'"%(k, key[k]) for k in key.keys() ])
+        if self.index is None or self.dbStamp() != self.dbStamp_:
+            self._load()
+        else:
+            self._readShards()
 
-        selectionString = "SELECT * FROM {} ".format(self.tableName) + " WHERE {} ".format(selection) + " ORDER BY time_stamp"
+    def _lookup(self, key):
+        ''' List of (key, value, time_stamp) matching the (possibly partial) key, oldest first.
+        '''
+        if sorted(key.keys()) == sorted(self.keyColumns):
+            k = tuple( str(key[c]) for c in self.keyColumns )
+            return [ (k, value, time_stamp) for value, time_stamp in self.index.get( k, [] ) ]
+        positions = [ (self.keyColumns.index(c), str(v)) for c, v in key.items() ]
+        res = [ (k, value, time_stamp) for k, values in self.index.iteritems() if all( k[i] == v for i, v in positions ) for value, time_stamp in values ]
+        res.sort( key = lambda r: r[2] )
+        return res
 
-        logger.debug("Trying to read")
-        for i in range(100):
-            self.connect()
-            try:
-                with self.conn:
-                    try:
-                        obj = self.conn.execute(selectionString)
-                        objs = [o for o in obj]
-                        if len(objs) > 0:
-                            logger.debug("Reading successfull.")
-                        return objs
-                    except sqlite3.OperationalError:
-                        logger.debug("OE: Locked (reading).")
-                    except sqlite3.DatabaseError:
-                        logger.debug("DE: Locked (reading).")
-                time.sleep(0.01)
-            except:
-                pass
-            self.close()
-        return False
+    def getObjects(self, key):
+        '''
+        Get all entries matching the provided key, as rows (columns..., value, time_stamp) ordered by time_stamp.
+        '''
+        unknown = [ c for c in key.keys() if c not in self.keyColumns ]
+        if unknown:
+            raise(ValueError("Unknown columns %s. Use the following: %s"%(", ".join(unknown), ", ".join(self.keyColumns))))
+        if self.index is None: self._load()
+        objs = self._lookup( key )
+        if not objs:
+            self._refresh()
+            objs = self._lookup( key )
+        return [ k + (value, time_stamp) for k, value, time_stamp in objs ]
 
     def getDicts(self, key):
         objs = self.getObjects(key)
         if objs:
-            o = []
-            for obj in objs:
-                o.append({c:str(v) for c,v in zip( self.columns, obj ) })
-            return o
+            return [ {c:str(v) for c,v in zip( self.columns, obj ) } for obj in objs ]
         else:
             return False
-    
+
     def getTable(self, key):
         '''
         Get a nice table printed on the screen of all entries in the database matching the provided key
         '''
-        d = self.getDicts(key)
+        d = self.getDicts(key) or []
         tableColumns = ["Row#"] + self.columns
         header = "{:6}" + "| {:7} "*(len(self.columns)-1) + "| {:15} "
         print "="*(6+18+10*(len(self.columns)-1))
@@ -164,11 +260,9 @@ class resultsDB:
             if lineCount%50==0 and lineCount>0:
                 a = raw_input("continue scanning? 'q' to quit: ")
                 if a == 'q': break
-            
 
     def contains(self, key):
-        objs = self.getObjects(key)
-        return len(objs) if type(objs) == type([]) else 0 # in case there's a locking problem act as if stuff existed
+        return len(self.getObjects(key))
 
     def getObject(self, key):
         objs = self.getObjects(key)
@@ -203,112 +297,118 @@ class resultsDB:
             except:
                 return False
 
+    # Writing
+
+    def _write(self, key, value, isBlob, overwrite):
+        record = ( self.makeKey(key), value, isBlob, time.time(), overwrite )
+        if self.index is not None:
+            self._insert( self.index, record[0], value, record[3], overwrite )
+        if self.shard:
+            self._writeShard( [record] )
+        else:
+            self.pending.append( record )
+            if len(self.pending) >= self.batchSize:
+                self.flush()
+
+    def _writeShard(self, records):
+        if self.shardFile is None:
+            directory = shardDirectory( self.database_file )
+            if not os.path.isdir( directory ):
+                try:
+                    os.makedirs( directory )
+                except OSError:
+                    # created by another job in the meantime
+                    pass
+            self.shardFile = os.path.join( directory, "%s.%s.%i.%s%s"%( self.tableName, socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8], shardSuffix ) )
+            with open( self.shardFile, 'ab' ) as f:
+                cPickle.dump( {'tableName':self.tableName, 'columns':self.keyColumns}, f, cPickle.HIGHEST_PROTOCOL )
+        with open( self.shardFile, 'ab' ) as f:
+            for record in records:
+                cPickle.dump( record, f, cPickle.HIGHEST_PROTOCOL )
+            f.flush()
+            os.fsync( f.fileno() )
+        # our own records are already in the index
+        self.shardOffsets[self.shardFile] = os.path.getsize( self.shardFile )
+
+    def _commit(self, records):
+        ''' Write records to the database in a single transaction.
+        '''
+        keyCondition = " AND ".join( "%s = ?"%c for c in self.keyColumns )
+        insertString = '''INSERT INTO %s (%s, value, time_stamp) VALUES (%s)'''%( self.tableName, ", ".join(self.keyColumns), ", ".join( ["?"]*(len(self.keyColumns)+2) ) )
+        with self.connect() as conn:
+            for key, value, isBlob, time_stamp, overwrite in records:
+                if overwrite:
+                    conn.execute( '''DELETE FROM %s WHERE %s'''%( self.tableName, keyCondition ), key )
+                conn.execute( insertString, key + ( sqlite3.Binary(value) if isBlob else value, time_stamp ) )
+        self.dbStamp_ = self.dbStamp()
+
+    def flush(self):
+        ''' Commit pending results. Falls back to a shard if the database stays locked.
+        '''
+        if not self.pending: return
+        records, self.pending = self.pending, []
+        try:
+            self._commit( records )
+            logger.debug("Committed %i results to %s", len(records), self.database_file)
+        except sqlite3.DatabaseError as e:
+            logger.warning("Could not commit %i results to %s (%s), writing them to a shard.", len(records), self.database_file, e)
+            self._writeShard( records )
+
     def addData(self, key, data, overwrite):
         '''
         add binary data to a databse as blob
         '''
-        if overwrite and self.contains(key):
-            self.removeObjects(key)
-
-        columns = self.clean(key.keys()+["value"])
-        if not sorted(columns) == sorted(self.columns):
-            raise(ValueError("The columns don't match the table. Use the following: %s"%", ".join(self.columns)))
-        
-        columns += ["time_stamp"]
-        pdata = cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
-        values  = key.values()
-        
-        # check if number of columns matches. By default, there is no error if not, but better be save than sorry.
-        if len(key.keys())+1 < len(self.columns):
-            raise(ValueError("The length of the given key doesn't match the number of columns in the table. The following columns (excluding value and time_stamp) are part of the table: %s"%", ".join(self.columns)))
-        
-        selectionString = "INSERT INTO {} ".format(self.tableName) + " ({}) ".format(", ".join( columns )) + " VALUES ({}".format(", ".join([ "'%s'"%i for i in values ])) + ", :data, '%s')"%time.time()
-        
-        for i in range(100):
-            self.connect()
-            try:
-                with self.conn:
-                    try:
-                        self.conn.execute(selectionString, (sqlite3.Binary(pdata),))
-                        logger.info("Added data to database.")
-                        return data
-                    except sqlite3.OperationalError:
-                        logger.debug("OE: Locked (writing data).")
-                    except sqlite3.DatabaseError:
-                        logger.debug("DE: Locked (writing data).")
-                time.sleep(0.01)
-            except:
-                pass
-            self.close()
+        self._write( key, cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL), True, overwrite )
+        logger.info("Added data to database.")
+        return data
 
     def add(self, key, value, overwrite, overwriteOldest=False):
         '''
         new DB structure. key needs to be a python dictionary. Overwrite removes all previous entries found under the key.
         '''
-
-        if overwrite and self.contains(key):
-            logger.info("Overwriting old result.")
-            self.removeObjects(key)
-
-        logger.debug("Trying to write")
-        columns = self.clean(key.keys()+["value"])
-        if not sorted(columns) == sorted(self.columns):
-            raise(ValueError("The columns don't match the table. Use the following: %s"%", ".join(self.columns)))
-        
-        columns += ["time_stamp"]
-        values  = key.values()+[str(value), time.time()]
-        
-        # check if number of columns matches. By default, there is no error if not, but better be save than sorry.
-        if len(key.keys())+1 < len(self.columns):
-            raise(ValueError("The length of the given key doesn't match the number of columns in the table. The following columns (excluding value and time_stamp) are part of the table: %s"%", ".join(self.columns)))
-
-        selectionString = "INSERT INTO {} ".format(self.tableName) + " ({}) ".format(", ".join( columns )) + " VALUES ({})".format(", ".join([ "'%s'"%i for i in values ]))
-
-        for i in range(100):
-            self.connect()
-            try:
-                with self.conn:
-                    try:
-                        self.conn.execute(selectionString)
-                        logger.info("Added value %s to database",value)
-                        return value
-                    except sqlite3.OperationalError:
-                        logger.debug("OE: Locked (writing).")
-                    except sqlite3.DatabaseError:
-                        logger.debug("DE: Locked (writing).")
-                time.sleep(0.01)
-            except:
-                pass
-            self.close()
-                
+        self._write( key, str(value), False, overwrite )
+        logger.info("Added value %s to database",value)
+        return value
 
     def removeObjects(self, key):
         '''
-        Remove entries matching the key. Careful when not all columns are specified!
+        Remove entries matching the key from the database. Careful when not all columns are specified!
         '''
-        selection = " AND ".join([ "%s = '%s'"%(k, key[k]) for k in key.keys() ])
-
-        selectionString = "DELETE FROM {} ".format(self.tableName) + " WHERE {} ".format(selection)
-        for i in range(100):
-            self.connect()
-            try:
-                with self.conn:
-                    try:
-                        self.conn.execute(selectionString)
-                        return
-                    except sqlite3.OperationalError:
-                        logger.debug("OE: Locked (removing).")
-                    except sqlite3.DatabaseError:
-                        logger.debug("DE: Locked (removing).")
-                time.sleep(0.01)
-            except:
-                pass
-            self.close()
-        return False
+        self.flush()
+        selection = " AND ".join( "%s = ?"%k for k in key.keys() )
+        with self.connect() as conn:
+            conn.execute( '''DELETE FROM %s WHERE %s'''%( self.tableName, selection ), tuple( str(v) for v in key.values() ) )
+        self.index = None
 
+    def merge(self):
+        '''
+        Merge all shards of this table into the database and remove them. Only run when no job is writing anymore.
+        '''
+        self.flush()
+        records, merged = [], []
+        for filename in self._shardFiles():
+            header, records_, offset = readShard( filename )
+            if header is not None and header['columns'] != self.keyColumns:
+                logger.warning("Shard %s has columns %s, skipping.", filename, ", ".join(header['columns']))
+                continue
+            records += records_
+            if offset == os.path.getsize( filename ):
+                merged.append( filename )
+            else:
+                logger.warning("Shard %s has an incomplete record at the end, keeping it.", filename)
+        records.sort( key = lambda r: r[3] )
+        self._commit( records )
+        for filename in merged:
+            os.remove( filename )
+        self.shardFile = None
+        self.index     = None
+        logger.info("Merged %i results from %i shards into %s", len(records), len(merged), self.database_file)
+        return len(records)
 
     def resetDatabase(self):
+        self.pending = []
         if os.path.isfile(self.database_file):
             os.remove(self.database_file)
-        self.__init__(self.database_file)
-
+        for filename in self._shardFiles():
+            os.remove(filename)
+        self.__init__(self.database_file, self.tableName, self.keyColumns, shard = self.shard, batchSize = self.batchSize, timeout = self.timeout)
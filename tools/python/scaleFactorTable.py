@@ -0,0 +1,160 @@
+''' Scale factor maps as numpy lookup tables.
+    A TH2 (or TGraph) is converted once into bin edges, contents and errors and cached to an .npz file next to the ROOT file.
+    Lookups reproduce TH2::FindBin including under- and overflow bins; scalar lookups avoid numpy and PyROOT altogether.
+'''
+
+# Standard imports
+import os
+import bisect
+import numpy as np
+
+# Logging
+import logging
+logger = logging.getLogger(__name__)
+
+def cacheFileName( filename, key ):
+    return "%s_%s.npz" % ( os.path.splitext( filename )[0], key )
+
+def axisEdges( axis ):
+    return np.array( [ axis.GetBinLowEdge(i) for i in range( 1, axis.GetNbins()+2 ) ], dtype='float64' )
+
+class SFTable2D:
+    ''' Contents and errors of a TH2 including under- and overflow, indexed as [bin_x, bin_y] like TH2::GetBinContent.
+    '''
+    def __init__( self, xEdges, yEdges, values, errors ):
+        self.xEdges = np.asarray( xEdges, dtype='float64' )
+        self.yEdges = np.asarray( yEdges, dtype='float64' )
+        self.values = np.asarray( values, dtype='float64' )
+        self.errors = np.asarray( errors, dtype='float64' )
+        assert self.values.shape == ( len(self.xEdges)+1, len(self.yEdges)+1 ) == self.errors.shape, "Inconsistent table shape"
+
+        # python copies for the scalar path
+        self.xEdges_ = self.xEdges.tolist()
+        self.yEdges_ = self.yEdges.tolist()
+        self.values_ = self.values.tolist()
+        self.errors_ = self.errors.tolist()
+
+    @classmethod
+    def fromTH2( cls, h ):
+        xEdges, yEdges = axisEdges( h.GetXaxis() ), axisEdges( h.GetYaxis() )
+        shape  = ( len(xEdges)+1, len(yEdges)+1 )
+        values = np.array( [ [ h.GetBinContent( i, j ) for j in range( shape[1] ) ] for i in range( shape[0] ) ], dtype='float64' )
+        errors = np.array( [ [ h.GetBinError  ( i, j ) for j in range( shape[1] ) ] for i in range( shape[0] ) ], dtype='float64' )
+        return cls( xEdges, yEdges, values, errors )
+
+    def toDict( self ):
+        return { 'type':np.array('TH2'), 'xEdges':self.xEdges, 'yEdges':self.yEdges, 'values':self.values, 'errors':self.errors }
+
+    @classmethod
+    def fromDict( cls, d ):
+        return cls( d['xEdges'], d['yEdges'], d['values'], d['errors'] )
+
+    @property
+    def xMax( self ):
+        return self.xEdges_[-1]
+
+    @property
+    def xMin( self ):
+        return self.xEdges_[0]
+
+    @property
+    def yMax( self ):
+        return self.yEdges_[-1]
+
+    @property
+    def yMin( self ):
+        return self.yEdges_[0]
+
+    def findBin( self, x, y ):
+        ''' Same as (GetXaxis().FindBin(x), GetYaxis().FindBin(y)) '''
+        return bisect.bisect_right( self.xEdges_, x ), bisect.bisect_right( self.yEdges_, y )
+
+    def findBins( self, x, y ):
+        return np.searchsorted( self.xEdges, x, side='right' ), np.searchsorted( self.yEdges, y, side='right' )
+
+    def get( self, x, y ):
+        ''' Bin content and error for scalar x, y '''
+        i, j = self.findBin( x, y )
+        return self.values_[i][j], self.errors_[i][j]
+
+    def getArrays( self, x, y ):
+        ''' Bin contents and errors for arrays x, y '''
+        i, j = self.findBins( x, y )
+        return self.values[i, j], self.errors[i, j]
+
+class SFGraph:
+    ''' Points of a TGraph, evaluated with linear interpolation and extrapolation like TGraph::Eval.
+        xMin and xMax are the limits of the x axis of the graph.
+    '''
+    def __init__( self, x, y, xMin, xMax ):
+        order  = np.argsort( x, kind='mergesort' )
+        self.x = np.asarray( x, dtype='float64' )[order]
+        self.y = np.asarray( y, dtype='float64' )[order]
+        assert len(self.x) >= 2, "Need at least two points"
+        self.x_ = self.x.tolist()
+        self.y_ = self.y.tolist()
+        self.xMin = float(xMin)
+        self.xMax = float(xMax)
+
+    @classmethod
+    def fromTGraph( cls, g ):
+        n = g.GetN()
+        return cls( [ g.GetX()[i] for i in range(n) ], [ g.GetY()[i] for i in range(n) ], g.GetXaxis().GetXmin(), g.GetXaxis().GetXmax() )
+
+    def toDict( self ):
+        return { 'type':np.array('TGraph'), 'x':self.x, 'y':self.y, 'xRange':np.array([self.xMin, self.xMax]) }
+
+    @classmethod
+    def fromDict( cls, d ):
+        return cls( d['x'], d['y'], *d['xRange'] )
+
+    def eval( self, x ):
+        i = min( max( bisect.bisect_right( self.x_, x ) - 1, 0 ), len(self.x_) - 2 )
+        x0, x1, y0, y1 = self.x_[i], self.x_[i+1], self.y_[i], self.y_[i+1]
+        if x0 == x1: return y0
+        return y0 + ( x - x0 )*( y1 - y0 )/( x1 - x0 )
+
+    def evalArray( self, x ):
+        x  = np.asarray( x, dtype='float64' )
+        i  = np.clip( np.searchsorted( self.x, x, side='right' ) - 1, 0, len(self.x) - 2 )
+        x0, x1, y0, y1 = self.x[i], self.x[i+1], self.y[i], self.y[i+1]
+        dx = np.where( x1 == x0, 1., x1 - x0 )
+        return np.where( x1 == x0, y0, y0 + ( x - x0 )*( y1 - y0 )/dx )
+
+def product( factors ):
+    ''' Product of (value, error) pairs with uncorrelated errors as in u_float.__mul__ (scalars or arrays)
+    '''
+    val, sigma = factors[0]
+    for v, s in factors[1:]:
+        val, sigma = val*v, ( (sigma*v)**2 + (val*s)**2 )**0.5
+    return val, sigma
+
+def loadTable( filename, key, useCache = True ):
+    ''' SFTable2D or SFGraph of object 'key' in ROOT file 'filename'. The .npz cache is rebuilt if it is older than the ROOT file.
+    '''
+    filename = os.path.expandvars( filename )
+    npzFile  = cacheFileName( filename, key )
+    if useCache and os.path.exists( npzFile ) and ( not os.path.exists( filename ) or os.path.getmtime( npzFile ) >= os.path.getmtime( filename ) ):
+        with np.load( npzFile ) as d:
+            logger.debug( "Loaded %s from %s", key, npzFile )
+            table = ( SFGraph if str( d['type'] ) == 'TGraph' else SFTable2D ).fromDict( d )
+        table.source = ( filename, key )
+        return table
+
+    import ROOT
+    from StopsDilepton.tools.helpers import getObjFromFile
+    obj = getObjFromFile( filename, key )
+    assert obj, "Could not load %s from file %s." % ( key, filename )
+    table = SFTable2D.fromTH2( obj ) if obj.InheritsFrom( "TH2" ) else SFGraph.fromTGraph( obj )
+    table.source = ( filename, key )
+
+    if useCache:
+        try:
+            # written to a temporary file first, jobs running at the same time never read a partial cache
+            tmp = npzFile + '.%i.tmp.npz' % os.getpid()
+            np.savez( tmp, **table.toDict() )
+            os.rename( tmp, npzFile )
+            logger.info( "Cached %s from %s in %s", key, filename, npzFile )
+        except (IOError, OSError) as e:
+            logger.warning( "Could not write %s: %s", npzFile, e )
+    return table
@@ -1,6 +1,6 @@
-import ROOT
-from StopsDilepton.tools.helpers import getObjFromFile
+from StopsDilepton.tools.scaleFactorTable import loadTable
 import os
+import numpy as np
 
 basedir = "$CMSSW_BASE/src/StopsDilepton/tools/data/triggerEff/"
 
@@ -23,35 +23,41 @@ class triggerEfficiency:
 #            mue_trigger_SF  = basedir+'Run2018_HLT_muEle_V3_measuredInMET.root'
 #            mumu_trigger_SF = basedir+'Run2018_HLT_mm_V3_measuredInMET.root'
 
-        self.mumu_highEta   = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInMET.root"%year)),   "eff_pt1_pt2_highEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInJetHT.root"%year)),   "eff_pt1_pt2_highEta1")}
-        self.mumu_lowEta    = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInMET.root"%year)),   "eff_pt1_pt2_lowEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInJetHT.root"%year)),   "eff_pt1_pt2_lowEta1")}
-        self.ee_highEta     = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInMET.root"%year)),     "eff_pt1_pt2_highEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInJetHT.root"%year)),     "eff_pt1_pt2_highEta1")}
-        self.ee_lowEta      = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInMET.root"%year)),     "eff_pt1_pt2_lowEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInJetHT.root"%year)),     "eff_pt1_pt2_lowEta1")}
-        self.mue_highEta    = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInMET.root"%year)),    "eff_pt1_pt2_highEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInJetHT.root"%year)),    "eff_pt1_pt2_highEta1")}
-        self.mue_lowEta     = {'def':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInMET.root"%year)),    "eff_pt1_pt2_lowEta1"),
-                               'sys':getObjFromFile(os.path.expandvars(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInJetHT.root"%year)),    "eff_pt1_pt2_lowEta1")}
+        self.mumu_highEta   = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInMET.root"%year),   "eff_pt1_pt2_highEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInJetHT.root"%year),   "eff_pt1_pt2_highEta1")}
+        self.mumu_lowEta    = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInMET.root"%year),   "eff_pt1_pt2_lowEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_mm_V3_measuredInJetHT.root"%year),   "eff_pt1_pt2_lowEta1")}
+        self.ee_highEta     = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInMET.root"%year),     "eff_pt1_pt2_highEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInJetHT.root"%year),     "eff_pt1_pt2_highEta1")}
+        self.ee_lowEta      = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInMET.root"%year),     "eff_pt1_pt2_lowEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_ee_V3_measuredInJetHT.root"%year),     "eff_pt1_pt2_lowEta1")}
+        self.mue_highEta    = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInMET.root"%year),    "eff_pt1_pt2_highEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInJetHT.root"%year),    "eff_pt1_pt2_highEta1")}
+        self.mue_lowEta     = {'def':loadTable(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInMET.root"%year),    "eff_pt1_pt2_lowEta1"),
+                               'sys':loadTable(os.path.join(basedir, "Run%i_HLT_muEle_V3_measuredInJetHT.root"%year),    "eff_pt1_pt2_lowEta1")}
 
         h_ = [self.mumu_highEta, self.mumu_lowEta, self.ee_highEta, self.ee_lowEta, self.mue_highEta, self.mue_lowEta]
         assert False not in [bool(x) for x in h_], "Could not load trigger SF: %r"%h_
 
-        self.ptMax = self.mumu_highEta['def'].GetXaxis().GetXmax()
+        self.ptMax = self.mumu_highEta['def'].xMax
 
     def __getSF(self, map_, pt1, pt2):
         if pt1>self.ptMax: pt1=self.ptMax - 1 
         if pt2>self.ptMax: pt2=self.ptMax - 1 
-        val = map_['def'].GetBinContent( map_['def'].FindBin(pt1, pt2) )
-        valErr = map_['def'].GetBinError( map_['def'].FindBin(pt1, pt2) )
-        valSys = map_['sys'].GetBinContent( map_['sys'].FindBin(pt1, pt2) )
+        val, valErr = map_['def'].get(pt1, pt2)
+        valSys, _   = map_['sys'].get(pt1, pt2)
         sys  = abs( valSys - val )
         unc  = max( sys, valErr) 
         #print pt1, pt2, val, valErr, sys, unc
         return (val, unc)
 
+    def __getSFs(self, map_, pt1, pt2):
+        pt1 = np.where(pt1>self.ptMax, self.ptMax - 1, pt1)
+        pt2 = np.where(pt2>self.ptMax, self.ptMax - 1, pt2)
+        val, valErr = map_['def'].getArrays(pt1, pt2)
+        valSys, _   = map_['sys'].getArrays(pt1, pt2)
+        return val, np.maximum( np.abs( valSys - val ), valErr )
+
     def getSF(self, pt1, eta1, pdgId1, pt2, eta2, pdgId2):
 
         if pt1<pt2:
@@ -81,5 +87,30 @@ class triggerEfficiency:
             else:
                 return self.__getSF(self.mue_highEta, pt1, pt2)
         raise ValueError( "Did not find trigger SF for pt1 %3.2f eta %3.2f pdgId1 %i pt2 %3.2f eta2 %3.2f pdgId2 %i"%( pt1, eta1, pdgId1, pt2, eta2, pdgId2 ) )
-        
 
+    def getSFs(self, pt1, eta1, pdgId1, pt2, eta2, pdgId2):
+        ''' Vectorized getSF for arrays of lepton pairs. Returns arrays of SF and uncertainty.
+        '''
+        pt1, eta1, pt2 = np.asarray(pt1, dtype='float64'), np.asarray(eta1, dtype='float64'), np.asarray(pt2, dtype='float64')
+        pdgId1, pdgId2 = np.abs(np.asarray(pdgId1)), np.abs(np.asarray(pdgId2))
+
+        if (pt1<pt2).any():
+            raise ValueError ( "Sort leptons wrt pt." )
+
+        mumu   = (pdgId1==13)&(pdgId2==13)
+        ee     = (pdgId1==11)&(pdgId2==11)
+        mue    = ((pdgId1==13)&(pdgId2==11)) | ((pdgId1==11)&(pdgId2==13))
+        lowEta = np.abs(eta1)<1.5
+
+        unknown = ~(mumu|ee|mue)
+        if unknown.any():
+            i = np.nonzero(unknown)[0][0]
+            raise ValueError( "Did not find trigger SF for pt1 %3.2f eta %3.2f pdgId1 %i pt2 %3.2f eta2 %3.2f pdgId2 %i"%( pt1[i], eta1[i], pdgId1[i], pt2[i], eta2[i], pdgId2[i] ) )
+
+        val, unc = np.zeros(len(pt1)), np.zeros(len(pt1))
+        #Split in low/high eta of leading lepton (of the muon for emu)
+        for flavor, low, high in [ (mumu, self.mumu_lowEta, self.mumu_highEta), (ee, self.ee_lowEta, self.ee_highEta), (mue, self.mue_lowEta, self.mue_highEta) ]:
+            for sel, map_ in [ (flavor&lowEta, low), (flavor&~lowEta, high) ]:
+                if sel.any():
+                    val[sel], unc[sel] = self.__getSFs(map_, pt1[sel], pt2[sel])
+        return val, unc
@@ -4,6 +4,9 @@
 import pickle
 import os
 
+# numpy
+import numpy as np
+
 # Logging
 import logging
 logger = logging.getLogger(__name__)
@@ -78,3 +81,97 @@ class vetoList:
                 for event in self.events[run][lumi]:  
                     events.append( (run, lumi, event) )
         pickle.dump( events, file(filename, 'w') ) 
+
+class packedVetoList:
+    ''' Veto list as a sorted array of run<<45 | event keys with the corresponding lumis, stored as a (2, n) uint64 .npy file
+        that is memory-mapped on loading. Membership is a binary search, passesVeto accepts scalars or arrays.
+        Convert from the text/tar.gz/pkl formats with packedVetoList.fromFiles( filenames ).write( 'vetoList.npy' ).
+    '''
+    event_bits = 45
+    run_bits   = 64 - event_bits
+
+    def __init__( self, keys, lumis ):
+        ''' keys and lumis sorted by ( key, lumi ) '''
+        self.keys  = keys
+        self.lumis = lumis
+
+    @classmethod
+    def pack( cls, run, event ):
+        run, event = np.asarray( run, dtype = np.uint64 ), np.asarray( event, dtype = np.uint64 )
+        return ( run << np.uint64( cls.event_bits ) ) | event
+
+    @classmethod
+    def fromArrays( cls, run, lumi, event ):
+        run, lumi, event = np.asarray( run, dtype = np.int64 ), np.asarray( lumi, dtype = np.int64 ), np.asarray( event, dtype = np.int64 )
+        if len(run) and ( run.min() < 0 or lumi.min() < 0 or event.min() < 0 or run.max() >= 2**cls.run_bits or event.max() >= 2**cls.event_bits ):
+            raise ValueError( "Run or event number out of range for packing (run < 2**%i, event < 2**%i)." % ( cls.run_bits, cls.event_bits ) )
+        keys  = cls.pack( run, event )
+        lumis = lumi.astype( np.uint64 )
+        order = np.lexsort( ( lumis, keys ) )
+        keys, lumis = keys[order], lumis[order]
+        # remove duplicates
+        unique = np.ones( len(keys), dtype = bool )
+        unique[1:] = ( keys[1:] != keys[:-1] ) | ( lumis[1:] != lumis[:-1] )
+        return cls( keys[unique], lumis[unique] )
+
+    @classmethod
+    def fromVetoList( cls, vl ):
+        ''' Convert a vetoList '''
+        triplets = [ ( run, lumi, event ) for run in vl.events for lumi in vl.events[run] for event in vl.events[run][lumi] ]
+        if not triplets:
+            return cls.fromArrays( [], [], [] )
+        run, lumi, event = zip( *triplets )
+        return cls.fromArrays( run, lumi, event )
+
+    @classmethod
+    def fromFiles( cls, filenames ):
+        ''' Convert veto lists in the formats of vetoList (text/tar.gz/pkl) or packed .npy files '''
+        filenames = filenames if type(filenames)==type([]) else [filenames]
+        packed    = [ cls.load( f, mmap_mode = None ) for f in filenames if f.endswith( '.npy' ) ]
+        others    = [ f for f in filenames if not f.endswith( '.npy' ) ]
+        if others:
+            packed.append( cls.fromVetoList( vetoList( others ) ) )
+        return cls.merge( packed )
+
+    @classmethod
+    def merge( cls, packedVetoLists ):
+        if not packedVetoLists:
+            return cls.fromArrays( [], [], [] )
+        keys  = np.concatenate( [ p.keys  for p in packedVetoLists ] )
+        lumis = np.concatenate( [ p.lumis for p in packedVetoLists ] )
+        run   = keys >> np.uint64( cls.event_bits )
+        event = keys & np.uint64( 2**cls.event_bits - 1 )
+        return cls.fromArrays( run.astype( np.int64 ), lumis.astype( np.int64 ), event.astype( np.int64 ) )
+
+    @classmethod
+    def load( cls, filename, mmap_mode = 'r' ):
+        if not os.path.exists(filename):
+            raise ValueError( "File %s not found." % filename )
+        data = np.load( filename, mmap_mode = mmap_mode )
+        if data.ndim != 2 or data.shape[0] != 2 or data.dtype != np.uint64:
+            raise ValueError( "File %s is not a packed veto list." % filename )
+        logger.info( "Loaded %i events from %s", data.shape[1], filename )
+        return cls( data[0], data[1] )
+
+    def write( self, filename ):
+        np.save( filename, np.vstack( [ self.keys, self.lumis ] ).astype( np.uint64 ) )
+        logger.info( "Written %i events to %s", len(self), filename )
+
+    def __len__( self ):
+        return len( self.keys )
+
+    def passesVeto( self, run, lumi, event ):
+        ''' False for vetoed events. Scalars give a bool, arrays a boolean array. '''
+        scalar = np.isscalar( run )
+        keys   = np.atleast_1d( self.pack( run, event ) )
+        lumis  = np.atleast_1d( np.asarray( lumi, dtype = np.uint64 ) )
+        lumis  = np.broadcast_to( lumis, keys.shape )
+        first  = np.searchsorted( self.keys, keys, side = 'left' )
+        last   = np.searchsorted( self.keys, keys, side = 'right' )
+        vetoed = np.zeros( keys.shape, dtype = bool )
+        # usually there is at most one entry per ( run, event )
+        single = ( last - first ) == 1
+        vetoed[single] = self.lumis[ first[single] ] == lumis[single]
+        for i in np.nonzero( ( last - first ) > 1 )[0]:
+            vetoed[i] = lumis[i] in self.lumis[ first[i]:last[i] ]
+        return bool( not vetoed[0] ) if scalar else ~vetoed
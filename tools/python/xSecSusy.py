@@ -1,3 +1,5 @@
+import numpy as np
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -7,21 +9,33 @@ class xSecSusy:
         self.xSec = {
             'stop13TeV':stop13TeV
         }
+        # sorted arrays of mass, x-sec and relative uncertainty for the vectorized lookup
+        self.tables = {}
+        for channel, table in self.xSec.iteritems():
+            masses = sorted( table.keys() )
+            self.tables[channel] = ( np.array( masses, dtype = np.float64 ), np.array( [ table[m][0] for m in masses ], dtype = np.float64 ), np.array( [ table[m][1] for m in masses ], dtype = np.float64 ) )
 
     def getXSec(self, mass, sigma=0, channel='stop13TeV'):
-        from math import log, exp
-        if self.xSec[channel].has_key(mass):
-            return self.xSec[channel][mass][0]+sigma*self.xSec[channel][mass][1]*self.xSec[channel][mass][0]
-        else: #Interpolate
-            masses = self.xSec[channel].keys()
-            lower = max([x for x in masses if x < mass])
-            upper = min([x for x in masses if x > mass])
+        ''' x-sec for a mass or an array of masses, log-linear interpolation between the tabulated masses '''
+        masses, xSec, relUnc = self.tables[channel]
+        scalar = np.isscalar( mass )
+        mass   = np.atleast_1d( np.asarray( mass, dtype = np.float64 ) )
+        if len(mass) and ( mass.min() < masses[0] or mass.max() > masses[-1] ):
+            raise ValueError( "Mass outside of the x-sec table for %s (%3.2f-%3.2f)" % ( channel, masses[0], masses[-1] ) )
+
+        values = xSec + sigma*relUnc*xSec
+        upper  = np.searchsorted( masses, mass )
+        exact  = masses[ np.minimum( upper, len(masses)-1 ) ] == mass
+        res    = np.empty( len(mass) )
+        res[exact] = values[ upper[exact] ]
 
-            log_x_sec_lower = log(self.xSec[channel][lower][0]+sigma*self.xSec[channel][lower][1]*self.xSec[channel][lower][0])
-            log_x_sec_upper = log(self.xSec[channel][upper][0]+sigma*self.xSec[channel][upper][1]*self.xSec[channel][upper][0])
+        interpolate = ~exact
+        if interpolate.any():
+            upper, m = upper[interpolate], mass[interpolate]
+            lower    = upper - 1
+            log_x_sec_lower = np.log( values[lower] )
+            log_x_sec_upper = np.log( values[upper] )
+            res[interpolate] = np.exp( log_x_sec_lower + (m - masses[lower])/(masses[upper]-masses[lower])*(log_x_sec_upper - log_x_sec_lower) )
+            logger.debug( "Log-interpolated SUSY xSec for %i masses using sigma %3.2f", interpolate.sum(), sigma )
 
-            res = exp( log_x_sec_lower + (mass - lower)/float(upper-lower)*(log_x_sec_upper - log_x_sec_lower)  )
-            logger.info( "Log-interpolating SUSY xSec: mass %3.2f using sigma %3.2f m=%3.2f (%3.2f) and m=%3.2f (%3.2f). Result is %3.2f", mass, sigma, lower, exp(log_x_sec_lower), upper, exp(log_x_sec_upper), res )
-            return res
-            
-            
+        return float( res[0] ) if scalar else res
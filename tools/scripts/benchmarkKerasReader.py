@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+''' Compare the throughput of KerasReader.eval (one event per call) and KerasReader.eval_batch on toy events.
+'''
+# Standard imports
+import time
+import numpy as np
+
+def get_parser():
+    import argparse
+    argParser = argparse.ArgumentParser(description = "Argument parser for benchmarkKerasReader")
+    argParser.add_argument('--keras_directory', action='store', default='T8bbllnunu_XCha0p5_XSlep0p5_800_1-TTLep_pow/v1_small/njet2p-btag1p-relIso0.12-looseLeptonVeto-mll20-met80-metSig5-dPhiJet0-dPhiJet1/all/2018-07-24-1714', help="Model directory relative to MVA_model_directory")
+    argParser.add_argument('--classifier',      action='store', default='default_classifier', choices=['default_classifier', 'default_classifier_lep_pt', 'default_classifier_lep_pt_nobtag'], help="Which training variables?")
+    argParser.add_argument('--nEvents',         action='store', type=int, default=10000, help="Number of toy events")
+    argParser.add_argument('--batchSizes',      action='store', type=int, nargs='*', default=[32, 256, 1024, 8192], help="Batch sizes for eval_batch")
+    argParser.add_argument('--logLevel',        action='store', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], default='INFO', help="Log level for logging" )
+    return argParser
+
+args = get_parser().parse_args()
+
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None )
+
+import importlib
+training_variables_list = importlib.import_module( 'StopsDilepton.MVA.%s' % args.classifier ).training_variables_list
+
+from StopsDilepton.MVA.KerasReader import KerasReader
+kerasReader = KerasReader( args.keras_directory, training_variables_list )
+
+# toy events distributed according to the transformation of the training
+rng    = np.random.RandomState( 1 )
+X      = kerasReader.mean + kerasReader.std*rng.normal( size = ( args.nEvents, len(training_variables_list) ) )
+events = [ dict( zip( training_variables_list, x ) ) for x in X.tolist() ]
+
+start  = time.time()
+ref    = np.array( [ kerasReader.eval( event ) for event in events ] )
+tRef   = time.time() - start
+logger.info( "eval:                          %8.0f events/s", args.nEvents/tRef )
+
+for batch_size in args.batchSizes:
+    start = time.time()
+    res   = kerasReader.eval_batch( events, batch_size = batch_size )
+    t     = time.time() - start
+    logger.info( "eval_batch (batch size %5i): %8.0f events/s (x%6.1f), max. diff. %g", batch_size, args.nEvents/t, tRef/t, np.max( np.abs( res - ref ) ) )
+
+start = time.time()
+res   = kerasReader.eval_batch( X, batch_size = max( args.batchSizes ) )
+t     = time.time() - start
+logger.info( "eval_batch (array input):      %8.0f events/s (x%6.1f), max. diff. %g", args.nEvents/t, tRef/t, np.max( np.abs( res - ref ) ) )
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+''' Compare the batch interface of MT2Calculator with the per-event interface on toy events
+    with realistic kinematic distributions (timing and maximum difference).
+'''
+# Standard imports
+import time
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.mt2Calculator import mt2Calculator
+
+def get_parser():
+    import argparse
+    argParser = argparse.ArgumentParser(description = "Argument parser for benchmarkMT2")
+    argParser.add_argument('--nEvents',  action='store', type=int, default=100000, help="Number of toy events")
+    argParser.add_argument('--seed',     action='store', type=int, default=1,      help="Random seed")
+    argParser.add_argument('--logLevel', action='store', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], default='INFO', help="Log level for logging" )
+    return argParser
+
+args = get_parser().parse_args()
+
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None )
+
+rng = np.random.RandomState( args.seed )
+n   = args.nEvents
+
+def toyObject( ptMin, ptSlope, etaWidth ):
+    return ptMin + rng.exponential( ptSlope, n ), np.clip( rng.normal( 0, etaWidth, n ), -2.4, 2.4 ), rng.uniform( -np.pi, np.pi, n )
+
+# leading/trailing leptons, b jets and MET roughly as in ttbar dilepton events
+l1 = toyObject( 30, 40, 1.1 )
+l2 = toyObject( 20, 25, 1.1 )
+b1 = toyObject( 30, 60, 1.0 )
+b2 = toyObject( 30, 35, 1.0 )
+met_pt, met_phi = 80 + rng.exponential( 60, n ), rng.uniform( -np.pi, np.pi, n )
+
+def perEvent( variable ):
+    res = np.empty( n )
+    for i in xrange( n ):
+        mt2Calculator.reset()
+        mt2Calculator.setMet( met_pt[i], met_phi[i] )
+        mt2Calculator.setLeptons( l1[0][i], l1[1][i], l1[2][i], l2[0][i], l2[1][i], l2[2][i] )
+        mt2Calculator.setBJets( b1[0][i], b1[1][i], b1[2][i], b2[0][i], b2[1][i], b2[2][i] )
+        res[i] = getattr( mt2Calculator, variable )()
+    return res
+
+def batch( variable ):
+    args_ = [ met_pt, met_phi ] + list(l1) + list(l2)
+    if variable != 'mt2ll':
+        args_ += list(b1) + list(b2)
+    return getattr( mt2Calculator, variable+'_batch' )( *args_ )
+
+for variable in [ 'mt2ll', 'mt2bb', 'mt2blbl' ]:
+    start = time.time()
+    ref   = perEvent( variable )
+    tRef  = time.time() - start
+    start = time.time()
+    cand  = batch( variable )
+    tCand = time.time() - start
+    logger.info( "%8s: per-event %6.2fs (%8.0f ev/s), batch %6.3fs (%10.0f ev/s), speed-up %5.1f, max. abs. difference %g",
+                 variable, tRef, n/tRef, tCand, n/tCand, tRef/tCand, np.max( np.abs( ref - cand ) ) )
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+''' Compare the numpy scale factor tables with the PyROOT TH2 lookups (values and timing).
+'''
+# Standard imports
+import time
+import ROOT
+import numpy as np
+
+# StopsDilepton
+from StopsDilepton.tools.helpers            import getObjFromFile
+from StopsDilepton.tools.scaleFactorTable   import SFTable2D
+from StopsDilepton.tools.leptonSF           import leptonSF
+from StopsDilepton.tools.leptonHit0SF       import leptonHit0SF
+from StopsDilepton.tools.leptonSip3dSF      import leptonSip3dSF
+from StopsDilepton.tools.triggerEfficiency  import triggerEfficiency
+
+def get_parser():
+    import argparse
+    argParser = argparse.ArgumentParser(description = "Argument parser for benchmarkScaleFactors")
+    argParser.add_argument('--year',     action='store', type=int, default=2016,   help="Which year?")
+    argParser.add_argument('--nLeptons', action='store', type=int, default=100000, help="Number of toy leptons")
+    argParser.add_argument('--logLevel', action='store', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], default='INFO', help="Log level for logging" )
+    return argParser
+
+args = get_parser().parse_args()
+
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None )
+
+rng = np.random.RandomState( 1 )
+n   = args.nLeptons
+
+def timed( f ):
+    start = time.time()
+    res   = f()
+    return res, time.time() - start
+
+# Bin lookups of every map: PyROOT vs. table (scalar and vectorized), including under- and overflow
+tables = []
+for sf in [ leptonSF( args.year ), leptonHit0SF( args.year ), leptonSip3dSF( args.year ) ]:
+    tables += sf.mu + sf.ele
+trigger = triggerEfficiency( args.year )
+for map_ in [ trigger.mumu_highEta, trigger.mumu_lowEta, trigger.ee_highEta, trigger.ee_lowEta, trigger.mue_highEta, trigger.mue_lowEta ]:
+    tables += [ map_['def'], map_['sys'] ]
+
+for table in tables:
+    if not isinstance( table, SFTable2D ): continue
+    h = getObjFromFile( *table.source )
+    xw, yw = table.xMax - table.xMin, table.yMax - table.yMin
+    x = rng.uniform( table.xMin - 0.1*xw, table.xMax + 0.1*xw, n )
+    y = rng.uniform( table.yMin - 0.1*yw, table.yMax + 0.1*yw, n )
+
+    def pyroot():
+        res = np.empty( (2, n) )
+        for i in xrange( n ):
+            bx, by = h.GetXaxis().FindBin( x[i] ), h.GetYaxis().FindBin( y[i] )
+            res[0][i], res[1][i] = h.GetBinContent( bx, by ), h.GetBinError( bx, by )
+        return res
+    def scalar():
+        res = np.empty( (2, n) )
+        for i in xrange( n ):
+            res[0][i], res[1][i] = table.get( x[i], y[i] )
+        return res
+
+    ref, tRef       = timed( pyroot )
+    sca, tScalar    = timed( scalar )
+    vec, tVector    = timed( lambda: np.array( table.getArrays( x, y ) ) )
+    logger.info( "%-40s %-45s PyROOT %6.3fs scalar %6.3fs (x%5.1f) vectorized %6.4fs (x%7.1f) max. diff. %g/%g",
+                 table.source[0].split('/')[-1], table.source[1][:45], tRef, tScalar, tRef/tScalar, tVector, tRef/tVector,
+                 np.max( np.abs( ref - sca ) ), np.max( np.abs( ref - vec ) ) )
+
+# Full lepton SF per lepton: scalar getSF vs. vectorized getSFs
+sf     = leptonSF( args.year )
+pdgId  = rng.choice( [11, -11, 13, -13], n )
+pt     = 20 + rng.exponential( 40, n )
+eta    = rng.uniform( -2.5, 2.5, n )
+
+scalar, tScalar = timed( lambda: np.array( [ sf.getSF( pdgId[i], pt[i], eta[i] ) for i in xrange( n ) ] ).T )
+vector, tVector = timed( lambda: np.array( sf.getSFs( pdgId, pt, eta ) ) )
+logger.info( "leptonSF.getSF %6.3fs, leptonSF.getSFs %6.4fs (x%7.1f), max. diff. %g", tScalar, tVector, tScalar/tVector, np.max( np.abs( scalar - vector ) ) )
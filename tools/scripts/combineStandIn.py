@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+''' Stand-in for combine, for testing the combine driver without a combine installation:
+    COMBINE_EXECUTABLE=$CMSSW_BASE/src/StopsDilepton/tools/scripts/combineStandIn.py python run_limit.py ...
+    Writes a limit tree (AsymptoticLimits, Significance) or an empty fitDiagnostics.root (FitDiagnostics) to the working directory.
+    The environment variables COMBINE_STANDIN_SLEEP (seconds) and COMBINE_STANDIN_RETURNCODE simulate slow and failing fits.
+'''
+
+# Standard imports
+import os
+import sys
+import time
+import argparse
+import ROOT
+
+argParser = argparse.ArgumentParser(description = "Argument parser")
+argParser.add_argument('-M', '--method', action='store', required=True, help="Fit method")
+argParser.add_argument('-n', '--name',   action='store', default='Test', help="Name in the output file")
+argParser.add_argument('-m', '--mass',   action='store', default='120',  help="Mass in the output file")
+argParser.add_argument('card',           action='store', help="Datacard")
+args, unknown = argParser.parse_known_args()
+
+print "combineStandIn: -M %s %s (ignored options: %s)" % ( args.method, args.card, " ".join( unknown ) )
+
+if not os.path.exists( args.card ):
+    print "Datacard %s not found" % args.card
+    sys.exit(1)
+
+time.sleep( float( os.environ.get( 'COMBINE_STANDIN_SLEEP', 0 ) ) )
+returncode = int( os.environ.get( 'COMBINE_STANDIN_RETURNCODE', 0 ) )
+if returncode != 0:
+    sys.exit( returncode )
+
+if args.method == 'FitDiagnostics':
+    f = ROOT.TFile( 'fitDiagnostics.root', 'recreate' )
+    f.Close()
+    sys.exit(0)
+
+if   args.method == 'AsymptoticLimits': results = [ (0.025, 0.4), (0.160, 0.6), (0.500, 1.0), (0.840, 1.5), (0.975, 2.2), (-1, 1.1) ]
+elif args.method == 'Significance':     results = [ (-1, 0.5) ]
+else:
+    print "Method %s not supported" % args.method
+    sys.exit(1)
+
+from array import array
+limit            = array( 'd', [0] )
+quantileExpected = array( 'f', [0] )
+f = ROOT.TFile( 'higgsCombine%s.%s.mH%s.root' % ( args.name, args.method, args.mass ), 'recreate' )
+t = ROOT.TTree( 'limit', 'limit' )
+t.Branch( 'limit',            limit,            'limit/D' )
+t.Branch( 'quantileExpected', quantileExpected, 'quantileExpected/F' )
+for q, l in results:
+    quantileExpected[0], limit[0] = q, l
+    t.Fill()
+t.Write()
+f.Close()
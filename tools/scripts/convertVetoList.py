@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+''' Convert veto lists (text/tar.gz/pkl) into a packed, memory-mappable .npy file (see StopsDilepton.tools.vetoList.packedVetoList)
+'''
+
+# Standard imports
+import os
+
+# StopsDilepton
+from StopsDilepton.tools.vetoList import packedVetoList
+
+# Arguments
+import argparse
+argParser = argparse.ArgumentParser(description = "Argument parser")
+argParser.add_argument('--logLevel',  action='store', default='INFO', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], help="Log level for logging")
+argParser.add_argument('--input',     action='store', nargs='+', required=True, help="Veto list files or directories (all .pkl files)")
+argParser.add_argument('--output',    action='store', required=True, help="Output .npy file")
+args = argParser.parse_args()
+
+# Logger
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None)
+
+filenames = []
+for f in args.input:
+    if os.path.isdir( f ):
+        filenames += [ os.path.join( f, filename ) for filename in os.listdir( f ) if filename.endswith( '.pkl' ) ]
+    else:
+        filenames.append( f )
+
+packed = packedVetoList.fromFiles( filenames )
+packed.write( args.output )
+logger.info( "Converted %i files with %i events into %s", len(filenames), len(packed), args.output )
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+''' Merge the shards written by resultsDB(..., shard = True) into the sqlite database. Run when no job is writing anymore.
+'''
+# Standard imports
+import os
+
+# StopsDilepton
+from StopsDilepton.tools.resultsDB import resultsDB, shardDirectory, shardSuffix, readShard
+
+def get_parser():
+    import argparse
+    argParser = argparse.ArgumentParser(description = "Argument parser for mergeResultsDB")
+    argParser.add_argument('--database', action='store', type=str, required=True, help="sqlite database file")
+    argParser.add_argument('--logLevel', action='store', nargs='?', choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'TRACE', 'NOTSET'], default='INFO', help="Log level for logging" )
+    return argParser
+
+args = get_parser().parse_args()
+
+import StopsDilepton.tools.logger as logger
+logger = logger.get_logger(args.logLevel, logFile = None )
+
+directory = shardDirectory( args.database )
+if not os.path.isdir( directory ):
+    logger.info( "No shards found for %s", args.database )
+    raise SystemExit(0)
+
+# table name and columns are stored in the header of every shard
+tables = {}
+for f in sorted( os.listdir( directory ) ):
+    if not f.endswith( shardSuffix ): continue
+    header, records, offset = readShard( os.path.join( directory, f ) )
+    if header is None:
+        logger.warning( "Shard %s has no header, skipping.", f )
+        continue
+    tables[header['tableName']] = header['columns']
+
+for tableName, columns in sorted( tables.iteritems() ):
+    resultsDB( args.database, tableName, columns ).merge()
+
+if not os.listdir( directory ):
+    os.rmdir( directory )
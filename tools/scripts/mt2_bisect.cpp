@@ -32,6 +32,7 @@
               
 #include <iostream>
 #include <math.h>
+#include <cmath>
 #include "mt2_bisect.h"
 
 //ClassImp(mt2);
@@ -667,3 +668,30 @@ inline int mt2::signchange_p( long double t1, long double t2, long double t3, lo
 }
 
 //}//end namespace mt2_bisect
+
+/*******************************************************************************
+  Batch interface: mt2 of n events with massless visible particles.
+  pax, pay, pbx, pby, pmissx, pmissy and result are arrays of length n,
+  events with a NaN input get NaN as result.
+*******************************************************************************/
+void mt2_batch(int n, double mn, const double* pax, const double* pay, const double* pbx, const double* pby, const double* pmissx, const double* pmissy, double* result)
+{
+   mt2 mt2_event;
+   double pa[3]    = {0., 0., 0.};
+   double pb[3]    = {0., 0., 0.};
+   double pmiss[3] = {0., 0., 0.};
+   for (int i = 0; i < n; i++)
+   {
+      if ( std::isnan(pax[i]) || std::isnan(pay[i]) || std::isnan(pbx[i]) || std::isnan(pby[i]) || std::isnan(pmissx[i]) || std::isnan(pmissy[i]) )
+      {
+         result[i] = NAN;
+         continue;
+      }
+      pa[1]    = pax[i];    pa[2]    = pay[i];
+      pb[1]    = pbx[i];    pb[2]    = pby[i];
+      pmiss[1] = pmissx[i]; pmiss[2] = pmissy[i];
+      mt2_event.set_mn(mn);
+      mt2_event.set_momenta(pa, pb, pmiss);
+      result[i] = mt2_event.get_mt2();
+   }
+}
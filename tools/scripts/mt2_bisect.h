@@ -59,4 +59,6 @@ class mt2
 
 //}//end namespace mt2_bisect
 
+void mt2_batch(int n, double mn, const double* pax, const double* pay, const double* pbx, const double* pby, const double* pmissx, const double* pmissy, double* result);
+
 #endif